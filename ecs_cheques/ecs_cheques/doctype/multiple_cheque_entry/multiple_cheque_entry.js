@@ -4,56 +4,76 @@
 // Utility: parse float safely
 function flt(val) { return parseFloat(val) || 0; }
 
-// Helper function to get exchange rate
+// Exchange rates are resolved server-side in batches and cached per page.
+// Keyed by "from::to::date"; each value is a Promise of the rate (or null).
+var exchange_rate_cache = {};
+var exchange_rate_queue = null;
+
+// Helper function to get exchange rate. Lookups made in the same tick (e.g.
+// while looping over the cheque rows) are answered by a single request.
 function get_exchange_rate(from_currency, to_currency, date) {
-    return new Promise((resolve) => {
-        if (from_currency === to_currency) {
-            resolve(1);
-            return;
-        }
-        
-        frappe.call({
-            method: "frappe.client.get_list",
-            args: {
-                doctype: "Currency Exchange",
-                filters: {
-                    from_currency: from_currency,
-                    to_currency: to_currency,
-                    date: ["<=", date]
-                },
-                fields: ["exchange_rate"],
-                order_by: "date desc",
-                limit_page_length: 1
-            },
-            callback: function(r) {
-                if (r.message && r.message.length > 0) {
-                    resolve(r.message[0].exchange_rate);
-                } else {
-                    // Try reverse
-                    frappe.call({
-                        method: "frappe.client.get_list",
-                        args: {
-                            doctype: "Currency Exchange",
-                            filters: {
-                                from_currency: to_currency,
-                                to_currency: from_currency,
-                                date: ["<=", date]
-                            },
-                            fields: ["exchange_rate"],
-                            order_by: "date desc",
-                            limit_page_length: 1
-                        },
-                        callback: function(r2) {
-                            if (r2.message && r2.message.length > 0) {
-                                resolve(1 / r2.message[0].exchange_rate);
-                            } else {
-                                resolve(null);
-                            }
-                        }
-                    });
-                }
+    if (from_currency === to_currency) {
+        return Promise.resolve(1);
+    }
+
+    const key = [from_currency, to_currency, date].join("::");
+    if (!exchange_rate_cache[key]) {
+        exchange_rate_cache[key] = new Promise((resolve) => {
+            if (!exchange_rate_queue) {
+                exchange_rate_queue = {};
+                setTimeout(flush_exchange_rate_queue, 0);
+            }
+            exchange_rate_queue[key] = { pair: [from_currency, to_currency, date], resolve: resolve };
+        });
+    }
+    return exchange_rate_cache[key];
+}
+
+function flush_exchange_rate_queue() {
+    const queue = exchange_rate_queue;
+    exchange_rate_queue = null;
+
+    const resolve_all = (rates) => {
+        Object.keys(queue).forEach(key => {
+            const rate = rates[key] || null;
+            // Don't remember misses: the rate may be added while the form is open.
+            if (!rate) {
+                delete exchange_rate_cache[key];
             }
+            queue[key].resolve(rate);
         });
+    };
+
+    frappe.call({
+        method: "ecs_cheques.ecs_cheques.overrides.currency_exchange.currency_exchange.get_exchange_rates",
+        args: { pairs: Object.values(queue).map(item => item.pair) },
+        callback: function(r) {
+            const rates = {};
+            (r.message || []).forEach(res => {
+                rates[[res.from_currency, res.to_currency, res.date].join("::")] = res.exchange_rate;
+            });
+            resolve_all(rates);
+        },
+        error: function() {
+            resolve_all({});
+        }
+    });
+}
+
+// Warm the cache with every currency pair of the cheque table in one request
+function prefetch_exchange_rates(frm) {
+    const isPay = frm.doc.payment_type === "Pay";
+    const table = (isPay ? frm.doc.cheque_table_2 : frm.doc.cheque_table) || [];
+    const posting_date = frm.doc.posting_date || frappe.datetime.nowdate();
+
+    table.forEach(row => {
+        if (row.account_currency && row.account_currency_from) {
+            if (isPay) {
+                get_exchange_rate(row.account_currency_from, row.account_currency, posting_date);
+            } else {
+                get_exchange_rate(row.account_currency, row.account_currency_from, posting_date);
+            }
+        }
     });
 }
 frappe.ui.form.on("Multiple Cheque Entry", {
@@ -232,6 +252,17 @@ frappe.ui.form.on("Multiple Cheque Entry", {
         frappe.after_ajax(function() {
             add_excel_buttons(frm);
         });
+
+        if (frm.doc.docstatus === 0) {
+            prefetch_exchange_rates(frm);
+        }
+
+        // Dry-run the Payment Entries of a saved draft before submitting
+        if (frm.doc.docstatus === 0 && !frm.is_new()) {
+            frm.add_custom_button(__("Preview Payment Entries"), function() {
+                preview_payment_entries(frm);
+            });
+        }
     }
 });
 // Field Change Handlers
@@ -716,21 +747,30 @@ function add_excel_buttons(frm) {
         </button>`);
 
         $upload_btn.on("click", function() {
-            const input = document.createElement("input");
-            input.type = "file";
-            input.accept = ".xlsx";
-            input.onchange = function() {
-                const file = input.files[0];
-                if (!file) return;
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    const base64 = e.target.result.split(",")[1];
+            // Upload as a File so that the server reads it from disk instead of
+            // receiving the whole file as a base64 request argument.
+            new frappe.ui.FileUploader({
+                doctype: frm.is_new() ? null : frm.doctype,
+                docname: frm.is_new() ? null : frm.docname,
+                folder: "Home/Attachments",
+                allow_multiple: false,
+                restrictions: { allowed_file_types: [".xlsx", ".csv", ".tsv", ".txt"] },
+                on_success: function(file_doc) {
+                    if (!frm.is_new() && frm.doc.docstatus === 0) {
+                        append_uploaded_cheques(frm, file_doc.name);
+                        return;
+                    }
+                    // Unsaved form: fill the rows in on the client.
                     frappe.call({
                         method: "ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry.upload_cheques_excel",
-                        args: { file_data: base64, payment_type: payment_type },
+                        args: { file: file_doc.name, payment_type: payment_type },
+                        freeze: true,
+                        freeze_message: __("Reading cheques..."),
                         callback: function(r) {
-                            if (r.message && r.message.length) {
-                                r.message.forEach(function(row_data) {
+                            if (!r.message) return;
+                            const rows = r.message.rows;
+                            if (rows.length) {
+                                rows.forEach(function(row_data) {
                                     const child_doctype = isPay ? "Cheque Table Pay" : "Cheque Table Receive";
                                     const new_row = frappe.model.add_child(frm.doc, child_doctype, table_field);
                                     Object.keys(row_data).forEach(function(key) {
@@ -740,70 +780,259 @@ function add_excel_buttons(frm) {
                                     });
                                 });
                                 frm.refresh_field(table_field);
-                                frappe.msgprint(__("تم رفع {0} شيك بنجاح", [r.message.length]));
+                                frappe.show_alert({
+                                    message: __("تم رفع {0} شيك بنجاح", [rows.length]),
+                                    indicator: "green"
+                                });
                             }
+                            show_rejected_cheques(r.message);
                         }
                     });
-                };
-                reader.readAsDataURL(file);
-            };
-            input.click();
+                }
+            });
+        });
+
+        // Export the saved cheque table in the template layout
+        const $export_btn = $(`<button id="btn-export-excel-${table_field}" class="btn btn-xs btn-default" style="margin-left:5px;">
+            <i class="fa fa-file-excel-o"></i> ${__("Export Excel")}
+        </button>`);
+
+        $export_btn.on("click", function() {
+            window.location.href = frappe.urllib.get_full_url(
+                "/api/method/ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry.export_cheques_excel"
+                + "?docname=" + encodeURIComponent(frm.doc.name)
+            );
         });
 
         if ($btn_group.length) {
             $btn_group.append($download_btn).append($upload_btn);
+            if (!frm.is_new()) {
+                $btn_group.append($export_btn);
+            }
+        }
+    }
+}
+// Append an uploaded file's cheques to the saved draft on the server. The rows
+// arrive fully filled in, so none of the per-field triggers have to run.
+function append_uploaded_cheques(frm, file_name) {
+    const run = () => frappe.call({
+        method: "ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry.append_uploaded_cheques",
+        args: { docname: frm.doc.name, file: file_name },
+        freeze: true,
+        freeze_message: __("Importing cheques..."),
+        callback: function(r) {
+            if (!r.message) return;
+            if (r.message.reload) {
+                frm.reload_doc();
+                frappe.show_alert({
+                    message: __("تم رفع {0} شيك بنجاح", [r.message.appended]),
+                    indicator: "green"
+                });
+            }
+            show_rejected_cheques(r.message);
         }
+    });
+
+    // The server saves the document, so save pending edits first.
+    if (frm.is_dirty()) {
+        frm.save().then(run);
+    } else {
+        run();
     }
 }
+// Summarise the rows an upload rejected, with a link to the workbook of
+// those rows so they can be fixed and uploaded again.
+function show_rejected_cheques(summary) {
+    if (!summary.rejected) return;
+
+    let message = `<p>${__("{0} of {1} rows were rejected.", [summary.rejected, summary.total])}</p>`;
+    message += `<ul>${summary.errors.map(error => `<li>${frappe.utils.escape_html(error)}</li>`).join("")}</ul>`;
+    if (summary.error_file) {
+        message += `<p><a href="${encodeURI(summary.error_file)}" target="_blank">${__("Download the rejected rows")}</a></p>`;
+    }
+
+    frappe.msgprint({
+        title: __("Rejected Cheques"),
+        indicator: "orange",
+        message: message
+    });
+}
 // Unified Submit Handler
 frappe.ui.form.on("Multiple Cheque Entry", "on_submit", function(frm) {
     const isPay = frm.doc.payment_type === "Pay";
     const table = isPay ? frm.doc.cheque_table_2 : frm.doc.cheque_table;
 
     if (!table || !table.length) return;
+    if (!table.some(row => !row.payment_entry)) return; // all rows already processed
+
+    // One request for the whole batch; the server fetches every row from the DB,
+    // eliminating reliance on potentially stale client-side row values.
+    frappe.call({
+        method: "ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry.create_payment_entries",
+        args: { docname: frm.doc.name },
+        freeze: true,
+        freeze_message: __("Creating Payment Entries..."),
+        callback: function(r) {
+            const res = r.message || {};
+            if (res.queued) {
+                // Large batch: rows are created in the background; progress and
+                // payment_entry links arrive through the realtime listener.
+                frm._payment_entry_results = [];
+                frappe.show_progress(__("Creating Payment Entries"), 0, res.total,
+                    __("Processing in background..."));
+                return;
+            }
+            show_payment_entry_results(res.results || []);
+            frm.reload_doc();
+        }
+    });
+});
 
-    const promises = [];
-    const created_entries = [];
+// Background creation progress (see create_payment_entries / _create_payment_entries_job)
+frappe.ui.form.on("Multiple Cheque Entry", "onload", function(frm) {
+    if (frm._payment_entry_progress_bound) return;
+    frm._payment_entry_progress_bound = true;
 
-    table.forEach((row) => {
-        if (row.payment_entry) return; // already processed
+    frappe.realtime.on("cheque_payment_entry_progress", function(data) {
+        if (!data || data.docname !== frm.doc.name) return;
 
-        // Pass only docname and row_id; the server fetches all data from the DB,
-        // eliminating reliance on potentially stale client-side row values.
-        promises.push(new Promise((resolve) => {
-            frappe.call({
-                method: "ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry.create_payment_entry_from_cheque",
-                args: { docname: frm.doc.name, row_id: row.name },
-                callback: function(r) {
-                    if (r.message) {
-                        created_entries.push(r.message);
-                    }
-                    resolve();
-                },
-                error: function() { resolve(); }
-            });
-        }));
+        const table_field = frm.doc.payment_type === "Pay" ? "cheque_table_2" : "cheque_table";
+        const child_doctype = frm.doc.payment_type === "Pay" ? "Cheque Table Pay" : "Cheque Table Receive";
+        frm._payment_entry_results = (frm._payment_entry_results || []).concat(data.results || []);
+
+        // Pick up the links of the chunk that has just been committed.
+        (data.results || []).forEach(res => {
+            const row = locals[child_doctype] && locals[child_doctype][res.row_id];
+            if (row && res.payment_entry) {
+                row.payment_entry = res.payment_entry;
+            }
+        });
+        frm.refresh_field(table_field);
+
+        frappe.show_progress(__("Creating Payment Entries"), data.progress, data.total,
+            __("{0} of {1} cheques processed", [data.progress, data.total]));
+
+        if (data.done) {
+            frappe.hide_progress();
+            show_payment_entry_results(frm._payment_entry_results);
+            frm._payment_entry_results = [];
+            frm.reload_doc();
+        }
     });
+});
 
-    if (promises.length > 0) {
-        Promise.all(promises).then(() => {
-            if (created_entries.length > 0) {
-                const links = created_entries.map(name =>
-                    `<a href="/app/payment-entry/${name}" target="_blank">${name}</a>`
+// Cancel through the server so that large batches cancel their Payment Entries
+// in a background job; the document itself is cancelled once they are all done.
+frappe.ui.form.on("Multiple Cheque Entry", "before_cancel", function(frm) {
+    frappe.validated = false;
+    frappe.call({
+        method: "ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry.cancel_multiple_cheque_entry",
+        args: { docname: frm.doc.name },
+        freeze: true,
+        freeze_message: __("Cancelling..."),
+        callback: function(r) {
+            const res = r.message || {};
+            if (res.queued) {
+                frm._cancel_errors = [];
+                frappe.show_progress(__("Cancelling Payment Entries"), 0, res.total,
+                    __("Processing in background..."));
+                return;
+            }
+            frm.reload_doc();
+        }
+    });
+});
+
+// Background cancellation progress (see cancel_multiple_cheque_entry)
+frappe.ui.form.on("Multiple Cheque Entry", "onload", function(frm) {
+    if (frm._cancel_progress_bound) return;
+    frm._cancel_progress_bound = true;
+
+    frappe.realtime.on("cheque_payment_entry_cancel_progress", function(data) {
+        if (!data || data.docname !== frm.doc.name) return;
+
+        frm._cancel_errors = (frm._cancel_errors || []).concat(
+            (data.results || []).filter(res => res.error)
+        );
+        frappe.show_progress(__("Cancelling Payment Entries"), data.progress, data.total,
+            __("{0} of {1} Payment Entries processed", [data.progress, data.total]));
+
+        if (data.done) {
+            frappe.hide_progress();
+            if (!data.cancelled) {
+                const errors = frm._cancel_errors.map(res =>
+                    __("{0}: {1}", [res.payment_entry, res.error])
                 ).join("<br>");
                 frappe.msgprint({
-                    title: __("Payment Entries Created"),
-                    indicator: "green",
-                    message: __(
-                        "تم إنشاء {0} قيد دفع من Multiple Cheque Entry:<br>{1}",
-                        [created_entries.length, links]
-                    )
+                    title: __("Cancellation Incomplete"),
+                    indicator: "red",
+                    message: __("The document was not cancelled because some Payment Entries failed:<br>{0}", [errors])
                 });
             }
+            frm._cancel_errors = [];
             frm.reload_doc();
-        });
-    }
+        }
+    });
 });
+
+// Summarise the per-row results returned by create_payment_entries
+function show_payment_entry_results(results) {
+    const created = results.filter(res => res.payment_entry);
+    const failed = results.filter(res => res.error);
+    if (!created.length && !failed.length) return;
+
+    let message = "";
+    if (created.length) {
+        const links = created.map(res =>
+            `<a href="/app/payment-entry/${res.payment_entry}" target="_blank">${res.payment_entry}</a>`
+        ).join("<br>");
+        message += __("تم إنشاء {0} قيد دفع من Multiple Cheque Entry:<br>{1}", [created.length, links]);
+    }
+    if (failed.length) {
+        const errors = failed.map(res => __("Row {0}: {1}", [res.idx, res.error])).join("<br>");
+        message += (message ? "<br><br>" : "") + __("Failed rows ({0}):<br>{1}", [failed.length, errors]);
+    }
+    frappe.msgprint({
+        title: __("Payment Entries Created"),
+        indicator: failed.length ? "orange" : "green",
+        message: message
+    });
+}
+// Validate all rows server-side and show the errors and totals in one dialog
+function preview_payment_entries(frm) {
+    const run = () => frappe.call({
+        method: "ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry.preview_payment_entries",
+        args: { docname: frm.doc.name },
+        freeze: true,
+        freeze_message: __("Validating cheques..."),
+        callback: function(r) {
+            const res = r.message || {};
+            const totals = Object.keys(res.totals || {}).map(currency =>
+                `${currency}: ${format_currency(res.totals[currency], currency)}`
+            ).join("<br>");
+
+            let message = __("{0} cheques checked.", [(res.rows || []).length]);
+            if (totals) {
+                message += "<br><br>" + __("Totals:") + "<br>" + totals;
+            }
+            if ((res.errors || []).length) {
+                message += "<br><br>" + __("Errors ({0}):", [res.errors.length]) + "<br>" + res.errors.join("<br>");
+            }
+            frappe.msgprint({
+                title: __("Payment Entry Preview"),
+                indicator: res.valid ? "green" : "red",
+                message: message
+            });
+        }
+    });
+
+    // The server validates the saved rows, so save pending edits first.
+    if (frm.is_dirty()) {
+        frm.save().then(run);
+    } else {
+        run();
+    }
+}
 // Child Table Auto-fill Handlers
 frappe.ui.form.on("Cheque Table Pay", "first_beneficiary", function(frm, cdt, cdn) {
     const row = locals[cdt][cdn];
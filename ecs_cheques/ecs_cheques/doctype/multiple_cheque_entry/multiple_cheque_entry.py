@@ -1,11 +1,30 @@
 # Copyright (c) 2021, erpcloud.systems and contributors
 # For license information, please see license.txt
 
+import codecs
+import datetime
 import frappe
 import io
+import math
+import re
 from frappe.model.document import Document
 from frappe import _
-from frappe.utils import flt, nowdate
+from frappe.utils import cint, flt, nowdate
+from ecs_cheques.ecs_cheques.overrides.account.account import get_account_currencies, get_account_currency
+from ecs_cheques.ecs_cheques.overrides.company.company import get_company_cheque_settings
+from ecs_cheques.ecs_cheques.overrides.journal_entry.journal_entry import get_cheque_reversals, reverse_cheque_lines
+
+
+# Submissions with more unlinked rows than this create their Payment Entries
+# in a background job.  Override per site with
+# ``ecs_cheques_background_threshold`` in site_config.json.
+BACKGROUND_ROW_THRESHOLD = 50
+
+# Rows created and committed together by the background job.
+BACKGROUND_CHUNK_SIZE = 25
+
+PAYMENT_ENTRY_PROGRESS_EVENT = "cheque_payment_entry_progress"
+PAYMENT_ENTRY_CANCEL_PROGRESS_EVENT = "cheque_payment_entry_cancel_progress"
 
 
 # ---------------------------------------------------------------------------
@@ -15,9 +34,14 @@ from frappe.utils import flt, nowdate
 def _get_account_currency_db(account_name, company_currency):
 	"""Return the account's currency from the Account master, falling back to
 	*company_currency* if the account is blank or not found."""
-	if not account_name:
-		return company_currency
-	return frappe.db.get_value("Account", account_name, "account_currency") or company_currency
+	return get_account_currency(account_name) or company_currency
+
+
+def _get_account_currency_map(account_names):
+	"""Return ``{account: account_currency}`` for *account_names*, reading
+	uncached accounts with a single ``IN`` query.  Blank names are ignored;
+	unknown accounts are absent."""
+	return get_account_currencies(account_names)
 
 
 def _compute_payment_entry_amounts(
@@ -114,6 +138,169 @@ def _compute_payment_entry_amounts(
 	)
 
 
+def _compute_payment_entry_amounts_batch(
+	row_paid_amounts,
+	paid_from_currencies,
+	paid_to_currencies,
+	company_currency,
+	stored_exchange_rates,
+	payment_types,
+):
+	"""Columnar version of :func:`_compute_payment_entry_amounts`.
+
+	Takes parallel sequences (one item per cheque) and returns a dict of four
+	lists: ``paid_amount``, ``received_amount``, ``source_exchange_rate`` and
+	``target_exchange_rate``.  *company_currency* may be a single currency or
+	a sequence when the rows span companies.
+
+	The scalar function is the reference implementation and the results are
+	identical to calling it row by row.  When NumPy is installed the branch
+	selection and base-amount arithmetic run vectorised; the 9-digit rounding
+	is still done with ``flt`` on the affected elements so that it matches
+	Frappe's rounding exactly.
+	"""
+	n = len(row_paid_amounts)
+	if isinstance(company_currency, str):
+		company_currency = [company_currency] * n
+
+	try:
+		import numpy as np
+	except ImportError:
+		np = None
+
+	if np is None:
+		results = [
+			_compute_payment_entry_amounts(*args)
+			for args in zip(
+				row_paid_amounts, paid_from_currencies, paid_to_currencies,
+				company_currency, stored_exchange_rates, payment_types,
+			)
+		]
+		return {
+			key: [r[key] for r in results]
+			for key in ("paid_amount", "received_amount", "source_exchange_rate", "target_exchange_rate")
+		}
+
+	raw = np.fromiter((flt(v) for v in row_paid_amounts), dtype=float, count=n)
+	rate = np.fromiter((flt(v) or 1.0 for v in stored_exchange_rates), dtype=float, count=n)
+	paid_from = np.array(paid_from_currencies, dtype=object)
+	paid_to = np.array(paid_to_currencies, dtype=object)
+	company = np.array(company_currency, dtype=object)
+	receive = np.array(payment_types, dtype=object) == "Receive"
+
+	same = paid_from == paid_to
+	from_company = ~same & (paid_from == company)
+	to_company = ~same & ~from_company & (paid_to == company)
+
+	# 1 / stored rate is only used (and rounded) on two branches.
+	inverse = np.ones(n)
+	needs_inverse = (from_company & ~receive) | (to_company & receive)
+	for i in np.flatnonzero(needs_inverse):
+		inverse[i] = flt(1.0 / rate[i], 9)
+
+	source = np.where(from_company, 1.0, np.where(to_company & receive, inverse, rate))
+	target = np.where(
+		from_company, np.where(receive, rate, inverse), np.where(to_company, 1.0, rate)
+	)
+	source[same] = 1.0
+	target[same] = 1.0
+
+	base = raw * np.where(receive, target, source)
+	paid = raw.copy()
+	received = raw.copy()
+	for i in np.flatnonzero(~same):
+		if receive[i]:
+			paid[i] = flt(base[i] / source[i] if source[i] else base[i], 9)
+		else:
+			received[i] = flt(base[i] / target[i] if target[i] else base[i], 9)
+
+	return {
+		"paid_amount": paid.tolist(),
+		"received_amount": received.tolist(),
+		"source_exchange_rate": source.tolist(),
+		"target_exchange_rate": target.tolist(),
+	}
+
+
+class _ChequeBatch:
+	"""A Multiple Cheque Entry loaded once for Payment Entry creation.
+
+	Holds the parent document, its company currency, the active cheque table
+	indexed by row ``name`` and the currencies of every account the rows use,
+	so that creating N Payment Entries costs one parent load and one Account
+	query instead of N loads, N table scans and 2N Account lookups.
+	"""
+
+	def __init__(self, doc):
+		self.doc = doc
+		self.docname = doc.name
+		self.is_receive = doc.payment_type == "Receive"
+		self.child_doctype = "Cheque Table Receive" if self.is_receive else "Cheque Table Pay"
+		self.company_currency = get_company_cheque_settings(doc.company).get("default_currency") or ""
+		table = doc.cheque_table if self.is_receive else doc.cheque_table_2
+		self.rows = {row.name: row for row in (table or [])}
+		self.account_currencies = _get_account_currency_map(
+			account
+			for row in self.rows.values()
+			for account in (row.account_paid_from, row.account_paid_to)
+		)
+		self._existing_payment_entries = None
+
+	@classmethod
+	def load(cls, docname):
+		return cls(frappe.get_doc("Multiple Cheque Entry", docname))
+
+	def get_row(self, row_id):
+		row = self.rows.get(row_id)
+		if not row:
+			frappe.throw(
+				_("Child row {0} not found in document {1}").format(row_id, self.docname)
+			)
+		return row
+
+	def get_account_currency(self, account_name):
+		"""Return the prefetched currency of *account_name*, falling back to
+		the company currency if the account is blank or not found."""
+		if not account_name:
+			return self.company_currency
+		return self.account_currencies.get(account_name) or self.company_currency
+
+	def pending_rows(self):
+		"""Return the cheque rows that have no Payment Entry yet, in table order."""
+		return [row for row in self.rows.values() if not row.payment_entry]
+
+	@property
+	def existing_payment_entries(self):
+		"""``{row name: (Payment Entry, docstatus)}`` for pending rows that
+		already have a draft or submitted Payment Entry whose link was never
+		written back, e.g. because a previous run died mid-row.
+
+		The idempotency key is this document plus the row name
+		(``cheque_table_no`` / ``cheque_table_no2``); all pending rows are
+		checked with a single query the first time this is read.
+		"""
+		if self._existing_payment_entries is None:
+			self._existing_payment_entries = {}
+			names = [row.name for row in self.pending_rows()]
+			if names:
+				row_field = "cheque_table_no" if self.is_receive else "cheque_table_no2"
+				for row_name, pe_name, docstatus in frappe.get_all(
+					"Payment Entry",
+					filters={
+						"reference_doctype": "Multiple Cheque Entry",
+						"reference_link": self.docname,
+						row_field: ["in", names],
+						"docstatus": ["<", 2],
+					},
+					fields=[row_field, "name", "docstatus"],
+					order_by="docstatus desc",
+					as_list=True,
+				):
+					# Prefer a submitted entry over a leftover draft.
+					self._existing_payment_entries.setdefault(row_name, (pe_name, docstatus))
+		return self._existing_payment_entries
+
+
 @frappe.whitelist()
 def create_payment_entry_from_cheque(docname, row_id):
 	"""Create and submit a single Payment Entry from a Cheque Table row.
@@ -131,46 +318,37 @@ def create_payment_entry_from_cheque(docname, row_id):
 
 	Returns the name of the submitted Payment Entry.
 	"""
-	doc = frappe.get_doc("Multiple Cheque Entry", docname)
+	batch = _ChequeBatch.load(docname)
+	return _create_payment_entry(batch, batch.get_row(row_id))
 
-	company = doc.company
-	payment_type = doc.payment_type
-	is_receive = payment_type == "Receive"
 
-	company_currency = (
-		frappe.db.get_value("Company", company, "default_currency") or ""
+def _exchange_rate_error(batch, row, paid_from_currency, paid_to_currency):
+	"""Return an error message if *row* needs an exchange rate but has none."""
+	if paid_from_currency == paid_to_currency or flt(row.target_exchange_rate) > 0:
+		return None
+	return _(
+		"Row {0}: Cannot create Payment Entry — Exchange Rate is missing or zero "
+		"for {1} → {2}. Please add a Currency Exchange record and retry."
+	).format(
+		row.idx or "",
+		paid_to_currency if batch.is_receive else paid_from_currency,
+		paid_from_currency if batch.is_receive else paid_to_currency,
 	)
 
-	# Locate the child row in the appropriate table.
-	child_doctype = "Cheque Table Receive" if is_receive else "Cheque Table Pay"
-	table = doc.cheque_table if is_receive else doc.cheque_table_2
-	row = next((r for r in (table or []) if r.name == row_id), None)
-	if not row:
-		frappe.throw(
-			_("Child row {0} not found in document {1}").format(row_id, docname)
-		)
-
-	paid_from = row.account_paid_from
-	paid_to = row.account_paid_to
 
-	# Always fetch currencies from the Account master.
-	paid_from_currency = _get_account_currency_db(paid_from, company_currency)
-	paid_to_currency = _get_account_currency_db(paid_to, company_currency)
-
-	raw_exchange_rate = flt(row.target_exchange_rate)
-	if paid_from_currency != paid_to_currency and raw_exchange_rate <= 0:
-		frappe.throw(
-			_(
-				"Row {0}: Cannot create Payment Entry — Exchange Rate is missing or zero "
-				"for {1} → {2}. Please add a Currency Exchange record and retry."
-			).format(
-				row.idx or "",
-				paid_to_currency if is_receive else paid_from_currency,
-				paid_from_currency if is_receive else paid_to_currency,
-			)
-		)
+def _derive_payment_entry_amounts(batch, row, paid_from_currency, paid_to_currency):
+	"""Return the Payment Entry amounts and exchange rates for *row*.
 
-	stored_rate = raw_exchange_rate or 1.0
+	Pure computation shared by creation and preview.  The result holds
+	``paid_amount``, ``received_amount``, ``source_exchange_rate`` and
+	``target_exchange_rate`` (rates are ``None`` when ERPNext should fetch
+	them), plus ``clear_party_to_mop`` telling the caller whether the row's
+	stale ``exchange_rate_party_to_mop`` must be reset.
+	"""
+	is_receive = batch.is_receive
+	company_currency = batch.company_currency
+	stored_rate = flt(row.target_exchange_rate) or 1.0
+	clear_party_to_mop = False
 
 	# Derive amounts and exchange rates directly from DB-stored values.
 	if paid_from_currency == paid_to_currency:
@@ -180,9 +358,7 @@ def create_payment_entry_from_cheque(docname, row_id):
 			target_exchange_rate = 1.0
 			# Clear any stale exchange_rate_party_to_mop so that
 			# _get_cheque_paid_amount won't trigger a false mismatch error.
-			if is_receive and getattr(row, "exchange_rate_party_to_mop", None):
-				frappe.db.set_value("Cheque Table Receive", row.name,
-									"exchange_rate_party_to_mop", 0)
+			clear_party_to_mop = bool(is_receive and getattr(row, "exchange_rate_party_to_mop", None))
 			# Bug 2: when the cheque is in a foreign currency (e.g. JOD) but
 			# both accounts are in company currency (e.g. USD), paid_amount and
 			# received_amount must be the company-currency equivalent so that
@@ -204,9 +380,7 @@ def create_payment_entry_from_cheque(docname, row_id):
 			received_amount = flt(row.paid_amount)
 			# Clear any misleading exchange_rate_party_to_mop (e.g. 1.0 set by JS)
 			# so that _get_cheque_paid_amount won't use the bidirectional rate path.
-			if is_receive and getattr(row, "exchange_rate_party_to_mop", None):
-				frappe.db.set_value("Cheque Table Receive", row.name,
-									"exchange_rate_party_to_mop", 0)
+			clear_party_to_mop = bool(is_receive and getattr(row, "exchange_rate_party_to_mop", None))
 	elif is_receive:
 		# paid_from = party account, paid_to = bank/MOP account.
 		paid_amount = flt(row.amount_in_company_currency)   # in paid_from currency
@@ -235,6 +409,61 @@ def create_payment_entry_from_cheque(docname, row_id):
 		source_exchange_rate = stored_rate                  # USD → ILS
 		target_exchange_rate = 1.0
 
+	return {
+		"paid_amount": paid_amount,
+		"received_amount": received_amount,
+		"source_exchange_rate": source_exchange_rate,
+		"target_exchange_rate": target_exchange_rate,
+		"clear_party_to_mop": clear_party_to_mop,
+	}
+
+
+def _create_payment_entry(batch, row):
+	"""Create and submit the Payment Entry for *row* of an already loaded
+	:class:`_ChequeBatch` and link it back to the row.  Returns its name.
+
+	If an earlier, interrupted run already inserted a Payment Entry for the
+	row, that entry is submitted if needed and linked instead of creating a
+	duplicate.
+	"""
+	existing = batch.existing_payment_entries.get(row.name)
+	if existing:
+		pe_name, docstatus = existing
+		if docstatus == 0:
+			pe_doc = frappe.get_doc("Payment Entry", pe_name)
+			pe_doc.flags.ignore_permissions = True
+			pe_doc.submit()
+		_link_payment_entry(batch, row, pe_name)
+		return pe_name
+
+	doc = batch.doc
+	docname = batch.docname
+	company = doc.company
+	payment_type = doc.payment_type
+	is_receive = batch.is_receive
+
+	paid_from = row.account_paid_from
+	paid_to = row.account_paid_to
+
+	# Always take currencies from the Account master (prefetched for the batch).
+	paid_from_currency = batch.get_account_currency(paid_from)
+	paid_to_currency = batch.get_account_currency(paid_to)
+
+	error = _exchange_rate_error(batch, row, paid_from_currency, paid_to_currency)
+	if error:
+		frappe.throw(error)
+
+	# Derive amounts and exchange rates directly from DB-stored values.
+	amounts = _derive_payment_entry_amounts(batch, row, paid_from_currency, paid_to_currency)
+	paid_amount = amounts["paid_amount"]
+	received_amount = amounts["received_amount"]
+	source_exchange_rate = amounts["source_exchange_rate"]
+	target_exchange_rate = amounts["target_exchange_rate"]
+	if amounts["clear_party_to_mop"]:
+		# A stale exchange_rate_party_to_mop would make _get_cheque_paid_amount
+		# raise a false mismatch error (or use the bidirectional rate path).
+		frappe.db.set_value("Cheque Table Receive", row.name, "exchange_rate_party_to_mop", 0)
+
 	pe_dict = {
 		"doctype": "Payment Entry",
 		"posting_date": doc.posting_date,
@@ -281,184 +510,1191 @@ def create_payment_entry_from_cheque(docname, row_id):
 	pe_doc.insert()
 	pe_doc.submit()
 
-	# Persist the Payment Entry link back to the child row in the database.
-	frappe.db.set_value(child_doctype, row_id, "payment_entry", pe_doc.name)
-
+	_link_payment_entry(batch, row, pe_doc.name)
 	return pe_doc.name
 
 
+def _link_payment_entry(batch, row, pe_name):
+	"""Persist the Payment Entry link back to the child row in the database."""
+	frappe.db.set_value(batch.child_doctype, row.name, "payment_entry", pe_name)
+	row.payment_entry = pe_name
+
+
+def _create_payment_entry_for_row(batch, row):
+	"""Create the Payment Entry for one cheque row inside its own savepoint.
+
+	A failure rolls back only this row's partial work, so Payment Entries
+	already created for earlier rows of the batch are kept.  Returns a result
+	dict with either ``payment_entry`` or ``error`` set.
+	"""
+	result = {"row_id": row.name, "idx": row.idx, "payment_entry": None, "error": None}
+	frappe.db.savepoint("cheque_row")
+	try:
+		result["payment_entry"] = _create_payment_entry(batch, row)
+	except Exception as e:
+		frappe.db.rollback(save_point="cheque_row")
+		# The error is reported in the result; don't also pop it up as a msgprint.
+		frappe.clear_last_message()
+		result["error"] = str(e)
+	return result
+
+
+def _get_background_threshold():
+	return cint(frappe.conf.get("ecs_cheques_background_threshold")) or BACKGROUND_ROW_THRESHOLD
+
+
+@frappe.whitelist()
+def create_payment_entries(docname):
+	"""Create and submit Payment Entries for every unlinked row of a submitted
+	Multiple Cheque Entry in a single request.
+
+	Rows that already have a ``payment_entry`` are skipped, and rows whose
+	Payment Entry exists but was never linked are relinked rather than
+	duplicated, so a retry resumes where an interrupted run stopped.  Each
+	remaining row is processed independently, so one bad cheque does not abort
+	the batch.
+
+	When the number of pending rows exceeds the background threshold the work
+	is enqueued on the ``long`` queue instead; progress is then streamed to the
+	form through the ``cheque_payment_entry_progress`` realtime event.
+
+	Returns ``{"queued": 0|1, "total": n, "results": [...]}`` where each result
+	is ``{"row_id", "idx", "payment_entry", "error"}`` (empty when queued).
+	"""
+	batch = _ChequeBatch.load(docname)
+	batch.doc.check_permission("submit")
+	if batch.doc.docstatus != 1:
+		frappe.throw(_("Multiple Cheque Entry {0} must be submitted first.").format(docname))
+
+	pending = batch.pending_rows()
+	if len(pending) > _get_background_threshold():
+		frappe.enqueue(
+			_create_payment_entries_job,
+			queue="long",
+			timeout=3600,
+			job_id="create_payment_entries::{0}".format(docname),
+			deduplicate=True,
+			enqueue_after_commit=True,
+			docname=docname,
+		)
+		return {"queued": 1, "total": len(pending), "results": []}
+
+	results = [_create_payment_entry_for_row(batch, row) for row in pending]
+	return {"queued": 0, "total": len(pending), "results": results}
+
+
+def _create_payment_entries_job(docname, chunk_size=BACKGROUND_CHUNK_SIZE):
+	"""Background job: create Payment Entries for *docname* in committed chunks.
+
+	Committing after every chunk means a worker timeout only loses the chunk in
+	flight; the links written so far survive and the rows are skipped on retry.
+	"""
+	batch = _ChequeBatch.load(docname)
+	pending = batch.pending_rows()
+	total = len(pending)
+
+	for start in range(0, total, chunk_size):
+		chunk_results = [
+			_create_payment_entry_for_row(batch, row)
+			for row in pending[start:start + chunk_size]
+		]
+		frappe.db.commit()
+		_publish_payment_entry_progress(docname, start + len(chunk_results), total, chunk_results)
+
+	if not total:
+		_publish_payment_entry_progress(docname, 0, 0, [])
+
+
+def _publish_payment_entry_progress(docname, progress, total, results):
+	frappe.publish_realtime(
+		PAYMENT_ENTRY_PROGRESS_EVENT,
+		{
+			"docname": docname,
+			"progress": progress,
+			"total": total,
+			"results": results,
+			"done": progress >= total,
+		},
+		doctype="Multiple Cheque Entry",
+		docname=docname,
+	)
+
+
+def _get_existing_names(doctype, names):
+	"""Return the subset of *names* that exist as *doctype* records, using a
+	single ``IN`` query."""
+	names = list({name for name in names if name})
+	if not names:
+		return set()
+	return set(frappe.get_all(doctype, filters={"name": ["in", names]}, pluck="name"))
+
+
+def _get_existing_parties(parties):
+	"""Return ``{party_type: {existing party names}}`` for the
+	``(party_type, party)`` pairs in *parties*: one query for the Party Types
+	plus one ``IN`` query per type."""
+	parties_by_type = {}
+	for party_type, party in parties:
+		if party_type and party:
+			parties_by_type.setdefault(party_type, set()).add(party)
+
+	party_types = _get_existing_names("Party Type", parties_by_type)
+	return {
+		party_type: _get_existing_names(party_type, parties)
+		for party_type, parties in parties_by_type.items()
+		if party_type in party_types
+	}
+
+
+def _cheque_key(row, is_receive):
+	"""Identity of a physical cheque: number, party, drawn bank (Receive
+	only; paid cheques are drawn on our own bank) and amount."""
+	return (
+		str(row.get("reference_no") or "").strip(),
+		row.get("party") or "",
+		(row.get("bank") or "") if is_receive else "",
+		flt(row.get("paid_amount"), 2),
+	)
+
+
+def _find_duplicate_cheques(rows, is_receive, exclude_parent=None, row_numbers=None):
+	"""Return ``{index in rows: description}`` for every row that repeats a
+	cheque already recorded in a submitted Payment Entry, in an unlinked row
+	of another submitted Multiple Cheque Entry, or earlier in *rows*.
+	Earlier rows are described by *row_numbers* if given, else by their
+	``idx``.
+
+	Payment Entries created from *exclude_parent* itself are ignored: they
+	are the rows' own entries, relinked rather than duplicated on submit.
+	Draft batches never block: they may be abandoned copies of this one.
+
+	Each source is searched with one query on the distinct cheque numbers,
+	served by the ``reference_no`` indexes that ``ecs_cheques.install`` adds.
+	"""
+	keys = [_cheque_key(row, is_receive) for row in rows]
+	reference_nos = list({key[0] for key in keys if key[0]})
+	if not reference_nos:
+		return {}
+
+	known = {}
+	amount_field = "received_amount" if is_receive else "paid_amount"
+	for name, reference_no, party, bank, amount, reference_link in frappe.get_all(
+		"Payment Entry",
+		filters={
+			"reference_no": ["in", reference_nos],
+			"payment_type": "Receive" if is_receive else "Pay",
+			"docstatus": 1,
+		},
+		fields=["name", "reference_no", "party", "drawn_bank", amount_field, "reference_link"],
+		as_list=True,
+	):
+		if exclude_parent and reference_link == exclude_parent:
+			continue
+		key = _cheque_key(
+			{"reference_no": reference_no, "party": party, "bank": bank, "paid_amount": amount},
+			is_receive,
+		)
+		known.setdefault(key, _("Payment Entry {0}").format(name))
+
+	child_doctype = "Cheque Table Receive" if is_receive else "Cheque Table Pay"
+	bank_column = "c.bank" if is_receive else "NULL"
+	for parent, idx, reference_no, party, bank, amount in frappe.db.sql(
+		"""
+		select c.parent, c.idx, c.reference_no, c.party, {bank_column}, c.paid_amount
+		from `tab{child_doctype}` c
+		inner join `tabMultiple Cheque Entry` m on m.name = c.parent
+		where c.reference_no in %(reference_nos)s
+			and c.parenttype = 'Multiple Cheque Entry'
+			and m.docstatus = 1
+			and ifnull(c.payment_entry, '') = ''
+			and c.parent != %(exclude_parent)s
+		""".format(bank_column=bank_column, child_doctype=child_doctype),
+		{"reference_nos": reference_nos, "exclude_parent": exclude_parent or ""},
+	):
+		key = _cheque_key(
+			{"reference_no": reference_no, "party": party, "bank": bank, "paid_amount": amount},
+			is_receive,
+		)
+		known.setdefault(key, _("Multiple Cheque Entry {0} row {1}").format(parent, idx))
+
+	duplicates = {}
+	for index, key in enumerate(keys):
+		if not key[0]:
+			continue
+		if key in known:
+			duplicates[index] = known[key]
+		else:
+			known[key] = _("row {0}").format(row_numbers[index] if row_numbers else rows[index].get("idx"))
+	return duplicates
+
+
+@frappe.whitelist()
+def preview_payment_entries(docname):
+	"""Validate every unlinked row of a Multiple Cheque Entry and return the
+	Payment Entry amounts that submitting it would post, without writing.
+
+	Works on saved drafts.  Parties, accounts and modes of payment are checked
+	with one query per doctype for the whole batch, and amounts come from the
+	same derivation that :func:`create_payment_entry_from_cheque` uses, so the
+	preview matches what is eventually posted.
+
+	Returns ``{"valid", "rows", "errors", "totals"}`` where ``errors`` is a
+	flat list of messages, each row is ``{"row_id", "idx", "paid_amount",
+	"received_amount", "source_exchange_rate", "target_exchange_rate",
+	"paid_from_account_currency", "paid_to_account_currency", "errors"}`` and
+	``totals`` maps each currency to the sum of the cheque-side amounts.
+	"""
+	doc = frappe.get_doc("Multiple Cheque Entry", docname)
+	doc.check_permission("read")
+	batch = _ChequeBatch(doc)
+	pending = batch.pending_rows()
+
+	parties = _get_existing_parties((row.party_type, row.party) for row in pending)
+	modes_of_payment = _get_existing_names(
+		"Mode of Payment", (row.mode_of_payment or doc.mode_of_payment for row in pending)
+	)
+	duplicates = _find_duplicate_cheques(pending, batch.is_receive, exclude_parent=docname)
+
+	rows, errors, totals = [], [], {}
+	for index, row in enumerate(pending):
+		row_errors = []
+		mode_of_payment = row.mode_of_payment or doc.mode_of_payment
+
+		if not row.party_type or not row.party:
+			row_errors.append(_("Party Type and Party are required"))
+		elif row.party_type not in parties:
+			row_errors.append(_("Party Type {0} does not exist").format(row.party_type))
+		elif row.party not in parties[row.party_type]:
+			row_errors.append(_("{0} {1} does not exist").format(row.party_type, row.party))
+
+		for label, account in ((_("Account Paid From"), row.account_paid_from),
+							   (_("Account Paid To"), row.account_paid_to)):
+			if not account:
+				row_errors.append(_("{0} is required").format(label))
+			elif account not in batch.account_currencies:
+				row_errors.append(_("{0} {1} does not exist").format(label, account))
+
+		if not mode_of_payment:
+			row_errors.append(_("Mode of Payment is required"))
+		elif mode_of_payment not in modes_of_payment:
+			row_errors.append(_("Mode of Payment {0} does not exist").format(mode_of_payment))
+
+		if flt(row.paid_amount) <= 0:
+			row_errors.append(_("Paid Amount must be greater than zero"))
+
+		if index in duplicates:
+			row_errors.append(_("Cheque {0} is already recorded in {1}").format(row.reference_no, duplicates[index]))
+
+		paid_from_currency = batch.get_account_currency(row.account_paid_from)
+		paid_to_currency = batch.get_account_currency(row.account_paid_to)
+		rate_error = _exchange_rate_error(batch, row, paid_from_currency, paid_to_currency)
+		if rate_error:
+			row_errors.append(rate_error)
+
+		amounts = _derive_payment_entry_amounts(batch, row, paid_from_currency, paid_to_currency)
+		amounts.pop("clear_party_to_mop")
+		amounts.update({
+			"row_id": row.name,
+			"idx": row.idx,
+			"paid_from_account_currency": paid_from_currency,
+			"paid_to_account_currency": paid_to_currency,
+			"errors": row_errors,
+		})
+		rows.append(amounts)
+
+		# The cheque side is paid_to for Receive and paid_from for Pay.
+		if batch.is_receive:
+			totals[paid_to_currency] = flt(totals.get(paid_to_currency)) + amounts["received_amount"]
+		else:
+			totals[paid_from_currency] = flt(totals.get(paid_from_currency)) + amounts["paid_amount"]
+
+		# The exchange-rate message already names the row.
+		for message in row_errors:
+			errors.append(message if message == rate_error else _("Row {0}: {1}").format(row.idx, message))
+
+	return {"valid": not errors, "rows": rows, "errors": errors, "totals": totals}
+
+
+def _get_submitted_payment_entries(docname):
+	"""Return the submitted Payment Entries created from *docname*."""
+	return frappe.get_all(
+		"Payment Entry",
+		filters={
+			"reference_doctype": "Multiple Cheque Entry",
+			"reference_link": docname,
+			"docstatus": 1,
+		},
+		order_by="creation asc",
+		pluck="name",
+	)
+
+
+def _get_cheque_journal_entries(pe_names):
+	"""Return ``({Payment Entry: [Journal Entry, ...]}, shared)`` for the
+	submitted cheque-action Journal Entries of *pe_names*, newest first.
+
+	Entries posted for one cheque are found through their ``reference_link``
+	and consolidated ones through the ``cheque_payment_entry`` of their
+	lines; a consolidated entry is listed under every cheque it covers.
+	*shared* holds the consolidated entries that also cover cheques outside
+	*pe_names*, whose lines must be reversed cheque by cheque instead of
+	cancelling the whole entry.  A cheque already reversed in a shared entry
+	is not listed under it.
+	"""
+	created, shared = {}, set()
+	if not pe_names:
+		return {}, shared
+	for je_name, pe_name, creation in frappe.get_all(
+		"Journal Entry",
+		filters={
+			"reference_doctype": "Payment Entry",
+			"reference_link": ["in", list(pe_names)],
+			"docstatus": 1,
+		},
+		fields=["name", "reference_link", "creation"],
+		as_list=True,
+	):
+		created.setdefault(pe_name, {})[je_name] = creation
+	batch = set(pe_names)
+	# Every cheque line of the consolidated entries that cover the batch.
+	for je_name, pe_name, creation in frappe.db.sql(
+		"""
+		select distinct je.name, jea.cheque_payment_entry, je.creation
+		from `tabJournal Entry Account` jea
+		inner join `tabJournal Entry` je on je.name = jea.parent
+		where je.docstatus = 1
+			and ifnull(jea.cheque_payment_entry, '') != ''
+			and je.name in (
+				select parent from `tabJournal Entry Account`
+				where cheque_payment_entry in %(pe_names)s
+			)
+		""",
+		{"pe_names": list(pe_names)},
+	):
+		if pe_name in batch:
+			created.setdefault(pe_name, {})[je_name] = creation
+		else:
+			shared.add(je_name)
+	if shared:
+		for je_name, pe_name in get_cheque_reversals(list(shared)):
+			created.get(pe_name, {}).pop(je_name, None)
+	journal_entries = {
+		pe_name: sorted(journal_entries, key=journal_entries.get, reverse=True)
+		for pe_name, journal_entries in created.items()
+	}
+	return journal_entries, shared
+
+
+def _cancel_payment_entry(pe_name, journal_entries, shared=()):
+	"""Cancel *pe_name* after its cheque-action *journal_entries*.
+
+	The Journal Entries are cancelled newest first so that each one's
+	``on_cancel`` hook restores the cheque status it replaced, leaving the
+	Payment Entry in its original state before it is cancelled itself.  A
+	consolidated entry already cancelled with an earlier cheque is skipped,
+	and in one that is *shared* with other cheques only *pe_name*'s lines
+	are reversed.
+	"""
+	for je_name in journal_entries:
+		if je_name in shared:
+			reverse_cheque_lines(je_name, pe_name)
+			continue
+		je = frappe.get_doc("Journal Entry", je_name)
+		if je.docstatus == 1:
+			je.cancel()
+	pe = frappe.get_doc("Payment Entry", pe_name)
+	if pe.docstatus == 1:
+		pe.cancel()
+
+
+@frappe.whitelist()
+def cancel_multiple_cheque_entry(docname):
+	"""Cancel a submitted Multiple Cheque Entry together with its Payment
+	Entries and their cheque Journal Entries.
+
+	Small batches are cancelled in this request.  Above the background
+	threshold the children are cancelled by a background job in committed
+	chunks, with progress streamed through the
+	``cheque_payment_entry_cancel_progress`` realtime event; the Multiple
+	Cheque Entry itself is only cancelled once every child has been.
+
+	Returns ``{"queued": 0|1, "total": n}``.
+	"""
+	doc = frappe.get_doc("Multiple Cheque Entry", docname)
+	doc.check_permission("cancel")
+	if doc.docstatus != 1:
+		frappe.throw(_("Multiple Cheque Entry {0} must be submitted first.").format(docname))
+
+	pe_names = _get_submitted_payment_entries(docname)
+	if len(pe_names) > _get_background_threshold():
+		frappe.enqueue(
+			_cancel_payment_entries_job,
+			queue="long",
+			timeout=3600,
+			job_id="cancel_payment_entries::{0}".format(docname),
+			deduplicate=True,
+			enqueue_after_commit=True,
+			docname=docname,
+		)
+		return {"queued": 1, "total": len(pe_names)}
+
+	doc.cancel()
+	return {"queued": 0, "total": len(pe_names)}
+
+
+def _cancel_payment_entries_job(docname, chunk_size=BACKGROUND_CHUNK_SIZE):
+	"""Background job: cancel the children of *docname* in committed chunks,
+	then the Multiple Cheque Entry itself.
+
+	Each Payment Entry is cancelled inside its own savepoint.  If any of them
+	fails the parent stays submitted, so the job can simply be run again; the
+	entries already cancelled are not picked up a second time.
+	"""
+	pe_names = _get_submitted_payment_entries(docname)
+	journal_entries, shared = _get_cheque_journal_entries(pe_names)
+	total = len(pe_names)
+	failed = 0
+
+	for start in range(0, total, chunk_size):
+		chunk_results = []
+		for pe_name in pe_names[start:start + chunk_size]:
+			result = {"payment_entry": pe_name, "error": None}
+			frappe.db.savepoint("cheque_cancel")
+			try:
+				_cancel_payment_entry(pe_name, journal_entries.get(pe_name, []), shared)
+			except Exception as e:
+				frappe.db.rollback(save_point="cheque_cancel")
+				frappe.clear_last_message()
+				result["error"] = str(e)
+				failed += 1
+			chunk_results.append(result)
+		frappe.db.commit()
+		_publish_cancel_progress(docname, start + len(chunk_results), total, chunk_results)
+
+	cancelled = False
+	if not failed:
+		frappe.get_doc("Multiple Cheque Entry", docname).cancel()
+		frappe.db.commit()
+		cancelled = True
+
+	_publish_cancel_progress(docname, total, total, [], done=True, cancelled=cancelled)
+
+
+def _publish_cancel_progress(docname, progress, total, results, done=False, cancelled=False):
+	frappe.publish_realtime(
+		PAYMENT_ENTRY_CANCEL_PROGRESS_EVENT,
+		{
+			"docname": docname,
+			"progress": progress,
+			"total": total,
+			"results": results,
+			"done": done,
+			"cancelled": cancelled,
+		},
+		doctype="Multiple Cheque Entry",
+		docname=docname,
+	)
+
+
 class MultipleChequeEntry(Document):
+	def before_submit(self):
+		"""Refuse to submit cheques that are already recorded elsewhere, before
+		any Payment Entry is created for them."""
+		is_receive = self.payment_type == "Receive"
+		rows = self.cheque_table if is_receive else self.cheque_table_2
+		rows = [row for row in rows or [] if not row.payment_entry]
+		duplicates = _find_duplicate_cheques(rows, is_receive, exclude_parent=self.name)
+		if duplicates:
+			frappe.throw("<br>".join(
+				_("Row {0}: Cheque {1} is already recorded in {2}.").format(
+					rows[index].idx, rows[index].reference_no, where
+				)
+				for index, where in sorted(duplicates.items())
+			))
+
 	def on_cancel(self):
-		"""Cancel linked Payment Entries when Multiple Cheque Entry is cancelled."""
-		pe_names = self._get_linked_payment_entries()
+		"""Cancel linked Payment Entries, and their cheque Journal Entries,
+		when Multiple Cheque Entry is cancelled.
+
+		Large batches go through :func:`cancel_multiple_cheque_entry`, whose
+		background job has already cancelled every child by the time this runs.
+		"""
+		pe_names = _get_submitted_payment_entries(self.name)
+		journal_entries, shared = _get_cheque_journal_entries(pe_names)
 		for pe_name in pe_names:
 			try:
-				pe = frappe.get_doc("Payment Entry", pe_name)
-				if pe.docstatus == 1:
-					pe.cancel()
+				_cancel_payment_entry(pe_name, journal_entries.get(pe_name, []), shared)
 			except Exception as e:
 				frappe.throw(_("Failed to cancel Payment Entry {0}: {1}").format(pe_name, str(e)))
 
 	def on_trash(self):
-		"""Delete linked Payment Entries when Multiple Cheque Entry is deleted."""
-		pe_names = self._get_linked_payment_entries()
-		for pe_name in pe_names:
+		"""Delete linked cancelled Payment Entries when Multiple Cheque Entry is deleted.
+
+		The docstatus of every linked entry comes from one query, so only the
+		cancelled ones are passed to ``frappe.delete_doc``.
+		"""
+		for pe_name, docstatus in self._get_linked_payment_entries():
+			if docstatus != 2:
+				continue
 			try:
-				pe = frappe.get_doc("Payment Entry", pe_name)
-				if pe.docstatus == 2:
-					frappe.delete_doc("Payment Entry", pe_name, ignore_permissions=True)
+				frappe.delete_doc("Payment Entry", pe_name, ignore_permissions=True)
 			except Exception as e:
 				frappe.throw(_("Failed to delete Payment Entry {0}: {1}").format(pe_name, str(e)))
 
 	def _get_linked_payment_entries(self):
-		"""Return list of Payment Entry names linked to this document."""
+		"""Return ``(name, docstatus)`` of the Payment Entries linked to this document."""
 		return frappe.get_all(
 			"Payment Entry",
 			filters={"reference_doctype": "Multiple Cheque Entry", "reference_link": self.name},
-			pluck="name"
+			fields=["name", "docstatus"],
+			as_list=True,
 		)
 
 
+# Columns of the upload template (and of cheque table exports) with sample rows.
+CHEQUE_TEMPLATE_COLUMNS = {
+	"Receive": [
+		"party_type", "party", "mode_of_payment", "bank",
+		"reference_no", "reference_date", "cheque_type",
+		"cheque_currency", "paid_amount", "target_exchange_rate",
+		"account_paid_from", "account_paid_to",
+		"first_beneficiary", "person_name", "issuer_name"
+	],
+	"Pay": [
+		"party_type", "party", "mode_of_payment",
+		"reference_no", "reference_date", "cheque_type",
+		"cheque_currency", "paid_amount", "target_exchange_rate",
+		"account_paid_from", "account_paid_to",
+		"first_beneficiary", "person_name", "issuer_name"
+	],
+}
+
+CHEQUE_TEMPLATE_SAMPLES = {
+	"Receive": [
+		["Customer", "CUST-001", "شيك", "National Bank",
+		 "CHQ-001", "2024-01-15", "Crossed",
+		 "EGP", 5000, 1,
+		 "1310 - مدينون - O", "1110 - بنك - O",
+		 "Company", "", "Ahmed Ali"],
+		["Customer", "CUST-002", "شيك", "ABC Bank",
+		 "CHQ-002", "2024-01-20", "Opened",
+		 "USD", 1000, 48.5,
+		 "1310 - مدينون - O", "1111 - بنك دولار - O",
+		 "Personal", "Mohamed Said", "Mohamed Said"],
+		["Supplier", "SUPP-001", "شيك", "National Bank",
+		 "CHQ-003", "2024-02-01", "Crossed",
+		 "EGP", 12000, 1,
+		 "2110 - دائنون - O", "1110 - بنك - O",
+		 "", "", ""],
+	],
+	"Pay": [
+		["Supplier", "SUPP-001", "شيك",
+		 "CHQ-PAY-001", "2024-01-15", "Crossed",
+		 "EGP", 8000, 1,
+		 "1110 - بنك - O", "2110 - دائنون - O",
+		 "", "", ""],
+		["Supplier", "SUPP-002", "شيك",
+		 "CHQ-PAY-002", "2024-01-22", "Opened",
+		 "USD", 500, 48.5,
+		 "1111 - بنك دولار - O", "2110 - دائنون - O",
+		 "", "", ""],
+		["Customer", "CUST-001", "شيك",
+		 "CHQ-PAY-003", "2024-02-05", "Crossed",
+		 "EGP", 3000, 1,
+		 "1110 - بنك - O", "1310 - مدينون - O",
+		 "", "", ""],
+	],
+}
+
+
 @frappe.whitelist()
 def get_cheques_excel_template(payment_type):
-	"""Return an Excel (.xlsx) template with headers and 3 sample rows for the cheque table."""
+	"""Return an Excel (.xlsx) template with headers and 3 sample rows for the cheque table.
+
+	The file only depends on the payment type, so the generated bytes are
+	cached per payment type, language and app version.
+	"""
+	from ecs_cheques import __version__
+
+	payment_type = "Receive" if payment_type == "Receive" else "Pay"
+	cache_key = "ecs_cheques_excel_template::{0}::{1}::{2}".format(
+		payment_type, getattr(frappe.local, "lang", None) or "en", __version__
+	)
+	content = frappe.cache().get_value(cache_key)
+	if content is None:
+		content = _build_cheques_workbook(
+			_("Cheques Receive") if payment_type == "Receive" else _("Cheques Pay"),
+			CHEQUE_TEMPLATE_COLUMNS[payment_type],
+			CHEQUE_TEMPLATE_SAMPLES[payment_type],
+		)
+		frappe.cache().set_value(cache_key, content)
+
+	frappe.response.filename = "cheques_template_{}.xlsx".format(payment_type.lower())
+	frappe.response.filecontent = content
+	frappe.response.type = "binary"
+
+
+@frappe.whitelist()
+def export_cheques_excel(docname):
+	"""Download the cheque table of a Multiple Cheque Entry as .xlsx, in the
+	upload template's layout.  Rows are read with one query and streamed into
+	a write-only workbook."""
+	if not frappe.has_permission("Multiple Cheque Entry", "read", docname):
+		frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+	payment_type = frappe.db.get_value("Multiple Cheque Entry", docname, "payment_type")
+	payment_type = "Receive" if payment_type == "Receive" else "Pay"
+	columns = CHEQUE_TEMPLATE_COLUMNS[payment_type]
+	rows = frappe.get_all(
+		"Cheque Table Receive" if payment_type == "Receive" else "Cheque Table Pay",
+		filters={"parent": docname, "parenttype": "Multiple Cheque Entry"},
+		fields=columns,
+		order_by="idx asc",
+		as_list=True,
+	)
+
+	frappe.response.filename = "{0}.xlsx".format(docname)
+	frappe.response.filecontent = _build_cheques_workbook(docname, columns, rows)
+	frappe.response.type = "binary"
+
+
+def _build_cheques_workbook(title, headers, rows):
+	"""Return the bytes of a single-sheet .xlsx with *headers* and *rows*,
+	written in openpyxl write-only mode so rows are streamed to disk."""
 	try:
 		import openpyxl
 	except ImportError:
 		frappe.throw(_("openpyxl is required to generate Excel templates. Please install it."))
 
-	wb = openpyxl.Workbook()
-	ws = wb.active
-
-	if payment_type == "Receive":
-		ws.title = "Cheques Receive"
-		headers = [
-			"party_type", "party", "mode_of_payment", "bank",
-			"reference_no", "reference_date", "cheque_type",
-			"cheque_currency", "paid_amount", "target_exchange_rate",
-			"account_paid_from", "account_paid_to",
-			"first_beneficiary", "person_name", "issuer_name"
-		]
-		samples = [
-			["Customer", "CUST-001", "شيك", "National Bank",
-			 "CHQ-001", "2024-01-15", "Crossed",
-			 "EGP", 5000, 1,
-			 "1310 - مدينون - O", "1110 - بنك - O",
-			 "Company", "", "Ahmed Ali"],
-			["Customer", "CUST-002", "شيك", "ABC Bank",
-			 "CHQ-002", "2024-01-20", "Opened",
-			 "USD", 1000, 48.5,
-			 "1310 - مدينون - O", "1111 - بنك دولار - O",
-			 "Personal", "Mohamed Said", "Mohamed Said"],
-			["Supplier", "SUPP-001", "شيك", "National Bank",
-			 "CHQ-003", "2024-02-01", "Crossed",
-			 "EGP", 12000, 1,
-			 "2110 - دائنون - O", "1110 - بنك - O",
-			 "", "", ""],
-		]
-	else:
-		ws.title = "Cheques Pay"
-		headers = [
-			"party_type", "party", "mode_of_payment",
-			"reference_no", "reference_date", "cheque_type",
-			"cheque_currency", "paid_amount", "target_exchange_rate",
-			"account_paid_from", "account_paid_to",
-			"first_beneficiary", "person_name", "issuer_name"
-		]
-		samples = [
-			["Supplier", "SUPP-001", "شيك",
-			 "CHQ-PAY-001", "2024-01-15", "Crossed",
-			 "EGP", 8000, 1,
-			 "1110 - بنك - O", "2110 - دائنون - O",
-			 "", "", ""],
-			["Supplier", "SUPP-002", "شيك",
-			 "CHQ-PAY-002", "2024-01-22", "Opened",
-			 "USD", 500, 48.5,
-			 "1111 - بنك دولار - O", "2110 - دائنون - O",
-			 "", "", ""],
-			["Customer", "CUST-001", "شيك",
-			 "CHQ-PAY-003", "2024-02-05", "Crossed",
-			 "EGP", 3000, 1,
-			 "1110 - بنك - O", "1310 - مدينون - O",
-			 "", "", ""],
-		]
-
+	wb = openpyxl.Workbook(write_only=True)
+	# Excel limits sheet titles to 31 characters.
+	ws = wb.create_sheet(title=str(title)[:31])
 	ws.append(headers)
-	for sample in samples:
-		ws.append(sample)
+	for row in rows:
+		ws.append(list(row))
 
 	output = io.BytesIO()
 	wb.save(output)
-	output.seek(0)
+	return output.getvalue()
 
-	frappe.response.filename = "cheques_template_{}.xlsx".format(payment_type.lower())
-	frappe.response.filecontent = output.read()
-	frappe.response.type = "binary"
+
+REQUIRED_CHEQUE_COLUMNS = ["party_type", "party", "reference_no", "reference_date",
+						   "cheque_type", "paid_amount"]
+
+
+# Number of error messages returned with an upload summary; the complete
+# list is in the rejected-rows workbook.
+UPLOAD_ERROR_PREVIEW = 20
+
+
+@frappe.whitelist()
+def upload_cheques_excel(file_data=None, payment_type=None, file=None):
+	"""Parse uploaded Excel, CSV or TSV file and return the valid rows for the cheque table.
+
+	Pass *file*, the name or URL of an uploaded File, to have the file read
+	from disk; *file_data* (base64 or raw bytes) is still accepted for
+	small payloads.
+
+	The format is detected from the content: .xlsx files are streamed in
+	openpyxl read-only mode, anything else is read with the ``csv`` module.
+
+	Rows that fail validation do not stop the upload.  They are written,
+	with an ``error`` column, to a private workbook that can be corrected
+	and uploaded again.  Returns::
+
+		{"rows": [...], "total": n, "rejected": k,
+		 "errors": [first messages], "error_file": url or None}
+	"""
+	rows, rejected = _read_uploaded_cheques(file_data, payment_type, file)
+	return _upload_summary(rows, rejected)
+
+
+def _read_uploaded_cheques(file_data=None, payment_type=None, file=None):
+	"""Return ``(rows, rejected)`` for an uploaded cheque file, where
+	*rejected* is a list of ``(row number, row, [messages])``.  Problems with
+	the file as a whole (unreadable, missing columns) still raise."""
+	if file:
+		stream = open(_get_uploaded_file_path(file), "rb")
+	elif isinstance(file_data, str):
+		import base64
+		stream = io.BytesIO(base64.b64decode(file_data))
+	elif file_data:
+		stream = io.BytesIO(file_data)
+	else:
+		frappe.throw(_("Please attach a file to upload."))
+
+	result = []
+	row_numbers = []
+	errors = []
+	with stream:
+		rows = _iter_upload_rows(stream)
+		try:
+			for i, row_dict in _iter_cheque_rows(rows):
+				result.append(row_dict)
+				row_numbers.append(i)
+				errors.append([])
+		finally:
+			# Finish the reader while the stream is still open.
+			rows.close()
+
+	_normalise_cheque_columns(result, row_numbers, errors)
+
+	for index, messages in _validate_cheque_references(result, row_numbers).items():
+		errors[index].extend(messages)
+	duplicates = _find_duplicate_cheques(result, payment_type != "Pay", row_numbers=row_numbers)
+	for index, where in duplicates.items():
+		errors[index].append(_("Row {0}: Cheque {1} is already recorded in {2}.").format(
+			row_numbers[index], result[index].get("reference_no"), where
+		))
+
+	rows, rejected = [], []
+	for i, row, row_errors in zip(row_numbers, result, errors):
+		if row_errors:
+			rejected.append((i, row, row_errors))
+		else:
+			rows.append(row)
+	return rows, rejected
+
+
+def _upload_summary(rows, rejected, attached_to=None):
+	"""Build the summary returned for an upload, saving the rejected rows
+	as a private workbook (attached to *attached_to*, a ``(doctype, name)``
+	pair, if given)."""
+	messages = [message for _i, _row, row_errors in rejected for message in row_errors]
+	return {
+		"rows": rows,
+		"total": len(rows) + len(rejected),
+		"rejected": len(rejected),
+		"errors": messages[:UPLOAD_ERROR_PREVIEW],
+		"error_file": _save_rejected_cheques(rejected, attached_to) if rejected else None,
+	}
+
+
+def _save_rejected_cheques(rejected, attached_to=None):
+	"""Write the rejected upload rows, in their uploaded columns plus
+	``row`` and ``error``, to a private .xlsx File and return its URL."""
+	headers = list(dict.fromkeys(column for _i, row, _errors in rejected for column in row))
+	content = _build_cheques_workbook(
+		_("Rejected Cheques"),
+		["row"] + headers + ["error"],
+		(
+			[i] + [row.get(column) for column in headers] + ["\n".join(row_errors)]
+			for i, row, row_errors in rejected
+		),
+	)
+
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": "rejected_cheques_{0}.xlsx".format(frappe.generate_hash(length=8)),
+		"is_private": 1,
+		"content": content,
+		"attached_to_doctype": attached_to[0] if attached_to else None,
+		"attached_to_name": attached_to[1] if attached_to else None,
+	})
+	file_doc.insert(ignore_permissions=True)
+	return file_doc.file_url
 
 
 @frappe.whitelist()
-def upload_cheques_excel(file_data, payment_type):
-	"""Parse uploaded Excel file and return rows as list of dicts for the cheque table."""
+def append_uploaded_cheques(docname, file=None, file_data=None):
+	"""Parse an uploaded cheque file and append its valid rows to the draft
+	Multiple Cheque Entry *docname* on the server.
+
+	Rows are validated exactly as by :func:`upload_cheques_excel`, then
+	completed with the values the form would otherwise fetch row by row
+	(party names, default accounts, account currencies, exchange rates and
+	company-currency amounts) using a handful of set-based queries.  The
+	document is saved once; the client only needs to reload it.  Rejected
+	rows go to a workbook attached to the document.
+
+	Returns the upload summary without the rows, plus ``"appended"`` and
+	``"reload"``.
+	"""
+	doc = frappe.get_doc("Multiple Cheque Entry", docname)
+	doc.check_permission("write")
+	if doc.docstatus != 0:
+		frappe.throw(_("Cheques can only be uploaded into a draft Multiple Cheque Entry."))
+
+	rows, rejected = _read_uploaded_cheques(file_data=file_data, payment_type=doc.payment_type, file=file)
+	if rows:
+		table_field = "cheque_table" if doc.payment_type == "Receive" else "cheque_table_2"
+		for row in _enrich_cheque_rows(doc, rows):
+			doc.append(table_field, row)
+		doc.save()
+
+	summary = _upload_summary(rows, rejected, attached_to=("Multiple Cheque Entry", docname))
+	summary.pop("rows")
+	summary.update({"appended": len(rows), "reload": 1 if rows else 0})
+	return summary
+
+
+def _enrich_cheque_rows(doc, rows):
+	"""Fill in the derived fields of uploaded *rows* for *doc* in place and
+	return them.  Values present in the file are kept."""
+	from ecs_cheques.ecs_cheques.overrides.currency_exchange.currency_exchange import (
+		get_exchange_rates,
+	)
+
+	is_receive = doc.payment_type == "Receive"
+	# The bank (cheque) side and the party side of each row.
+	bank_field, party_field = (
+		("account_paid_to", "account_paid_from") if is_receive else ("account_paid_from", "account_paid_to")
+	)
+	bank_currency_field, party_currency_field = (
+		("account_currency", "account_currency_from") if is_receive else ("account_currency_from", "account_currency")
+	)
+
+	for row in rows:
+		row["mode_of_payment"] = row.get("mode_of_payment") or doc.mode_of_payment
+
+	# Default bank account of each mode of payment for the company.
+	mode_accounts = dict(frappe.get_all(
+		"Mode of Payment Account",
+		filters={
+			"parent": ["in", list({row["mode_of_payment"] for row in rows if row["mode_of_payment"]})],
+			"company": doc.company,
+		},
+		fields=["parent", "default_account"],
+		as_list=True,
+	)) if rows else {}
+
+	# Party names and party accounts, one query per party type.
+	parties_by_type = {}
+	for row in rows:
+		if row.get("party_type") and row.get("party"):
+			parties_by_type.setdefault(row["party_type"], set()).add(row["party"])
+	party_names, party_accounts = {}, {}
+	for party_type, parties in parties_by_type.items():
+		if party_type in ("Customer", "Supplier"):
+			name_field = "customer_name" if party_type == "Customer" else "supplier_name"
+			for name, party_name in frappe.get_all(
+				party_type, filters={"name": ["in", list(parties)]}, fields=["name", name_field], as_list=True
+			):
+				party_names[(party_type, name)] = party_name
+		for name, account in frappe.get_all(
+			"Party Account",
+			filters={"parenttype": party_type, "parent": ["in", list(parties)], "company": doc.company},
+			fields=["parent", "account"],
+			as_list=True,
+		):
+			party_accounts[(party_type, name)] = account
+
+	company = get_company_cheque_settings(doc.company)
+	default_party_account = {
+		"Customer": company.get("default_receivable_account"),
+		"Supplier": company.get("default_payable_account"),
+	}
+	doc_party_account = doc.paid_from if is_receive else doc.paid_to
+
+	for row in rows:
+		key = (row.get("party_type"), row.get("party"))
+		row["party_name"] = row.get("party_name") or party_names.get(key)
+		row[bank_field] = row.get(bank_field) or mode_accounts.get(row["mode_of_payment"])
+		row[party_field] = (
+			row.get(party_field) or doc_party_account or party_accounts.get(key)
+			or default_party_account.get(row.get("party_type"))
+		)
+
+	currencies = _get_account_currency_map(
+		account for row in rows for account in (row.get(bank_field), row.get(party_field))
+	)
+	posting_date = str(doc.posting_date or nowdate())
+	for row in rows:
+		row[bank_currency_field] = currencies.get(row[bank_field]) or company.get("default_currency")
+		row[party_currency_field] = currencies.get(row[party_field]) or company.get("default_currency")
+		row["cheque_currency"] = row.get("cheque_currency") or row[bank_currency_field]
+
+	# Exchange rate from the cheque (bank) currency to the party currency.
+	rates = {
+		(rate["from_currency"], rate["to_currency"]): rate["exchange_rate"]
+		for rate in get_exchange_rates([
+			(row[bank_currency_field], row[party_currency_field], posting_date)
+			for row in rows
+			if not row.get("target_exchange_rate")
+		])
+	}
+
+	for row in rows:
+		bank_currency, party_currency = row[bank_currency_field], row[party_currency_field]
+		if bank_currency == party_currency:
+			row["target_exchange_rate"] = 1
+		elif not row.get("target_exchange_rate"):
+			row["target_exchange_rate"] = rates.get((bank_currency, party_currency)) or 0
+		rate = flt(row["target_exchange_rate"])
+		if is_receive and rate > 0 and bank_currency != party_currency:
+			row["exchange_rate_mop_to_party"] = rate
+			row["exchange_rate_party_to_mop"] = flt(1.0 / rate, 9)
+
+		same_currency = row["cheque_currency"] == bank_currency == party_currency
+		row["amount_in_company_currency"] = flt(row["paid_amount"]) * (1 if same_currency else (rate or 1))
+
+		# Mirrors the first_beneficiary handlers of the form.
+		if row.get("first_beneficiary"):
+			beneficiary, issuer = (doc.company, row["party_name"]) if is_receive else (row["party_name"], doc.company)
+			row["person_name"] = row.get("person_name") or beneficiary
+			row["issuer_name"] = row.get("issuer_name") or issuer
+
+	return rows
+
+
+def _get_uploaded_file_path(file):
+	"""Return the path on disk of the File named *file* (or with file URL
+	*file*) after checking that the user may read it."""
+	if file.startswith("/") or "files/" in file:
+		file_name = frappe.db.get_value("File", {"file_url": file}, "name")
+	else:
+		file_name = file
+	if not file_name:
+		frappe.throw(_("File {0} not found.").format(file))
+
+	file_doc = frappe.get_doc("File", file_name)
+	file_doc.check_permission("read")
+	return file_doc.get_full_path()
+
+
+def _iter_upload_rows(stream):
+	"""Yield the raw value rows of an uploaded .xlsx, CSV or TSV binary stream."""
+	signature = stream.read(4)
+	stream.seek(0)
+	# .xlsx files are zip archives.
+	if signature == b"PK\x03\x04":
+		return _iter_excel_rows(stream)
+	return _iter_csv_rows(stream)
+
+
+def _detect_text_encoding(stream):
+	"""Return ``utf-8-sig`` if the whole of *stream* decodes as UTF-8, else
+	Windows-1256, which older Arabic exports use.  The stream is read in
+	fixed-size blocks and rewound."""
+	decoder = codecs.getincrementaldecoder("utf-8")()
+	try:
+		for block in iter(lambda: stream.read(1 << 16), b""):
+			decoder.decode(block)
+		decoder.decode(b"", final=True)
+		encoding = "utf-8-sig"
+	except UnicodeDecodeError:
+		encoding = "cp1256"
+	stream.seek(0)
+	return encoding
+
+
+def _iter_csv_rows(stream):
+	"""Yield the rows of a delimited text file as tuples, with empty cells as
+	``None`` like openpyxl.  The delimiter (comma, tab or semicolon) is
+	sniffed from the start of the file."""
+	import csv
+
+	text = io.TextIOWrapper(stream, encoding=_detect_text_encoding(stream), newline="")
+	try:
+		dialect = csv.Sniffer().sniff(text.read(8192), delimiters=",\t;")
+	except csv.Error:
+		dialect = csv.excel
+	text.seek(0)
+
+	try:
+		for row in csv.reader(text, dialect):
+			yield tuple(value.strip() or None for value in row)
+	finally:
+		# The caller owns *stream*; don't let the wrapper close it.
+		text.detach()
+
+
+def _iter_excel_rows(stream):
+	"""Yield the value tuples of the active sheet of an .xlsx file one at a
+	time, without loading the whole workbook."""
 	try:
 		import openpyxl
 	except ImportError:
 		frappe.throw(_("openpyxl is required to upload Excel files. Please install it."))
 
-	if isinstance(file_data, str):
-		import base64
-		file_bytes = base64.b64decode(file_data)
-	else:
-		file_bytes = file_data
+	wb = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+	try:
+		yield from wb.active.iter_rows(values_only=True)
+	finally:
+		wb.close()
 
-	wb = openpyxl.load_workbook(io.BytesIO(file_bytes), data_only=True)
-	ws = wb.active
 
-	rows = list(ws.iter_rows(values_only=True))
-	if not rows:
+def _iter_cheque_rows(rows):
+	"""Map raw value rows to ``(row number, {column: value})`` using the first
+	row as headers.  Blank rows are skipped; missing required columns raise
+	before any data row is read."""
+	rows = iter(rows)
+	header_row = next(rows, None)
+	if header_row is None:
 		frappe.throw(_("Excel file is empty."))
 
-	headers = [str(h).strip() if h else "" for h in rows[0]]
-	required_cols = ["party_type", "party", "reference_no", "reference_date",
-					 "cheque_type", "paid_amount"]
-
-	missing = [c for c in required_cols if c not in headers]
+	headers = [str(h).strip() if h else "" for h in header_row]
+	missing = [c for c in REQUIRED_CHEQUE_COLUMNS if c not in headers]
 	if missing:
 		frappe.throw(_("Missing required columns: {0}").format(", ".join(missing)))
 
-	result = []
-	errors = []
-	for i, row in enumerate(rows[1:], start=2):
-		row_dict = {headers[j]: row[j] for j in range(len(headers)) if j < len(row)}
+	for i, row in enumerate(rows, start=2):
+		if not any(value not in (None, "") for value in row):
+			continue
+		yield i, {headers[j]: row[j] for j in range(len(headers)) if j < len(row)}
 
-		# Basic validation
-		for col in required_cols:
-			if not row_dict.get(col):
-				errors.append(_("Row {0}: '{1}' is required.").format(i, col))
 
-		paid_amount = row_dict.get("paid_amount")
-		if paid_amount is not None:
-			try:
-				row_dict["paid_amount"] = flt(paid_amount)
-				if row_dict["paid_amount"] <= 0:
-					errors.append(_("Row {0}: 'paid_amount' must be greater than zero.").format(i))
-			except Exception:
-				errors.append(_("Row {0}: 'paid_amount' must be a number.").format(i))
-
-		exchange_rate = row_dict.get("target_exchange_rate")
-		if exchange_rate is not None:
-			try:
-				row_dict["target_exchange_rate"] = flt(exchange_rate) or 1
-			except Exception:
-				row_dict["target_exchange_rate"] = 1
+# Uploaded columns that link to another doctype, checked for existence.
+CHEQUE_LINK_COLUMNS = {
+	"account_paid_from": "Account",
+	"account_paid_to": "Account",
+	"mode_of_payment": "Mode of Payment",
+	"cheque_currency": "Currency",
+}
+
 
-		# Convert date to string
-		ref_date = row_dict.get("reference_date")
-		if ref_date and not isinstance(ref_date, str):
-			row_dict["reference_date"] = str(ref_date.date()) if hasattr(ref_date, 'date') else str(ref_date)
+def _validate_cheque_references(rows, row_numbers):
+	"""Return ``{index: [messages]}`` for the uploaded rows that reference a
+	party, account, mode of payment or currency that does not exist.
 
-		result.append(row_dict)
+	The distinct values of each column are checked with one ``IN`` query per
+	doctype (one per party type for parties), however many rows there are.
+	"""
+	values = {}
+	for row in rows:
+		for column, doctype in CHEQUE_LINK_COLUMNS.items():
+			if row.get(column):
+				values.setdefault(doctype, set()).add(row[column])
+	existing = {doctype: _get_existing_names(doctype, names) for doctype, names in values.items()}
+	parties = _get_existing_parties((row.get("party_type"), row.get("party")) for row in rows)
 
-	if errors:
-		frappe.throw("<br>".join(errors))
+	errors = {}
+	for index, (i, row) in enumerate(zip(row_numbers, rows)):
+		row_errors = []
+		party_type, party = row.get("party_type"), row.get("party")
+		if party_type and party:
+			if party_type not in parties:
+				row_errors.append(_("Row {0}: Party Type '{1}' does not exist.").format(i, party_type))
+			elif party not in parties[party_type]:
+				row_errors.append(_("Row {0}: {1} '{2}' does not exist.").format(i, party_type, party))
 
-	return result
+		for column, doctype in CHEQUE_LINK_COLUMNS.items():
+			value = row.get(column)
+			if value and value not in existing[doctype]:
+				row_errors.append(_("Row {0}: {1} '{2}' in '{3}' does not exist.").format(i, doctype, value, column))
+		if row_errors:
+			errors[index] = row_errors
+	return errors
+
+
+# Arabic-Indic and Eastern Arabic-Indic digits, and the Arabic decimal and
+# thousands separators, as found in bank exports.
+_ARABIC_NUMERALS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹٫٬", "01234567890123456789.,")
+
+# Text date formats accepted in uploads, tried in this order.  Day-first,
+# as written in Egypt; ISO dates are tried first.
+CHEQUE_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d/%m/%y")
+
+# Day 0 of Excel's serial date numbers (which count 1900 as a leap year).
+_EXCEL_EPOCH = datetime.date(1899, 12, 30)
+
+# Serial numbers read as dates must fall in this range, so a bare year
+# such as "2024" is not taken for a day in 1905.
+_CHEQUE_SERIAL_DATES = (datetime.date(1990, 1, 1), datetime.date(2100, 1, 1))
+
+# A number whose commas are thousands separators ("1,250.50").  Any other
+# comma, such as a decimal comma in "1500,50", makes the value invalid.
+_THOUSANDS_NUMBER = re.compile(r"^[-+]?\d{1,3}(,\d{3})+(\.\d+)?$")
+
+
+def _normalise_cheque_columns(rows, row_numbers, errors):
+	"""Validate and normalise uploaded *rows* in place, a column at a time,
+	appending problems to the matching list in *errors*.
+
+	Dates become ``YYYY-MM-DD`` strings whether they arrive as dates, Excel
+	serial numbers or text in any of :data:`CHEQUE_DATE_FORMATS`; amounts
+	and rates are parsed from text with Arabic digits and thousands
+	separators.  The text format that matched is remembered per column and
+	tried first for the next value, so a file costs one ``strptime`` per
+	date in the usual case.
+	"""
+	for col in REQUIRED_CHEQUE_COLUMNS:
+		for i, row, row_errors in zip(row_numbers, rows, errors):
+			if not row.get(col):
+				row_errors.append(_("Row {0}: '{1}' is required.").format(i, col))
+
+	for i, row, row_errors in zip(row_numbers, rows, errors):
+		paid_amount = row.get("paid_amount")
+		if paid_amount is None:
+			continue
+		try:
+			row["paid_amount"] = _parse_cheque_number(paid_amount)
+		except ValueError:
+			row_errors.append(_("Row {0}: 'paid_amount' must be a number.").format(i))
+			continue
+		if row["paid_amount"] <= 0:
+			row_errors.append(_("Row {0}: 'paid_amount' must be greater than zero.").format(i))
+
+	for i, row, row_errors in zip(row_numbers, rows, errors):
+		exchange_rate = row.get("target_exchange_rate")
+		if exchange_rate is None:
+			continue
+		try:
+			row["target_exchange_rate"] = _parse_cheque_number(exchange_rate) or 1
+		except ValueError:
+			row_errors.append(_("Row {0}: 'target_exchange_rate' must be a number.").format(i))
+
+	date_formats = {}
+	for i, row, row_errors in zip(row_numbers, rows, errors):
+		ref_date = row.get("reference_date")
+		if not ref_date:
+			continue
+		parsed = _parse_cheque_date(ref_date, date_formats, "reference_date")
+		if parsed is None:
+			row_errors.append(_("Row {0}: 'reference_date' {1} is not a valid date.").format(i, ref_date))
+		else:
+			row["reference_date"] = parsed.isoformat()
+
+
+def _parse_cheque_number(value):
+	"""Return *value* as a float, reading Arabic digits and thousands
+	separators in text.  Blank text is 0; anything else unreadable, or not
+	finite, raises ValueError."""
+	if isinstance(value, (int, float)):
+		number = float(value)
+	else:
+		text = str(value).translate(_ARABIC_NUMERALS).replace("\u00a0", "").strip()
+		if "," in text:
+			if not _THOUSANDS_NUMBER.match(text):
+				raise ValueError(value)
+			text = text.replace(",", "")
+		number = float(text) if text else 0.0
+	if not math.isfinite(number):
+		raise ValueError(value)
+	return number
+
+
+def _parse_cheque_date(value, date_formats, column):
+	"""Return *value* as a ``datetime.date``, or None if it is not a date.
+	*date_formats* maps a column to the text format it last matched."""
+	if isinstance(value, datetime.datetime):
+		return value.date()
+	if isinstance(value, datetime.date):
+		return value
+	if isinstance(value, (int, float)):
+		return _excel_serial_date(value)
+
+	text = str(value).translate(_ARABIC_NUMERALS).strip()
+	if text.replace(".", "", 1).isdigit():
+		return _excel_serial_date(float(text))
+	# Drop a time part ("2024-01-15 00:00:00").
+	text = text.split(" ")[0]
+
+	last = date_formats.get(column)
+	for fmt in ((last,) if last else ()) + CHEQUE_DATE_FORMATS:
+		try:
+			parsed = datetime.datetime.strptime(text, fmt).date()
+		except ValueError:
+			continue
+		date_formats[column] = fmt
+		return parsed
+	return None
+
+
+def _excel_serial_date(serial):
+	"""Return the date of an Excel serial day number, or None if it falls
+	outside :data:`_CHEQUE_SERIAL_DATES`."""
+	start, end = _CHEQUE_SERIAL_DATES
+	if not math.isfinite(serial) or not (start - _EXCEL_EPOCH).days <= serial < (end - _EXCEL_EPOCH).days:
+		return None
+	return _EXCEL_EPOCH + datetime.timedelta(days=int(serial))
@@ -45,8 +45,25 @@ def _make_frappe_stub():
 	import unittest.mock as _m
 	mod.get_cached_value = _m.MagicMock()
 	mod.get_all = _m.MagicMock(return_value=[])
+	mod.conf = {}
+	mod.enqueue = _m.MagicMock()
+	mod.publish_realtime = _m.MagicMock()
+	mod.cache = lambda: _NullCache()
 	return mod
 
+
+class _NullCache:
+	"""frappe.cache() that keeps nothing, so every test reads its own stubs."""
+
+	def hget(self, name, key, generator=None):
+		return generator() if generator else None
+
+	def hset(self, name, key, value):
+		pass
+
+	def hdel(self, name, key):
+		pass
+
 _frappe = _make_frappe_stub()
 sys.modules.setdefault("frappe", _frappe)
 sys.modules.setdefault("frappe.model", types.ModuleType("frappe.model"))
@@ -68,6 +85,7 @@ def _flt(val, precision=None):
 	return round(v, precision) if precision is not None else v
 
 _utils.flt = _flt
+_utils.cint = lambda val: int(_flt(val))
 _utils.nowdate = lambda: "2024-01-01"
 import unittest.mock as _mock
 for _attr in ("getdate", "get_url", "now", "nowtime", "get_time", "today",
@@ -76,10 +94,20 @@ for _attr in ("getdate", "get_url", "now", "nowtime", "get_time", "today",
 sys.modules["frappe.utils"] = _utils
 
 # Now import the functions under test.
+from ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry import multiple_cheque_entry as _mce  # noqa: E402
 from ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry import (  # noqa: E402
 	_compute_payment_entry_amounts,
+	_compute_payment_entry_amounts_batch,
 	_get_account_currency_db,
+	MultipleChequeEntry,
+	append_uploaded_cheques,
+	cancel_multiple_cheque_entry,
+	create_payment_entries,
 	create_payment_entry_from_cheque,
+	export_cheques_excel,
+	get_cheques_excel_template,
+	preview_payment_entries,
+	upload_cheques_excel,
 )
 
 
@@ -228,6 +256,75 @@ class TestComputePaymentEntryAmounts(unittest.TestCase):
 			msg="source_exchange_rate must not default to 1 for a foreign paid_from account")
 
 
+# ---------------------------------------------------------------------------
+# Columnar batch: _compute_payment_entry_amounts_batch
+# ---------------------------------------------------------------------------
+
+try:
+	import numpy  # noqa: F401
+	_HAS_NUMPY = True
+except ImportError:
+	_HAS_NUMPY = False
+
+
+class TestComputePaymentEntryAmountsBatch(unittest.TestCase):
+	"""The batch API must reproduce the scalar reference implementation exactly."""
+
+	_KEYS = ("paid_amount", "received_amount", "source_exchange_rate", "target_exchange_rate")
+
+	def _columns(self):
+		import random
+		rng = random.Random(42)
+		currencies = ["ILS", "USD", "JOD", "EGP"]
+		amounts, froms, tos, companies, rates, types = [], [], [], [], [], []
+		for _i in range(500):
+			amounts.append(rng.choice([0, None, "1500.5", round(rng.uniform(1, 1e6), 2)]))
+			froms.append(rng.choice(currencies))
+			tos.append(rng.choice(currencies))
+			companies.append(rng.choice(currencies[:2]))
+			rates.append(rng.choice([0, None, 1, 3.159059, rng.uniform(0.0001, 500)]))
+			types.append(rng.choice(["Receive", "Pay"]))
+		return amounts, froms, tos, companies, rates, types
+
+	def _assert_matches_scalar(self, columns, result):
+		for i, args in enumerate(zip(*columns)):
+			expected = _compute_payment_entry_amounts(*args)
+			for key in self._KEYS:
+				self.assertEqual(result[key][i], expected[key],
+					msg="row {0} {1}: args={2}".format(i, key, args))
+
+	def test_python_fallback_matches_scalar(self):
+		columns = self._columns()
+		real_import = __import__
+
+		def _no_numpy(name, *args, **kwargs):
+			if name == "numpy":
+				raise ImportError(name)
+			return real_import(name, *args, **kwargs)
+
+		from unittest.mock import patch
+		with patch("builtins.__import__", _no_numpy):
+			result = _compute_payment_entry_amounts_batch(*columns)
+		self._assert_matches_scalar(columns, result)
+
+	@unittest.skipUnless(_HAS_NUMPY, "NumPy not installed")
+	def test_numpy_path_matches_scalar(self):
+		columns = self._columns()
+		self._assert_matches_scalar(columns, _compute_payment_entry_amounts_batch(*columns))
+
+	def test_single_company_currency_is_broadcast(self):
+		result = _compute_payment_entry_amounts_batch(
+			[1000.0, 1000.0], ["ILS", "USD"], ["USD", "ILS"], "ILS",
+			[3.159059, 3.159059], ["Receive", "Pay"],
+		)
+		self.assertAlmostEqual(result["paid_amount"][0], 3159.059, places=3)
+		self.assertAlmostEqual(result["received_amount"][1], 3159.059, places=3)
+
+	def test_empty_input(self):
+		result = _compute_payment_entry_amounts_batch([], [], [], "ILS", [], [])
+		self.assertEqual(result, {key: [] for key in self._KEYS})
+
+
 # ---------------------------------------------------------------------------
 # Tests for the DB-fetch path: create_payment_entry_from_cheque(docname, row_id)
 # ---------------------------------------------------------------------------
@@ -243,14 +340,74 @@ class _Row:
 
 
 class _Doc:
-	"""Minimal parent-document stub."""
+	"""Minimal parent-document stub.  Permission types listed in
+	``denied_permissions`` make ``check_permission`` raise."""
 	def __init__(self, **kwargs):
+		self.denied_permissions = ()
 		for k, v in kwargs.items():
 			setattr(self, k, v)
 
 	def get(self, key, default=None):
 		return getattr(self, key, default)
 
+	def check_permission(self, ptype):
+		if ptype in self.denied_permissions:
+			raise Exception("Not permitted to {0}".format(ptype))
+
+
+def _get_all_via_db_stub(frappe_mod):
+	"""Answer the batched ``frappe.get_all("Account", ...)`` currency query
+	from the test's ``frappe.db.get_value`` stub."""
+	def _get_all(doctype, filters=None, fields=None, as_list=False, **kwargs):
+		if doctype != "Account":
+			return []
+		return [
+			(name, frappe_mod.db.get_value("Account", name, "account_currency"))
+			for name in filters["name"][1]
+		]
+	return _get_all
+
+
+def _existing_names_get_all(missing=()):
+	"""``frappe.get_all`` stub for ``name IN`` existence checks: every
+	requested name exists except those in *missing*."""
+	def _get_all(doctype, filters=None, **kwargs):
+		if "name" not in filters:
+			return []
+		return [name for name in filters["name"][1] if name not in missing]
+	return _get_all
+
+
+def _patch_company_settings(test, **settings):
+	"""Serve the Company cheque settings from *settings* for one test."""
+	patcher = _mock.patch.object(_mce, "get_company_cheque_settings", lambda company: dict(settings))
+	patcher.start()
+	test.addCleanup(patcher.stop)
+
+
+def _patch_saved_files(test, get_doc=None):
+	"""Patch frappe so that File documents built by the upload are recorded in
+	``test.saved_files`` instead of being inserted; other ``get_doc`` calls
+	go to *get_doc*."""
+	import sys
+	test.saved_files = []
+
+	class _File(dict):
+		def insert(self, ignore_permissions=False):
+			self.file_url = "/private/files/" + self["file_name"]
+			test.saved_files.append(self)
+			return self
+
+	def _get_doc(doctype, name=None):
+		if isinstance(doctype, dict):
+			return _File(doctype)
+		return get_doc(doctype, name)
+
+	for attr, value in (("get_doc", _get_doc), ("generate_hash", lambda length=None: "abcd1234")):
+		patcher = _mock.patch.object(sys.modules["frappe"], attr, value, create=True)
+		patcher.start()
+		test.addCleanup(patcher.stop)
+
 
 class TestCreatePaymentEntryFromCheque(unittest.TestCase):
 	"""Verify create_payment_entry_from_cheque builds the correct Payment Entry dict.
@@ -335,8 +492,6 @@ class TestCreatePaymentEntryFromCheque(unittest.TestCase):
 		# Mock db
 		class _DB:
 			def get_value(self, doctype, name, field):
-				if doctype == "Company":
-					return "ILS"
 				if doctype == "Account":
 					if name == "ILS-Receivable":
 						return "ILS"
@@ -348,6 +503,8 @@ class TestCreatePaymentEntryFromCheque(unittest.TestCase):
 				self._set_values.append((doctype, name, field, value))
 
 		self._frappe.db = _DB()
+		_patch_company_settings(self, default_currency="ILS")
+		self._frappe.get_all = _get_all_via_db_stub(self._frappe)
 		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
 
 	def test_receive_db_fetch_amounts(self):
@@ -527,8 +684,6 @@ class TestExchangeRatePartyToMop(unittest.TestCase):
 
 		class _DB:
 			def get_value(self, doctype, name, field):
-				if doctype == "Company":
-					return "USD"
 				if doctype == "Account":
 					if name == "ILS-Receivable":
 						return "ILS"
@@ -540,6 +695,8 @@ class TestExchangeRatePartyToMop(unittest.TestCase):
 				self._set_values.append((doctype, name, field, value))
 
 		self._frappe.db = _DB()
+		_patch_company_settings(self, default_currency="USD")
+		self._frappe.get_all = _get_all_via_db_stub(self._frappe)
 		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
 
 	def test_party_to_mop_used_as_source_exchange_rate(self):
@@ -656,8 +813,6 @@ class TestUsdToUsdSameCurrency(unittest.TestCase):
 
 		class _DB:
 			def get_value(self, doctype, name, field):
-				if doctype == "Company":
-					return "USD"
 				if doctype == "Account":
 					if name in ("USD-Receivable", "USD-Wallet"):
 						return "USD"
@@ -667,6 +822,8 @@ class TestUsdToUsdSameCurrency(unittest.TestCase):
 				self._set_values.append((doctype, name, field, value))
 
 		self._frappe.db = _DB()
+		_patch_company_settings(self, default_currency="USD")
+		self._frappe.get_all = _get_all_via_db_stub(self._frappe)
 		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
 
 	def test_paid_amount_equals_cheque_amount(self):
@@ -782,8 +939,6 @@ class TestJodChequeUsdAccounts(unittest.TestCase):
 
 		class _DB:
 			def get_value(self, doctype, name, field):
-				if doctype == "Company":
-					return "USD"
 				if doctype == "Account":
 					if name in ("USD-Receivable", "USD-Wallet"):
 						return "USD"
@@ -793,6 +948,8 @@ class TestJodChequeUsdAccounts(unittest.TestCase):
 				self._set_values.append((doctype, name, field, value))
 
 		self._frappe.db = _DB()
+		_patch_company_settings(self, default_currency="USD")
+		self._frappe.get_all = _get_all_via_db_stub(self._frappe)
 		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
 
 	def test_paid_amount_is_usd_equivalent(self):
@@ -924,8 +1081,6 @@ class TestJodToUsdCrossAccountReceive(unittest.TestCase):
 
 		class _DB:
 			def get_value(self, doctype, name, field):
-				if doctype == "Company":
-					return "USD"
 				if doctype == "Account":
 					if name == "USD-Receivable":
 						return "USD"
@@ -937,6 +1092,8 @@ class TestJodToUsdCrossAccountReceive(unittest.TestCase):
 				self._set_values.append((doctype, name, field, value))
 
 		self._frappe.db = _DB()
+		_patch_company_settings(self, default_currency="USD")
+		self._frappe.get_all = _get_all_via_db_stub(self._frappe)
 		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
 
 	def test_source_exchange_rate_is_one(self):
@@ -993,3 +1150,1161 @@ class TestJodToUsdCrossAccountReceive(unittest.TestCase):
 			places=3,
 			msg="exchange_rate_party_to_mop must not be used as source_exchange_rate "
 			"when paid_from = company currency")
+
+
+# ---------------------------------------------------------------------------
+# Bulk creation: create_payment_entries(docname)
+# ---------------------------------------------------------------------------
+
+class TestCreatePaymentEntries(unittest.TestCase):
+	"""create_payment_entries processes every unlinked row in one call and
+	reports per-row outcomes without aborting the batch on a bad row."""
+
+	def _make_row(self, name, idx, payment_entry=None, paid_amount=100.0):
+		return _Row(
+			name=name,
+			idx=idx,
+			account_paid_from="ILS-Receivable",
+			account_paid_to="ILS-Wallet",
+			paid_amount=paid_amount,
+			amount_in_company_currency=paid_amount,
+			target_exchange_rate=1.0,
+			exchange_rate_party_to_mop=0,
+			cheque_currency="ILS",
+			mode_of_payment="Cheque",
+			party_type="Customer",
+			party="CUST-001",
+			cheque_type="Crossed",
+			reference_no="CHQ-" + name,
+			reference_date="2024-01-15",
+			first_beneficiary="Company",
+			person_name="Test",
+			issuer_name="Test",
+			picture_of_check=None,
+			bank="National Bank",
+			payment_entry=payment_entry,
+		)
+
+	def setUp(self):
+		import sys
+		self._frappe = sys.modules["frappe"]
+		self._inserted = []
+		self._rollbacks = []
+		self._savepoints = []
+
+		self.rows = [
+			self._make_row("ROW-A", 1),
+			self._make_row("ROW-B", 2, payment_entry="PE-EXISTING"),
+			self._make_row("ROW-C", 3, paid_amount=-1),
+			self._make_row("ROW-D", 4),
+		]
+		doc = _Doc(
+			name="MCE-BULK",
+			docstatus=1,
+			company="Test Co",
+			payment_type="Receive",
+			posting_date="2024-01-15",
+			mode_of_payment="Cheque",
+			mode_of_payment_type="Cheque",
+			cheque_bank="National Bank",
+			bank_acc="Bank-ILS",
+			cheque_table=self.rows,
+			cheque_table_2=[],
+		)
+		self.doc = doc
+
+		class _FakePE:
+			def __init__(inner_self, d):
+				inner_self.__dict__.update(d)
+				inner_self.name = "PE-" + d["cheque_table_no"]
+				inner_self.flags = type("F", (), {"ignore_permissions": False})()
+
+			def insert(inner_self):
+				if inner_self.paid_amount <= 0:
+					raise Exception("Paid Amount must be positive")
+				self._inserted.append(inner_self.name)
+
+			def submit(inner_self):
+				pass
+
+		def _get_doc(arg, *rest):
+			if arg == "Multiple Cheque Entry":
+				return doc
+			return _FakePE(arg)
+
+		self._frappe.get_doc = _get_doc
+		self._frappe.clear_last_message = lambda: None
+
+		test = self
+
+		class _DB:
+			def get_value(self, doctype, name, field):
+				if doctype == "Account":
+					return "ILS"
+				return None
+
+			def set_value(self, doctype, name, field, value):
+				pass
+
+			def savepoint(self, name):
+				test._savepoints.append(name)
+
+			def rollback(self, save_point=None):
+				test._rollbacks.append(save_point)
+
+			def sql(self, query, values=None):
+				return []
+
+		self._frappe.db = _DB()
+		_patch_company_settings(self, default_currency="ILS")
+		self._frappe.get_all = _get_all_via_db_stub(self._frappe)
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+
+	def test_skips_linked_rows(self):
+		results = create_payment_entries("MCE-BULK")["results"]
+		self.assertNotIn("ROW-B", [r["row_id"] for r in results])
+		self.assertEqual(len(results), 3)
+
+	def test_failed_row_does_not_abort_batch(self):
+		results = {r["row_id"]: r for r in create_payment_entries("MCE-BULK")["results"]}
+		self.assertEqual(results["ROW-A"]["payment_entry"], "PE-ROW-A")
+		self.assertEqual(results["ROW-D"]["payment_entry"], "PE-ROW-D")
+		self.assertIsNone(results["ROW-C"]["payment_entry"])
+		self.assertIn("Paid Amount", results["ROW-C"]["error"])
+		self.assertEqual(self._inserted, ["PE-ROW-A", "PE-ROW-D"])
+
+	def test_failed_row_rolled_back_to_its_savepoint(self):
+		create_payment_entries("MCE-BULK")
+		self.assertEqual(len(self._savepoints), 3)
+		self.assertEqual(len(self._rollbacks), 1)
+
+	def test_requires_submitted_document(self):
+		self.doc.docstatus = 0
+		with self.assertRaises(Exception):
+			create_payment_entries("MCE-BULK")
+
+	def test_requires_submit_permission(self):
+		self.doc.denied_permissions = ("submit",)
+		with self.assertRaises(Exception):
+			create_payment_entries("MCE-BULK")
+		self.assertEqual(self._inserted, [])
+
+	def test_runs_inline_below_threshold(self):
+		res = create_payment_entries("MCE-BULK")
+		self.assertEqual(res["queued"], 0)
+		self.assertEqual(res["total"], 3)
+
+	def test_large_batch_is_enqueued(self):
+		from unittest.mock import MagicMock, patch
+		enqueue = MagicMock()
+		with patch.object(self._frappe, "enqueue", enqueue, create=True), \
+				patch.object(self._frappe, "conf", {"ecs_cheques_background_threshold": 2}, create=True):
+			res = create_payment_entries("MCE-BULK")
+		self.assertEqual(res, {"queued": 1, "total": 3, "results": []})
+		self.assertEqual(self._inserted, [], "no Payment Entry may be created inline")
+		self.assertEqual(enqueue.call_args.kwargs["queue"], "long")
+		self.assertEqual(enqueue.call_args.kwargs["docname"], "MCE-BULK")
+
+	def test_background_job_commits_per_chunk_and_reports_progress(self):
+		from unittest.mock import MagicMock, patch
+		from ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry import (
+			_create_payment_entries_job,
+		)
+		commits = []
+		self._frappe.db.commit = lambda: commits.append(1)
+		publish = MagicMock()
+		with patch.object(self._frappe, "publish_realtime", publish, create=True):
+			_create_payment_entries_job("MCE-BULK", chunk_size=2)
+		self.assertEqual(len(commits), 2)
+		progress = [c.args[1]["progress"] for c in publish.call_args_list]
+		self.assertEqual(progress, [2, 3])
+		self.assertTrue(publish.call_args_list[-1].args[1]["done"])
+
+	def test_parent_and_company_currency_loaded_once(self):
+		calls = {"parent": 0, "company": 0}
+		get_doc = self._frappe.get_doc
+
+		def _counting_get_doc(arg, *rest):
+			if arg == "Multiple Cheque Entry":
+				calls["parent"] += 1
+			return get_doc(arg, *rest)
+
+		def _counting_settings(company):
+			calls["company"] += 1
+			return {"default_currency": "ILS"}
+
+		self._frappe.get_doc = _counting_get_doc
+		with _mock.patch.object(_mce, "get_company_cheque_settings", _counting_settings):
+			create_payment_entries("MCE-BULK")
+		self.assertEqual(calls, {"parent": 1, "company": 1})
+
+	def test_account_currencies_fetched_with_one_query(self):
+		queries = []
+
+		def _counting_get_all(doctype, *args, **kwargs):
+			if doctype != "Account":
+				return []
+			names = kwargs["filters"]["name"][1]
+			queries.append(sorted(names))
+			return [(name, "ILS") for name in names]
+
+		def _no_account_get_value(doctype, name, field):
+			self.assertNotEqual(doctype, "Account", "account currency must come from the prefetched map")
+			return "ILS"
+
+		self._frappe.get_all = _counting_get_all
+		self._frappe.db.get_value = _no_account_get_value
+		create_payment_entries("MCE-BULK")
+		self.assertEqual(queries, [["ILS-Receivable", "ILS-Wallet"]])
+
+	def _install_existing_payment_entries(self, existing):
+		"""Answer the Payment Entry idempotency query with *existing* rows of
+		``(cheque_table_no, name, docstatus)`` and record each query."""
+		self.pe_queries = []
+		account_get_all = self._frappe.get_all
+
+		def _get_all(doctype, *args, **kwargs):
+			if doctype != "Payment Entry":
+				return account_get_all(doctype, *args, **kwargs)
+			self.pe_queries.append(kwargs["filters"])
+			names = kwargs["filters"]["cheque_table_no"][1]
+			return [row for row in existing if row[0] in names]
+
+		self._frappe.get_all = _get_all
+
+	def test_unlinked_payment_entry_is_relinked_not_duplicated(self):
+		self._install_existing_payment_entries([("ROW-A", "PE-ORPHAN", 1)])
+		results = {r["row_id"]: r for r in create_payment_entries("MCE-BULK")["results"]}
+		self.assertEqual(results["ROW-A"]["payment_entry"], "PE-ORPHAN")
+		self.assertEqual(self.rows[0].payment_entry, "PE-ORPHAN")
+		self.assertEqual(self._inserted, ["PE-ROW-D"])
+
+	def test_orphan_draft_is_submitted_and_relinked(self):
+		submitted = []
+
+		class _DraftPE:
+			name = "PE-DRAFT"
+			flags = type("F", (), {"ignore_permissions": False})()
+
+			def submit(inner_self):
+				submitted.append(inner_self.name)
+
+		get_doc = self._frappe.get_doc
+		self._frappe.get_doc = lambda arg, *rest: _DraftPE() if rest == ("PE-DRAFT",) else get_doc(arg, *rest)
+		self._install_existing_payment_entries([("ROW-D", "PE-DRAFT", 0)])
+		results = {r["row_id"]: r for r in create_payment_entries("MCE-BULK")["results"]}
+		self.assertEqual(results["ROW-D"]["payment_entry"], "PE-DRAFT")
+		self.assertEqual(submitted, ["PE-DRAFT"])
+		self.assertEqual(self._inserted, ["PE-ROW-A"])
+
+	def test_existing_payment_entries_checked_with_one_query(self):
+		self._install_existing_payment_entries([])
+		create_payment_entries("MCE-BULK")
+		self.assertEqual(len(self.pe_queries), 1)
+		self.assertEqual(self.pe_queries[0]["reference_link"], "MCE-BULK")
+		self.assertEqual(sorted(self.pe_queries[0]["cheque_table_no"][1]), ["ROW-A", "ROW-C", "ROW-D"])
+
+
+class TestPreviewPaymentEntries(unittest.TestCase):
+	"""preview_payment_entries validates a draft batch set-wise and reports
+	the amounts creation would post, without creating anything."""
+
+	_make_row = TestCreatePaymentEntries._make_row
+
+	def setUp(self):
+		TestCreatePaymentEntries.setUp(self)
+		self.doc.docstatus = 0
+		self.rows[1].payment_entry = None
+		self.rows[1].party = "CUST-MISSING"
+		self.rows[3].account_paid_to = "Missing-Wallet"
+		self.queries = []
+		existing = {
+			"Party Type": {"Customer", "Supplier"},
+			"Customer": {"CUST-001"},
+			"Mode of Payment": {"Cheque"},
+		}
+		account_get_all = self._frappe.get_all
+
+		def _get_all(doctype, filters=None, fields=None, as_list=False, pluck=None, **kwargs):
+			self.queries.append(doctype)
+			if doctype == "Account":
+				return [
+					row for row in account_get_all(doctype, filters=filters, fields=fields, as_list=as_list)
+					if row[0] != "Missing-Wallet"
+				]
+			if doctype == "Payment Entry":
+				return []
+			return [name for name in filters["name"][1] if name in existing.get(doctype, ())]
+
+		self._frappe.get_all = _get_all
+
+	def test_requires_read_permission(self):
+		self.doc.denied_permissions = ("read",)
+		with self.assertRaises(Exception):
+			preview_payment_entries("MCE-BULK")
+		self.assertEqual(self.queries, [])
+
+	def test_reports_all_row_errors_in_one_pass(self):
+		res = preview_payment_entries("MCE-BULK")
+		self.assertFalse(res["valid"])
+		self.assertEqual(len(res["rows"]), 4)
+		errors = {row["row_id"]: row["errors"] for row in res["rows"]}
+		self.assertEqual(errors["ROW-A"], [])
+		self.assertIn("Customer CUST-MISSING does not exist", errors["ROW-B"])
+		self.assertIn("Paid Amount must be greater than zero", errors["ROW-C"])
+		self.assertIn("Account Paid To Missing-Wallet does not exist", errors["ROW-D"])
+		self.assertEqual(len(res["errors"]), 3)
+		self.assertTrue(res["errors"][0].startswith("Row 2: "))
+
+	def test_one_query_per_doctype(self):
+		preview_payment_entries("MCE-BULK")
+		self.assertEqual(
+			sorted(self.queries), ["Account", "Customer", "Mode of Payment", "Party Type", "Payment Entry"]
+		)
+
+	def test_returns_amounts_and_totals_without_creating(self):
+		res = preview_payment_entries("MCE-BULK")
+		row = res["rows"][0]
+		self.assertEqual(row["paid_amount"], 100.0)
+		self.assertEqual(row["received_amount"], 100.0)
+		self.assertEqual(row["source_exchange_rate"], 1.0)
+		self.assertEqual(res["totals"], {"ILS": 299.0})
+		self.assertEqual(self._inserted, [])
+		self.assertEqual(self._savepoints, [])
+
+	def test_missing_exchange_rate_is_reported(self):
+		self._frappe.db.get_value = lambda doctype, name, field: (
+			"USD" if name == "ILS-Wallet" else "ILS"
+		)
+		self.rows[0].target_exchange_rate = 0
+		res = preview_payment_entries("MCE-BULK")
+		self.assertIn("Row 1: Cannot create Payment Entry", res["errors"][0])
+
+
+class TestCancelMultipleChequeEntry(unittest.TestCase):
+	"""Cancelling a Multiple Cheque Entry cancels each Payment Entry after its
+	cheque Journal Entries, inline for small batches and in a background job
+	for large ones."""
+
+	def setUp(self):
+		import sys
+		self._frappe = sys.modules["frappe"]
+		self._saved = {attr: getattr(self._frappe, attr) for attr in ("db", "get_doc", "get_all")}
+		self.cancelled = []
+		self.commits = []
+		self.rollbacks = []
+		self.queries = []
+		self.failing = set()
+		self.pe_names = ["PE-1", "PE-2", "PE-3"]
+		# (Journal Entry, Payment Entry, creation) by reference_link ...
+		self.journal_entries = [("JE-2A", "PE-2", 1), ("JE-2B", "PE-2", 3), ("JE-3A", "PE-3", 1)]
+		# ... and by the cheque_payment_entry of consolidated entries' lines.
+		self.consolidated = []
+		# (reversal, Journal Entry, Payment Entry) posted by reverse_cheque_lines.
+		self.reversals = []
+		test = self
+
+		class _Cancellable:
+			def __init__(inner_self, doctype, name):
+				inner_self.doctype = doctype
+				inner_self.name = name
+				inner_self.docstatus = 2 if name in test.cancelled else 1
+				inner_self.denied_permissions = ()
+
+			def check_permission(inner_self, ptype):
+				if ptype in inner_self.denied_permissions:
+					raise Exception("Not permitted to {0}".format(ptype))
+
+			def cancel(inner_self):
+				if inner_self.name in test.failing:
+					raise Exception("cannot cancel " + inner_self.name)
+				test.cancelled.append(inner_self.name)
+
+		self.parent = _Cancellable("Multiple Cheque Entry", "MCE-CANCEL")
+
+		def _get_doc(doctype, name):
+			if doctype == "Multiple Cheque Entry":
+				return self.parent
+			return _Cancellable(doctype, name)
+
+		def _get_all(doctype, filters=None, **kwargs):
+			self.queries.append(doctype)
+			if doctype == "Payment Entry":
+				return list(self.pe_names)
+			if doctype == "Journal Entry" and "reversal_of" in filters:
+				return [row for row in self.reversals if row[1] in filters["reversal_of"][1]]
+			if doctype == "Journal Entry":
+				names = filters["reference_link"][1]
+				return [row for row in self.journal_entries if row[1] in names]
+			return []
+
+		class _DB:
+			def savepoint(self, name):
+				pass
+
+			def rollback(self, save_point=None):
+				test.rollbacks.append(save_point)
+
+			def commit(self):
+				test.commits.append(1)
+
+			def sql(self, query, values=None):
+				test.queries.append("Journal Entry Account")
+				covering = set(row[0] for row in test.consolidated if row[1] in values["pe_names"])
+				return [row for row in test.consolidated if row[0] in covering]
+
+		self._frappe.get_doc = _get_doc
+		self._frappe.get_all = _get_all
+		self._frappe.db = _DB()
+		self._frappe.clear_last_message = lambda: None
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+
+	def tearDown(self):
+		# The frappe stub is shared with the Payment Entry tests.
+		for attr, value in self._saved.items():
+			setattr(self._frappe, attr, value)
+
+	def test_on_cancel_cancels_journal_entries_before_payment_entry(self):
+		doc = MultipleChequeEntry()
+		doc.name = "MCE-CANCEL"
+		doc.on_cancel()
+		self.assertEqual(self.cancelled, ["PE-1", "JE-2B", "JE-2A", "PE-2", "JE-3A", "PE-3"])
+		self.assertEqual(self.queries, ["Payment Entry", "Journal Entry", "Journal Entry Account"])
+
+	def test_consolidated_journal_entry_cancelled_once_before_its_cheques(self):
+		self.consolidated = [("JE-X", "PE-1", 2), ("JE-X", "PE-2", 2), ("JE-X", "PE-3", 2)]
+		doc = MultipleChequeEntry()
+		doc.name = "MCE-CANCEL"
+		doc.on_cancel()
+		self.assertEqual(self.cancelled, ["JE-X", "PE-1", "JE-2B", "JE-2A", "PE-2", "JE-3A", "PE-3"])
+
+	def test_shared_consolidated_entry_reversed_per_cheque(self):
+		from unittest.mock import patch
+		# JE-X also covers PE-9 from another batch, and PE-3 is already reversed in it.
+		self.consolidated = [("JE-X", "PE-1", 2), ("JE-X", "PE-3", 2), ("JE-X", "PE-9", 2)]
+		self.reversals = [("JE-R", "JE-X", "PE-3")]
+		reversed_lines = []
+		doc = MultipleChequeEntry()
+		doc.name = "MCE-CANCEL"
+		with patch.object(_mce, "reverse_cheque_lines", lambda je, pe: reversed_lines.append((je, pe))):
+			doc.on_cancel()
+		self.assertEqual(reversed_lines, [("JE-X", "PE-1")])
+		self.assertNotIn("JE-X", self.cancelled)
+		self.assertEqual(self.cancelled, ["PE-1", "JE-2B", "JE-2A", "PE-2", "JE-3A", "PE-3"])
+
+	def test_small_batch_cancels_inline(self):
+		from unittest.mock import MagicMock, patch
+		enqueue = MagicMock()
+		with patch.object(self._frappe, "enqueue", enqueue, create=True):
+			res = cancel_multiple_cheque_entry("MCE-CANCEL")
+		self.assertEqual(res, {"queued": 0, "total": 3})
+		self.assertEqual(self.cancelled, ["MCE-CANCEL"])
+		enqueue.assert_not_called()
+
+	def test_requires_cancel_permission(self):
+		from unittest.mock import MagicMock, patch
+		self.parent.denied_permissions = ("cancel",)
+		enqueue = MagicMock()
+		with patch.object(self._frappe, "enqueue", enqueue, create=True), \
+				patch.object(self._frappe, "conf", {"ecs_cheques_background_threshold": 2}, create=True):
+			with self.assertRaises(Exception):
+				cancel_multiple_cheque_entry("MCE-CANCEL")
+		enqueue.assert_not_called()
+		self.assertEqual(self.cancelled, [])
+		self.assertEqual(self.queries, [])
+
+	def test_large_batch_is_enqueued(self):
+		from unittest.mock import MagicMock, patch
+		enqueue = MagicMock()
+		with patch.object(self._frappe, "enqueue", enqueue, create=True), \
+				patch.object(self._frappe, "conf", {"ecs_cheques_background_threshold": 2}, create=True):
+			res = cancel_multiple_cheque_entry("MCE-CANCEL")
+		self.assertEqual(res, {"queued": 1, "total": 3})
+		self.assertEqual(self.cancelled, [])
+		self.assertEqual(enqueue.call_args.kwargs["queue"], "long")
+
+	def test_job_cancels_children_in_chunks_then_parent(self):
+		from unittest.mock import MagicMock, patch
+		from ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry import (
+			_cancel_payment_entries_job,
+		)
+		publish = MagicMock()
+		with patch.object(self._frappe, "publish_realtime", publish, create=True):
+			_cancel_payment_entries_job("MCE-CANCEL", chunk_size=2)
+		self.assertEqual(self.cancelled[-1], "MCE-CANCEL")
+		self.assertEqual(len(self.commits), 3)
+		payloads = [c.args[1] for c in publish.call_args_list]
+		self.assertEqual([p["progress"] for p in payloads], [2, 3, 3])
+		self.assertTrue(payloads[-1]["done"])
+		self.assertTrue(payloads[-1]["cancelled"])
+
+	def test_job_leaves_parent_submitted_when_a_child_fails(self):
+		from unittest.mock import MagicMock, patch
+		from ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry import (
+			_cancel_payment_entries_job,
+		)
+		self.failing.add("JE-2A")
+		publish = MagicMock()
+		with patch.object(self._frappe, "publish_realtime", publish, create=True):
+			_cancel_payment_entries_job("MCE-CANCEL")
+		self.assertNotIn("MCE-CANCEL", self.cancelled)
+		self.assertEqual(self.rollbacks, ["cheque_cancel"])
+		final = publish.call_args_list[-1].args[1]
+		self.assertTrue(final["done"])
+		self.assertFalse(final["cancelled"])
+		errors = [r for c in publish.call_args_list for r in c.args[1]["results"] if r["error"]]
+		self.assertEqual([r["payment_entry"] for r in errors], ["PE-2"])
+
+	def test_on_trash_deletes_only_cancelled_entries(self):
+		from unittest.mock import MagicMock, call, patch
+		self._frappe.get_all = lambda doctype, **kwargs: [("PE-1", 2), ("PE-2", 1), ("PE-3", 2)]
+		self._frappe.get_doc = MagicMock(side_effect=AssertionError("no document loads expected"))
+		delete_doc = MagicMock()
+		doc = MultipleChequeEntry()
+		doc.name = "MCE-CANCEL"
+		with patch.object(self._frappe, "delete_doc", delete_doc, create=True):
+			doc.on_trash()
+		self.assertEqual(delete_doc.call_args_list, [
+			call("Payment Entry", "PE-1", ignore_permissions=True),
+			call("Payment Entry", "PE-3", ignore_permissions=True),
+		])
+
+	def test_on_trash_names_the_entry_that_failed(self):
+		from unittest.mock import MagicMock, patch
+		self._frappe.get_all = lambda doctype, **kwargs: [("PE-1", 2), ("PE-3", 2)]
+		delete_doc = MagicMock(side_effect=lambda doctype, name, **kwargs: name == "PE-3" and 1 / 0)
+		doc = MultipleChequeEntry()
+		doc.name = "MCE-CANCEL"
+		with patch.object(self._frappe, "delete_doc", delete_doc, create=True):
+			with self.assertRaisesRegex(Exception, "PE-3"):
+				doc.on_trash()
+
+
+class TestUploadChequesCsv(unittest.TestCase):
+	"""CSV and TSV uploads go through the csv module with the same
+	validation and normalisation as Excel."""
+
+	def setUp(self):
+		import sys
+		self._frappe = sys.modules["frappe"]
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		for attr, value in (("get_all", _existing_names_get_all()), ("db", _mock.MagicMock(**{"sql.return_value": []}))):
+			patcher = _mock.patch.object(self._frappe, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def test_csv(self):
+		data = (
+			"\ufeffparty_type,party,reference_no,reference_date,cheque_type,paid_amount,target_exchange_rate\r\n"
+			"Customer,CUST-001,CHQ-1,2024-01-15,Crossed,\"1000.5\",\r\n"
+			",,,,,,\r\n"
+			"Supplier,SUPP-001,CHQ-2,2024-01-20,Opened,250,3.5\r\n"
+		).encode("utf-8")
+		rows = upload_cheques_excel(data, "Receive")["rows"]
+		self.assertEqual(len(rows), 2)
+		self.assertEqual(rows[0]["party_type"], "Customer")
+		self.assertIsNone(rows[0]["target_exchange_rate"])
+		self.assertEqual(rows[1]["paid_amount"], 250.0)
+		self.assertEqual(rows[1]["target_exchange_rate"], 3.5)
+
+	def test_tsv_in_windows_1256(self):
+		data = (
+			"party_type\tparty\treference_no\treference_date\tcheque_type\tpaid_amount\tissuer_name\n"
+			"Customer\tCUST-001\tCHQ-1\t2024-01-15\tCrossed\t100\tأحمد علي\n"
+		).encode("cp1256")
+		rows = upload_cheques_excel(data, "Receive")["rows"]
+		self.assertEqual(rows[0]["issuer_name"], "أحمد علي")
+		self.assertEqual(rows[0]["paid_amount"], 100.0)
+
+	def test_csv_validation_matches_excel(self):
+		data = (
+			"party_type,party,reference_no,reference_date,cheque_type,paid_amount\n"
+			"Customer,,CHQ-1,2024-01-15,Crossed,0\n"
+		).encode("utf-8")
+		_patch_saved_files(self)
+		summary = upload_cheques_excel(data, "Receive")
+		self.assertEqual(summary["rows"], [])
+		self.assertEqual(summary["errors"], [
+			"Row 2: 'party' is required.",
+			"Row 2: 'paid_amount' must be greater than zero.",
+		])
+
+	def test_csv_missing_columns(self):
+		with self.assertRaises(Exception) as ctx:
+			upload_cheques_excel(b"party_type,party\nCustomer,CUST-001\n", "Receive")
+		self.assertIn("Missing required columns", str(ctx.exception))
+
+
+class TestUploadNormalisation(unittest.TestCase):
+	"""Dates, amounts and rates are read from the formats found in bank
+	exports, whatever mix of them a file uses."""
+
+	HEADER = "party_type,party,reference_no,reference_date,cheque_type,paid_amount,target_exchange_rate\n"
+
+	def setUp(self):
+		import sys
+		self._frappe = sys.modules["frappe"]
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		for attr, value in (("get_all", _existing_names_get_all()), ("db", _mock.MagicMock(**{"sql.return_value": []}))):
+			patcher = _mock.patch.object(self._frappe, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		_patch_saved_files(self)
+
+	def _upload(self, lines):
+		return upload_cheques_excel((self.HEADER + "".join(lines)).encode("utf-8"), "Receive")
+
+	def test_mixed_formats(self):
+		summary = self._upload([
+			"Customer,C1,CHQ-1,15/01/2024,Crossed,\"1,250.50\",\n",
+			"Customer,C1,CHQ-2,٢٠٢٤-٠١-١٥,Crossed,١٬٢٥٠٫٥٠,٤٨٫٥\n",
+			"Customer,C1,CHQ-3,45306,Crossed,100,\n",
+			"Customer,C1,CHQ-4,١٥/٠١/٢٠٢٤,Crossed,100,\n",
+			"Customer,C1,CHQ-5,2024-01-15 00:00:00,Crossed,100,\n",
+		])
+		rows = summary["rows"]
+		self.assertEqual(summary["rejected"], 0)
+		self.assertEqual({row["reference_date"] for row in rows}, {"2024-01-15"})
+		self.assertEqual(rows[0]["paid_amount"], 1250.5)
+		self.assertEqual(rows[1]["paid_amount"], 1250.5)
+		self.assertEqual(rows[1]["target_exchange_rate"], 48.5)
+
+	def test_invalid_values_rejected(self):
+		summary = self._upload([
+			"Customer,C1,CHQ-1,31/02/2024,Crossed,100,\n",
+			"Customer,C1,CHQ-2,2024-01-15,Crossed,abc,x\n",
+		])
+		self.assertEqual(summary["errors"], [
+			"Row 2: 'reference_date' 31/02/2024 is not a valid date.",
+			"Row 3: 'paid_amount' must be a number.",
+			"Row 3: 'target_exchange_rate' must be a number.",
+		])
+
+	def test_non_finite_and_ambiguous_amounts_rejected(self):
+		summary = self._upload([
+			"Customer,C1,CHQ-1,2024-01-15,Crossed,nan,\n",
+			"Customer,C1,CHQ-2,2024-01-15,Crossed,inf,\n",
+			"Customer,C1,CHQ-3,2024-01-15,Crossed,\"1500,50\",\n",
+			"Customer,C1,CHQ-4,2024-01-15,Crossed,100,inf\n",
+		])
+		self.assertEqual(summary["errors"], [
+			"Row 2: 'paid_amount' must be a number.",
+			"Row 3: 'paid_amount' must be a number.",
+			"Row 4: 'paid_amount' must be a number.",
+			"Row 5: 'target_exchange_rate' must be a number.",
+		])
+
+	def test_bare_year_is_not_a_serial_date(self):
+		summary = self._upload(["Customer,C1,CHQ-1,2024,Crossed,100,\n"])
+		self.assertEqual(summary["errors"], ["Row 2: 'reference_date' 2024 is not a valid date."])
+
+	def test_date_format_remembered_per_column(self):
+		from ecs_cheques.ecs_cheques.doctype.multiple_cheque_entry.multiple_cheque_entry import (
+			_parse_cheque_date,
+		)
+		import datetime
+		formats = {}
+		self.assertEqual(_parse_cheque_date("05/03/2024", formats, "reference_date"), datetime.date(2024, 3, 5))
+		self.assertEqual(formats, {"reference_date": "%d/%m/%Y"})
+		self.assertEqual(_parse_cheque_date("2024-03-05", formats, "reference_date"), datetime.date(2024, 3, 5))
+		self.assertEqual(formats, {"reference_date": "%Y-%m-%d"})
+		self.assertIsNone(_parse_cheque_date(0, formats, "reference_date"))
+
+
+class TestUploadChequesFromFile(unittest.TestCase):
+	"""upload_cheques_excel reads an uploaded File from disk."""
+
+	def setUp(self):
+		import os
+		import sys
+		import tempfile
+		self._frappe = sys.modules["frappe"]
+		self._saved = {attr: getattr(self._frappe, attr) for attr in ("db", "get_doc")}
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		for attr, value in (("get_all", _existing_names_get_all()), ("db", _mock.MagicMock(**{"sql.return_value": []}))):
+			patcher = _mock.patch.object(self._frappe, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+		fd, self.path = tempfile.mkstemp(suffix=".csv")
+		with os.fdopen(fd, "wb") as f:
+			f.write(
+				b"party_type,party,reference_no,reference_date,cheque_type,paid_amount\n"
+				b"Customer,CUST-001,CHQ-1,2024-01-15,Crossed,75\n"
+			)
+		self.addCleanup(os.remove, self.path)
+
+		test = self
+		self.permission_checks = []
+
+		class _File:
+			def __init__(inner_self, name):
+				inner_self.name = name
+
+			def check_permission(inner_self, ptype):
+				test.permission_checks.append((inner_self.name, ptype))
+
+			def get_full_path(inner_self):
+				return test.path
+
+		class _DB:
+			def get_value(self, doctype, filters, field):
+				if filters == {"file_url": "/private/files/cheques.csv"}:
+					return "FILE-0001"
+				return None
+
+			def sql(self, query, values=None):
+				return []
+
+		self._frappe.db = _DB()
+		self._frappe.get_doc = lambda doctype, name: _File(name)
+
+	def tearDown(self):
+		for attr, value in self._saved.items():
+			setattr(self._frappe, attr, value)
+
+	def test_file_name(self):
+		rows = upload_cheques_excel(payment_type="Receive", file="FILE-0001")["rows"]
+		self.assertEqual(rows[0]["paid_amount"], 75.0)
+		self.assertEqual(self.permission_checks, [("FILE-0001", "read")])
+
+	def test_file_url(self):
+		rows = upload_cheques_excel(payment_type="Receive", file="/private/files/cheques.csv")["rows"]
+		self.assertEqual(rows[0]["party"], "CUST-001")
+
+	def test_unknown_file_url(self):
+		with self.assertRaises(Exception) as ctx:
+			upload_cheques_excel(payment_type="Receive", file="/files/missing.csv")
+		self.assertIn("not found", str(ctx.exception))
+
+
+try:
+	import openpyxl as _openpyxl
+except ImportError:
+	_openpyxl = None
+
+
+@unittest.skipUnless(_openpyxl, "openpyxl not installed")
+class TestUploadChequesExcel(unittest.TestCase):
+	"""upload_cheques_excel streams the sheet and validates rows as it goes."""
+
+	HEADERS = ["party_type", "party", "reference_no", "reference_date",
+			   "cheque_type", "paid_amount", "target_exchange_rate"]
+
+	def setUp(self):
+		import sys
+		self._frappe = sys.modules["frappe"]
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		for attr, value in (("get_all", _existing_names_get_all()), ("db", _mock.MagicMock(**{"sql.return_value": []}))):
+			patcher = _mock.patch.object(self._frappe, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def _xlsx(self, rows):
+		import datetime
+		import io
+		wb = _openpyxl.Workbook()
+		ws = wb.active
+		for row in rows:
+			ws.append([datetime.datetime(2024, 1, 15) if v == "DATE" else v for v in row])
+		output = io.BytesIO()
+		wb.save(output)
+		return output.getvalue()
+
+	def test_rows_are_normalised(self):
+		data = self._xlsx([
+			self.HEADERS,
+			["Customer", "CUST-001", "CHQ-1", "DATE", "Crossed", "100", None],
+			[None] * 7,
+			["Customer", "CUST-002", "CHQ-2", "2024-02-01", "Opened", 50, 0],
+		])
+		rows = upload_cheques_excel(data, "Receive")["rows"]
+		self.assertEqual(len(rows), 2, "blank rows are skipped")
+		self.assertEqual(rows[0]["paid_amount"], 100.0)
+		self.assertEqual(rows[0]["reference_date"], "2024-01-15")
+		self.assertEqual(rows[1]["target_exchange_rate"], 1)
+
+	def test_rejected_rows_written_to_workbook(self):
+		import io
+		data = self._xlsx([
+			self.HEADERS,
+			["Customer", "", "CHQ-1", "DATE", "Crossed", 100, 1],
+			["Customer", "CUST-002", "CHQ-2", "DATE", "Crossed", -5, 1],
+			["Customer", "CUST-003", "CHQ-3", "DATE", "Crossed", 70, 1],
+		])
+		_patch_saved_files(self)
+		summary = upload_cheques_excel(data, "Receive")
+		self.assertEqual([row["reference_no"] for row in summary["rows"]], ["CHQ-3"])
+		self.assertEqual((summary["total"], summary["rejected"]), (3, 2))
+		self.assertEqual(summary["errors"], [
+			"Row 2: 'party' is required.",
+			"Row 3: 'paid_amount' must be greater than zero.",
+		])
+
+		saved, = self.saved_files
+		self.assertEqual(summary["error_file"], saved.file_url)
+		self.assertEqual(saved["is_private"], 1)
+		wb = _openpyxl.load_workbook(io.BytesIO(saved["content"]), read_only=True)
+		sheet = [list(row) for row in wb.active.iter_rows(values_only=True)]
+		wb.close()
+		self.assertEqual(sheet[0], ["row"] + self.HEADERS + ["error"])
+		self.assertEqual(sheet[1][:4], [2, "Customer", None, "CHQ-1"])
+		self.assertEqual(sheet[2][-1], "Row 3: 'paid_amount' must be greater than zero.")
+		self.assertEqual(len(sheet), 3)
+
+	def test_missing_columns(self):
+		data = self._xlsx([["party_type", "party"], ["Customer", "CUST-001"]])
+		with self.assertRaises(Exception) as ctx:
+			upload_cheques_excel(data, "Receive")
+		self.assertIn("Missing required columns", str(ctx.exception))
+
+	def test_workbook_opened_read_only(self):
+		from unittest.mock import patch
+		data = self._xlsx([self.HEADERS, ["Customer", "CUST-001", "CHQ-1", "DATE", "Crossed", 1, 1]])
+		load_workbook = _openpyxl.load_workbook
+		with patch.object(_openpyxl, "load_workbook", side_effect=load_workbook) as spy:
+			upload_cheques_excel(data, "Receive")
+		self.assertTrue(spy.call_args.kwargs["read_only"])
+
+
+class TestUploadReferenceValidation(unittest.TestCase):
+	"""Uploaded rows are checked against the master data set-wise."""
+
+	CSV = (
+		"party_type,party,reference_no,reference_date,cheque_type,paid_amount,"
+		"mode_of_payment,account_paid_from,account_paid_to,cheque_currency\n"
+		"Customer,CUST-001,CHQ-1,2024-01-15,Crossed,10,Cheque,Receivable,Wallet,USD\n"
+		"Customer,CUST-404,CHQ-2,2024-01-15,Crossed,10,Cheque,Receivable,Wallet,USD\n"
+		"Customer,CUST-001,CHQ-3,2024-01-15,Crossed,10,Wire,Receivable,Ghost,XYZ\n"
+		"Employee,EMP-1,CHQ-4,2024-01-15,Crossed,10,Cheque,Receivable,Wallet,USD\n"
+	)
+
+	def setUp(self):
+		import sys
+		self._frappe = sys.modules["frappe"]
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		self.queries = []
+		missing = {"CUST-404", "Wire", "Ghost", "XYZ", "Employee"}
+		get_all = _existing_names_get_all(missing)
+
+		def _get_all(doctype, **kwargs):
+			self.queries.append(doctype)
+			return get_all(doctype, **kwargs)
+
+		for attr, value in (("get_all", _get_all), ("db", _mock.MagicMock(**{"sql.return_value": []}))):
+			patcher = _mock.patch.object(self._frappe, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		_patch_saved_files(self)
+
+	def test_row_level_errors_for_whole_file(self):
+		summary = upload_cheques_excel(self.CSV.encode(), "Receive")
+		self.assertEqual([row["reference_no"] for row in summary["rows"]], ["CHQ-1"])
+		self.assertEqual(summary["errors"], [
+			"Row 3: Customer 'CUST-404' does not exist.",
+			"Row 4: Account 'Ghost' in 'account_paid_to' does not exist.",
+			"Row 4: Mode of Payment 'Wire' in 'mode_of_payment' does not exist.",
+			"Row 4: Currency 'XYZ' in 'cheque_currency' does not exist.",
+			"Row 5: Party Type 'Employee' does not exist.",
+		])
+
+	def test_one_query_per_doctype(self):
+		upload_cheques_excel(self.CSV.encode(), "Receive")
+		self.assertEqual(
+			sorted(self.queries),
+			["Account", "Currency", "Customer", "Mode of Payment", "Party Type", "Payment Entry"],
+		)
+
+
+class TestDuplicateCheques(unittest.TestCase):
+	"""The same cheque may not be recorded twice across batches."""
+
+	CSV = (
+		"party_type,party,reference_no,reference_date,cheque_type,paid_amount,bank\n"
+		"Customer,CUST-001,CHQ-1,2024-01-15,Crossed,100,Arab Bank\n"
+		"Customer,CUST-001,CHQ-2,2024-01-15,Crossed,200,Arab Bank\n"
+		"Customer,CUST-001,CHQ-3,2024-01-15,Crossed,300,Arab Bank\n"
+		"Customer,CUST-001,CHQ-3,2024-01-15,Crossed,300,Arab Bank\n"
+		"Customer,CUST-001,CHQ-1,2024-01-15,Crossed,100,Other Bank\n"
+	)
+
+	def setUp(self):
+		import sys
+		self._frappe = sys.modules["frappe"]
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		self.pe_queries = []
+		exists = _existing_names_get_all()
+
+		def _get_all(doctype, filters=None, **kwargs):
+			if doctype != "Payment Entry":
+				return exists(doctype, filters=filters, **kwargs)
+			self.pe_queries.append(filters)
+			return [
+				("PE-0001", "CHQ-1", "CUST-001", "Arab Bank", 100.0, None),
+				("PE-0002", "CHQ-9", "CUST-001", "Arab Bank", 100.0, "MCE-0008"),
+			]
+
+		db = _mock.MagicMock()
+		db.sql.return_value = [("MCE-0007", 4, "CHQ-2", "CUST-001", "Arab Bank", 200.0)]
+		self.db = db
+		for attr, value in (("get_all", _get_all), ("db", db)):
+			patcher = _mock.patch.object(self._frappe, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		_patch_saved_files(self)
+
+	def test_upload_flags_duplicates(self):
+		summary = upload_cheques_excel(self.CSV.encode(), "Receive")
+		self.assertEqual(len(summary["rows"]), 2)
+		self.assertEqual(summary["errors"], [
+			"Row 2: Cheque CHQ-1 is already recorded in Payment Entry PE-0001.",
+			"Row 3: Cheque CHQ-2 is already recorded in Multiple Cheque Entry MCE-0007 row 4.",
+			"Row 5: Cheque CHQ-3 is already recorded in row 4.",
+		])
+
+	def test_one_query_per_source(self):
+		upload_cheques_excel(self.CSV.encode(), "Receive")
+		self.assertEqual(len(self.pe_queries), 1)
+		self.assertEqual(sorted(self.pe_queries[0]["reference_no"][1]), ["CHQ-1", "CHQ-2", "CHQ-3"])
+		self.assertEqual(self.db.sql.call_count, 1)
+
+	def test_before_submit_rejects_duplicates(self):
+		doc = MultipleChequeEntry()
+		doc.name = "MCE-0008"
+		doc.payment_type = "Receive"
+		doc.cheque_table = [
+			_Row(idx=1, reference_no="CHQ-1", party="CUST-001", bank="Arab Bank", paid_amount=100, payment_entry=None),
+			_Row(idx=2, reference_no="CHQ-9", party="CUST-001", bank="Arab Bank", paid_amount=100, payment_entry=None),
+		]
+		doc.cheque_table_2 = []
+		with self.assertRaises(Exception) as ctx:
+			doc.before_submit()
+		self.assertEqual(str(ctx.exception), "Row 1: Cheque CHQ-1 is already recorded in Payment Entry PE-0001.")
+		self.assertEqual(self.db.sql.call_args.args[1]["exclude_parent"], "MCE-0008")
+
+	def test_own_payment_entry_is_not_a_duplicate(self):
+		doc = MultipleChequeEntry()
+		doc.name = "MCE-0008"
+		doc.payment_type = "Receive"
+		doc.cheque_table = [
+			_Row(idx=1, reference_no="CHQ-9", party="CUST-001", bank="Arab Bank", paid_amount=100, payment_entry=None),
+		]
+		doc.cheque_table_2 = []
+		self.db.sql.return_value = []
+		doc.before_submit()
+
+	def test_only_submitted_batches_block(self):
+		upload_cheques_excel(self.CSV.encode(), "Receive")
+		self.assertIn("m.docstatus = 1", self.db.sql.call_args.args[0])
+
+
+class TestAppendUploadedCheques(unittest.TestCase):
+	"""append_uploaded_cheques fills in uploaded rows server-side and saves
+	the draft once."""
+
+	CSV = (
+		"party_type,party,reference_no,reference_date,cheque_type,paid_amount,first_beneficiary\n"
+		"Customer,CUST-001,CHQ-1,2024-01-15,Crossed,100,Company\n"
+		"Customer,CUST-002,CHQ-2,2024-01-15,Crossed,50,\n"
+	)
+
+	def setUp(self):
+		import sys
+		from ecs_cheques.ecs_cheques.overrides.currency_exchange import currency_exchange
+		self._frappe = sys.modules["frappe"]
+		self._frappe.throw = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		self.queries = []
+		test = self
+
+		class _MCE:
+			name = "MCE-UP"
+			docstatus = 0
+			company = "Test Co"
+			payment_type = "Receive"
+			posting_date = "2024-02-01"
+			mode_of_payment = "Cheque"
+			paid_from = None
+			paid_to = None
+
+			def __init__(inner_self):
+				inner_self.cheque_table = []
+				inner_self.saves = 0
+
+			def check_permission(inner_self, ptype):
+				test.assertEqual(ptype, "write")
+
+			def append(inner_self, field, row):
+				getattr(inner_self, field).append(row)
+
+			def save(inner_self):
+				inner_self.saves += 1
+
+		self.doc = _MCE()
+		tables = {
+			"Mode of Payment Account": [("Cheque", "USD-Wallet")],
+			"Customer": [("CUST-001", "Acme"), ("CUST-002", "Beta")],
+			"Party Account": [("CUST-002", "Special-Receivable")],
+			"Account": [("USD-Wallet", "USD"), ("Receivable", "ILS"), ("Special-Receivable", "ILS")],
+		}
+
+		def _get_all(doctype, filters=None, **kwargs):
+			self.queries.append(doctype)
+			if kwargs.get("pluck"):
+				# Existence checks: everything exists.
+				return list(filters["name"][1])
+			return tables.get(doctype, [])
+
+		db = _mock.MagicMock()
+		db.sql.return_value = []
+		_patch_company_settings(
+			self,
+			default_currency="ILS",
+			default_receivable_account="Receivable",
+			default_payable_account="Payable",
+		)
+		self.rate_requests = []
+
+		def _get_exchange_rates(pairs):
+			self.rate_requests.append(list(pairs))
+			return [{"from_currency": "USD", "to_currency": "ILS", "date": "2024-02-01", "exchange_rate": 3.5}]
+
+		for target, attr, value in (
+			(self._frappe, "get_all", _get_all),
+			(self._frappe, "db", db),
+			(currency_exchange, "get_exchange_rates", _get_exchange_rates),
+		):
+			patcher = _mock.patch.object(target, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		_patch_saved_files(self, lambda doctype, name: self.doc)
+
+	def test_rows_enriched_and_saved_once(self):
+		res = append_uploaded_cheques("MCE-UP", file_data=self.CSV.encode())
+		self.assertEqual(res, {"appended": 2, "reload": 1, "total": 2, "rejected": 0, "errors": [], "error_file": None})
+		self.assertEqual(self.doc.saves, 1)
+
+		first, second = self.doc.cheque_table
+		self.assertEqual(first["party_name"], "Acme")
+		self.assertEqual(first["mode_of_payment"], "Cheque")
+		self.assertEqual(first["account_paid_to"], "USD-Wallet")
+		self.assertEqual(first["account_paid_from"], "Receivable")
+		self.assertEqual(second["account_paid_from"], "Special-Receivable")
+		self.assertEqual(first["account_currency"], "USD")
+		self.assertEqual(first["account_currency_from"], "ILS")
+		self.assertEqual(first["cheque_currency"], "USD")
+		self.assertEqual(first["target_exchange_rate"], 3.5)
+		self.assertAlmostEqual(first["exchange_rate_party_to_mop"], 1 / 3.5, places=9)
+		self.assertEqual(first["amount_in_company_currency"], 350.0)
+		self.assertEqual(first["person_name"], "Test Co")
+		self.assertEqual(first["issuer_name"], "Acme")
+		self.assertNotIn("person_name", second)
+
+	def test_lookups_are_set_based(self):
+		append_uploaded_cheques("MCE-UP", file_data=self.CSV.encode())
+		self.assertEqual(len(self.rate_requests), 1)
+		for doctype in ("Mode of Payment Account", "Customer", "Party Account"):
+			self.assertEqual(self.queries.count(doctype), 2 if doctype == "Customer" else 1, doctype)
+
+	def test_rejected_rows_attached_to_document(self):
+		csv = self.CSV + "Customer,,CHQ-3,2024-01-15,Crossed,10,\n"
+		res = append_uploaded_cheques("MCE-UP", file_data=csv.encode())
+		self.assertEqual((res["appended"], res["rejected"]), (2, 1))
+		self.assertEqual(len(self.doc.cheque_table), 2)
+		saved, = self.saved_files
+		self.assertEqual((saved["attached_to_doctype"], saved["attached_to_name"]), ("Multiple Cheque Entry", "MCE-UP"))
+		self.assertEqual(res["error_file"], saved.file_url)
+
+	def test_nothing_saved_when_every_row_rejected(self):
+		csv = "party_type,party,reference_no,reference_date,cheque_type,paid_amount\nCustomer,,CHQ-3,2024-01-15,Crossed,10\n"
+		res = append_uploaded_cheques("MCE-UP", file_data=csv.encode())
+		self.assertEqual((res["appended"], res["reload"], res["rejected"]), (0, 0, 1))
+		self.assertEqual(self.doc.saves, 0)
+
+	def test_submitted_document_rejected(self):
+		self.doc.docstatus = 1
+		with self.assertRaises(Exception):
+			append_uploaded_cheques("MCE-UP", file_data=self.CSV.encode())
+
+
+@unittest.skipUnless(_openpyxl, "openpyxl not installed")
+class TestChequesExcelDownloads(unittest.TestCase):
+	"""The template is built once per payment type, language and app
+	version; exports stream the cheque table in the template layout."""
+
+	def setUp(self):
+		import sys
+		import types
+		self._frappe = sys.modules["frappe"]
+		self.store = {}
+		cache = _mock.MagicMock()
+		cache.get_value.side_effect = self.store.get
+		cache.set_value.side_effect = self.store.__setitem__
+		db = _mock.MagicMock()
+		db.get_value.return_value = "Pay"
+		self.get_all = _mock.MagicMock(return_value=[
+			("Cheque", "Bank", "Payable", 100.0, "Supplier", "SUPP-001", "CHQ-1"),
+		])
+		for attr, value in (
+			("cache", lambda: cache),
+			("local", types.SimpleNamespace(lang="ar")),
+			("response", types.SimpleNamespace()),
+			("has_permission", lambda doctype, ptype, name: True),
+			("db", db),
+			("get_all", self.get_all),
+		):
+			patcher = _mock.patch.object(self._frappe, attr, value, create=True)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def _sheet(self, content):
+		import io
+		wb = _openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+		rows = [list(row) for row in wb.active.iter_rows(values_only=True)]
+		wb.close()
+		return rows
+
+	def test_template_cached_per_type_and_language(self):
+		with _mock.patch.object(_openpyxl, "Workbook", side_effect=_openpyxl.Workbook) as spy:
+			get_cheques_excel_template("Receive")
+			first = self._frappe.response.filecontent
+			get_cheques_excel_template("Receive")
+			self.assertEqual(spy.call_count, 1)
+			self.assertEqual(self._frappe.response.filecontent, first)
+			self.assertTrue(spy.call_args.kwargs["write_only"])
+
+			self._frappe.local.lang = "en"
+			get_cheques_excel_template("Receive")
+			get_cheques_excel_template("Pay")
+			self.assertEqual(spy.call_count, 3)
+
+		rows = self._sheet(first)
+		self.assertEqual(rows[0][:4], ["party_type", "party", "mode_of_payment", "bank"])
+		self.assertEqual(len(rows), 4)
+		self.assertEqual(self._frappe.response.filename, "cheques_template_pay.xlsx")
+
+	def test_template_cache_keyed_by_app_version(self):
+		import ecs_cheques
+		get_cheques_excel_template("Pay")
+		with _mock.patch.object(ecs_cheques, "__version__", "99.0.0"):
+			get_cheques_excel_template("Pay")
+		self.assertEqual(len(self.store), 2)
+		self.assertTrue(any("99.0.0" in key for key in self.store))
+
+	def test_export_streams_table_rows(self):
+		export_cheques_excel("MCE-1")
+		kwargs = self.get_all.call_args.kwargs
+		self.assertEqual(self.get_all.call_args.args[0], "Cheque Table Pay")
+		self.assertEqual(kwargs["filters"]["parent"], "MCE-1")
+		self.assertTrue(kwargs["as_list"])
+
+		rows = self._sheet(self._frappe.response.filecontent)
+		self.assertEqual(rows[0], kwargs["fields"])
+		self.assertEqual(rows[1][:3], ["Cheque", "Bank", "Payable"])
+		self.assertEqual(self._frappe.response.filename, "MCE-1.xlsx")
+
+	def test_export_requires_read_permission(self):
+		with _mock.patch.object(self._frappe, "has_permission", lambda *a: False), \
+				_mock.patch.object(self._frappe, "PermissionError", PermissionError, create=True):
+			with self.assertRaises(Exception):
+				export_cheques_excel("MCE-1")
+		self.get_all.assert_not_called()
@@ -0,0 +1,57 @@
+# Copyright (c) 2021, erpcloud.systems and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+# Redis hash of account currencies, keyed by account.  "" records an
+# account that does not exist.
+ACCOUNT_CURRENCY_CACHE_KEY = "ecs_cheques_account_currency"
+
+
+def get_account_currency(account):
+	"""Return the currency of *account*, or None if it is blank or unknown.
+
+	Currencies are cached in a redis hash; ``frappe.cache().hget`` also
+	keeps them in process memory for the rest of the request, so building a
+	Journal Entry reads each account at most once.  Saving or deleting the
+	Account drops its entry.
+	"""
+	if not account:
+		return None
+	return frappe.cache().hget(
+		ACCOUNT_CURRENCY_CACHE_KEY, account,
+		generator=lambda: frappe.db.get_value("Account", account, "account_currency") or "",
+	) or None
+
+
+def get_account_currencies(accounts):
+	"""Return ``{account: account_currency}`` for *accounts*, reading the
+	ones not cached yet with a single ``IN`` query.  Blank names are
+	ignored; unknown accounts are absent."""
+	cache = frappe.cache()
+	currencies, missing = {}, []
+	for account in {account for account in accounts if account}:
+		currency = cache.hget(ACCOUNT_CURRENCY_CACHE_KEY, account)
+		if currency is None:
+			missing.append(account)
+		elif currency:
+			currencies[account] = currency
+
+	if missing:
+		found = dict(frappe.get_all(
+			"Account",
+			filters={"name": ["in", missing]},
+			fields=["name", "account_currency"],
+			as_list=True,
+		))
+		for account in missing:
+			cache.hset(ACCOUNT_CURRENCY_CACHE_KEY, account, found.get(account) or "")
+			if found.get(account):
+				currencies[account] = found[account]
+	return currencies
+
+
+def clear_account_currency_cache(doc, method=None):
+	"""Drop the cached currency of an Account when it is saved or deleted."""
+	frappe.cache().hdel(ACCOUNT_CURRENCY_CACHE_KEY, doc.name)
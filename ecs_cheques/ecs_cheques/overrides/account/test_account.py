@@ -0,0 +1,99 @@
+# Copyright (c) 2021, erpcloud.systems and Contributors
+# See license.txt
+"""
+Unit tests for the cached account currencies in account.py.
+
+frappe is replaced by a minimal stub and frappe.cache() by an in-memory
+dict, so the tests do NOT require a live Frappe/ERPNext instance.
+"""
+
+import sys
+import types
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+def _make_frappe_stub():
+	mod = types.ModuleType("frappe")
+	mod.db = MagicMock()
+	mod._ = lambda s, *a: s
+	mod.whitelist = lambda fn=None, **kw: (fn if fn else lambda f: f)
+	return mod
+
+
+sys.modules.setdefault("frappe", _make_frappe_stub())
+
+import frappe  # noqa: E402
+from ecs_cheques.ecs_cheques.overrides.account.account import (  # noqa: E402
+	clear_account_currency_cache,
+	get_account_currencies,
+	get_account_currency,
+)
+
+
+ACCOUNTS = {"Cash - TC": "EGP", "Bank USD - TC": "USD"}
+
+
+class _Cache:
+	"""In-memory stand-in for frappe.cache()'s hash methods."""
+
+	def __init__(self):
+		self.data = {}
+
+	def hget(self, name, key, generator=None):
+		value = self.data.get(name, {}).get(key)
+		if value is None and generator:
+			value = generator()
+			self.hset(name, key, value)
+		return value
+
+	def hset(self, name, key, value):
+		self.data.setdefault(name, {})[key] = value
+
+	def hdel(self, name, key):
+		self.data.get(name, {}).pop(key, None)
+
+
+class TestAccountCurrencyCache(unittest.TestCase):
+
+	def setUp(self):
+		self.cache = _Cache()
+		self.db = MagicMock()
+		self.db.get_value.side_effect = lambda doctype, name, fieldname: ACCOUNTS.get(name)
+		self.get_all = MagicMock(side_effect=lambda doctype, filters, fields, as_list: [
+			(name, ACCOUNTS[name]) for name in filters["name"][1] if name in ACCOUNTS
+		])
+		for attr, value in (("cache", lambda: self.cache), ("db", self.db), ("get_all", self.get_all)):
+			patcher = patch.object(frappe, attr, value, create=True)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def test_cached_after_first_read(self):
+		self.assertEqual(get_account_currency("Bank USD - TC"), "USD")
+		self.assertEqual(get_account_currency("Bank USD - TC"), "USD")
+		self.db.get_value.assert_called_once_with("Account", "Bank USD - TC", "account_currency")
+
+	def test_unknown_account_is_cached(self):
+		self.assertIsNone(get_account_currency("Missing - TC"))
+		self.assertIsNone(get_account_currency("Missing - TC"))
+		self.assertIsNone(get_account_currency(None))
+		self.assertEqual(self.db.get_value.call_count, 1)
+
+	def test_batch_reads_only_missing_accounts(self):
+		get_account_currency("Cash - TC")
+		currencies = get_account_currencies(["Cash - TC", "Bank USD - TC", "Missing - TC", None, "Bank USD - TC"])
+		self.assertEqual(currencies, ACCOUNTS)
+		self.get_all.assert_called_once()
+		self.assertEqual(sorted(self.get_all.call_args.kwargs["filters"]["name"][1]), ["Bank USD - TC", "Missing - TC"])
+
+		self.assertEqual(get_account_currencies(ACCOUNTS), ACCOUNTS)
+		self.assertIsNone(get_account_currency("Missing - TC"))
+		self.get_all.assert_called_once()
+		self.assertEqual(self.db.get_value.call_count, 1)
+
+	def test_account_update_clears_its_entry(self):
+		get_account_currencies(ACCOUNTS)
+		clear_account_currency_cache(types.SimpleNamespace(name="Cash - TC"), "on_update")
+		get_account_currency("Cash - TC")
+		get_account_currency("Bank USD - TC")
+		self.db.get_value.assert_called_once_with("Account", "Cash - TC", "account_currency")
@@ -0,0 +1,46 @@
+# Copyright (c) 2021, erpcloud.systems and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+# Company fields read by the cheque code paths.
+COMPANY_CHEQUE_SETTINGS_FIELDS = (
+	"default_currency",
+	"default_receivable_account",
+	"default_payable_account",
+	"default_cash_account",
+	"default_payback_cheque_wallet_account",
+	"default_rejected_cheque_account",
+	"default_bank_commissions_account",
+)
+
+# Redis hash of the settings, keyed by company.
+COMPANY_CHEQUE_SETTINGS_CACHE_KEY = "ecs_cheques_company_cheque_settings"
+
+
+def get_company_cheque_settings(company):
+	"""Return the cheque settings of *company*: a dict of
+	:data:`COMPANY_CHEQUE_SETTINGS_FIELDS`.
+
+	The fields are read in one query and cached in a redis hash;
+	``frappe.cache().hget`` also keeps them in process memory for the rest
+	of the request.  Saving the Company drops its entry.
+	"""
+	if not company:
+		return {}
+	settings = frappe.cache().hget(
+		COMPANY_CHEQUE_SETTINGS_CACHE_KEY, company,
+		generator=lambda: _load_company_cheque_settings(company),
+	)
+	return dict(settings or {})
+
+
+def _load_company_cheque_settings(company):
+	settings = frappe.db.get_value("Company", company, list(COMPANY_CHEQUE_SETTINGS_FIELDS), as_dict=True)
+	return dict(settings or {})
+
+
+def clear_company_cheque_settings(doc, method=None):
+	"""Drop the cached cheque settings of a Company when it is saved or deleted."""
+	frappe.cache().hdel(COMPANY_CHEQUE_SETTINGS_CACHE_KEY, doc.name)
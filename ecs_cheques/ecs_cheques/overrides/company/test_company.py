@@ -0,0 +1,93 @@
+# Copyright (c) 2021, erpcloud.systems and Contributors
+# See license.txt
+"""
+Unit tests for the cached company cheque settings in company.py.
+
+frappe is replaced by a minimal stub and frappe.cache() by an in-memory
+dict, so the tests do NOT require a live Frappe/ERPNext instance.
+"""
+
+import sys
+import types
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+def _make_frappe_stub():
+	mod = types.ModuleType("frappe")
+	mod.db = MagicMock()
+	mod._ = lambda s, *a: s
+	mod.whitelist = lambda fn=None, **kw: (fn if fn else lambda f: f)
+	return mod
+
+
+sys.modules.setdefault("frappe", _make_frappe_stub())
+
+import frappe  # noqa: E402
+from ecs_cheques.ecs_cheques.overrides.company.company import (  # noqa: E402
+	COMPANY_CHEQUE_SETTINGS_FIELDS,
+	clear_company_cheque_settings,
+	get_company_cheque_settings,
+)
+
+
+class _Cache:
+	"""In-memory stand-in for frappe.cache()'s hash methods."""
+
+	def __init__(self):
+		self.data = {}
+
+	def hget(self, name, key, generator=None):
+		value = self.data.get(name, {}).get(key)
+		if value is None and generator:
+			value = generator()
+			self.data.setdefault(name, {})[key] = value
+		return value
+
+	def hdel(self, name, key):
+		self.data.get(name, {}).pop(key, None)
+
+
+class TestCompanyChequeSettings(unittest.TestCase):
+
+	def setUp(self):
+		self.cache = _Cache()
+		self.db = MagicMock()
+		self.db.get_value.side_effect = lambda doctype, name, fields, as_dict=False: {
+			"default_currency": "EGP",
+			"default_cash_account": "Cash - " + name,
+		}
+		for attr, value in (("cache", lambda: self.cache), ("db", self.db)):
+			patcher = patch.object(frappe, attr, value, create=True)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def test_fetched_in_one_query(self):
+		settings = get_company_cheque_settings("Test Co")
+		self.assertEqual(settings["default_cash_account"], "Cash - Test Co")
+		self.db.get_value.assert_called_once()
+		call = self.db.get_value.call_args
+		self.assertEqual(call.args[2], list(COMPANY_CHEQUE_SETTINGS_FIELDS))
+		self.assertTrue(call.kwargs["as_dict"])
+
+	def test_cached_per_company(self):
+		get_company_cheque_settings("Test Co")
+		get_company_cheque_settings("Test Co")
+		get_company_cheque_settings("Other Co")
+		self.assertEqual(self.db.get_value.call_count, 2)
+
+	def test_returned_copy_does_not_change_cache(self):
+		get_company_cheque_settings("Test Co")["default_currency"] = "USD"
+		self.assertEqual(get_company_cheque_settings("Test Co")["default_currency"], "EGP")
+
+	def test_company_update_clears_its_entry(self):
+		get_company_cheque_settings("Test Co")
+		get_company_cheque_settings("Other Co")
+		clear_company_cheque_settings(types.SimpleNamespace(name="Test Co"), "on_update")
+		get_company_cheque_settings("Test Co")
+		get_company_cheque_settings("Other Co")
+		self.assertEqual(self.db.get_value.call_count, 3)
+
+	def test_no_company(self):
+		self.assertEqual(get_company_cheque_settings(None), {})
+		self.db.get_value.assert_not_called()
@@ -0,0 +1,116 @@
+# Copyright (c) 2021, erpcloud.systems and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.utils import cint, flt
+
+
+# Resolved rates are cached per (from, to, date) for this many seconds.
+# Override per site with ``ecs_cheques_exchange_rate_ttl`` in site_config.json.
+EXCHANGE_RATE_CACHE_TTL = 6 * 60 * 60
+
+EXCHANGE_RATE_CACHE_PREFIX = "ecs_cheques_exchange_rate::"
+
+
+def _cache_key(from_currency, to_currency, date):
+	return "{0}{1}::{2}::{3}".format(EXCHANGE_RATE_CACHE_PREFIX, from_currency, to_currency, date)
+
+
+@frappe.whitelist()
+def get_exchange_rates(pairs):
+	"""Resolve many exchange rates in one call.
+
+	*pairs* is a list (or its JSON) of ``[from_currency, to_currency, date]``.
+	Each rate is the latest ``Currency Exchange`` on or before *date*; when
+	only the reverse pair exists its inverse is used, and ``None`` is returned
+	when neither does.  This matches the lookup ``get_exchange_rate`` performs
+	in ``multiple_cheque_entry.js``.
+
+	Answers come from a TTL cache; all misses are resolved with a single
+	query that reads one ``Currency Exchange`` row per pair and date.  Returns a list of ``{"from_currency",
+	"to_currency", "date", "exchange_rate"}`` for the distinct pairs.
+	"""
+	frappe.has_permission("Currency Exchange", "read", throw=True)
+	if isinstance(pairs, str):
+		pairs = json.loads(pairs)
+
+	wanted = list(dict.fromkeys(
+		(from_currency, to_currency, str(date))
+		for from_currency, to_currency, date in pairs
+		if from_currency and to_currency and date
+	))
+
+	cache = frappe.cache()
+	rates, missing = {}, []
+	for key in wanted:
+		from_currency, to_currency, date = key
+		if from_currency == to_currency:
+			rates[key] = 1.0
+			continue
+		cached = cache.get_value(_cache_key(*key))
+		if cached is None:
+			missing.append(key)
+		else:
+			# 0 records a pair known to have no rate.
+			rates[key] = cached or None
+
+	if missing:
+		ttl = cint(frappe.conf.get("ecs_cheques_exchange_rate_ttl")) or EXCHANGE_RATE_CACHE_TTL
+		for key, rate in _resolve_exchange_rates(missing).items():
+			rates[key] = rate
+			cache.set_value(_cache_key(*key), rate or 0, expires_in_sec=ttl)
+
+	return [
+		{"from_currency": key[0], "to_currency": key[1], "date": key[2], "exchange_rate": rates[key]}
+		for key in wanted
+	]
+
+
+# Latest non-zero rate of one pair on or before a date.
+_LATEST_RATE_QUERY = """
+	select %s, %s, %s, ce.exchange_rate
+	from `tabCurrency Exchange` ce
+	where ce.from_currency = %s and ce.to_currency = %s and ce.exchange_rate != 0
+		and ce.date = (
+			select max(date) from `tabCurrency Exchange`
+			where from_currency = %s and to_currency = %s and exchange_rate != 0 and date <= %s
+		)"""
+
+
+def _resolve_exchange_rates(keys):
+	"""Return ``{(from, to, date): rate or None}`` for *keys*.
+
+	A single ``union all`` query fetches, for every key and its reverse pair,
+	only the latest rate on or before the date instead of the pair's whole
+	history.
+	"""
+	lookups = list(dict.fromkeys(
+		lookup
+		for from_currency, to_currency, date in keys
+		for lookup in ((from_currency, to_currency, date), (to_currency, from_currency, date))
+	))
+	values = []
+	for from_currency, to_currency, date in lookups:
+		values += [from_currency, to_currency, date, from_currency, to_currency, from_currency, to_currency, date]
+
+	latest = {}
+	for from_currency, to_currency, date, exchange_rate in frappe.db.sql(
+		" union all ".join([_LATEST_RATE_QUERY] * len(lookups)), values
+	):
+		latest.setdefault((from_currency, to_currency, str(date)), flt(exchange_rate))
+
+	resolved = {}
+	for from_currency, to_currency, date in keys:
+		rate = latest.get((from_currency, to_currency, date))
+		if not rate:
+			reverse = latest.get((to_currency, from_currency, date))
+			rate = 1.0 / reverse if reverse else None
+		resolved[(from_currency, to_currency, date)] = rate
+	return resolved
+
+
+def clear_exchange_rate_cache(doc=None, method=None):
+	"""Drop cached rates when a Currency Exchange is saved or deleted."""
+	frappe.cache().delete_keys(EXCHANGE_RATE_CACHE_PREFIX)
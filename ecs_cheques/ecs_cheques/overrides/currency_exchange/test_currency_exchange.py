@@ -0,0 +1,147 @@
+# Copyright (c) 2021, erpcloud.systems and Contributors
+# See license.txt
+"""
+Unit tests for the batched exchange-rate resolver in currency_exchange.py.
+
+frappe is replaced by a minimal stub and frappe.cache() by an in-memory
+dict, so the tests do NOT require a live Frappe/ERPNext instance.
+"""
+
+import datetime
+import sys
+import types
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+def _make_frappe_stub():
+	mod = types.ModuleType("frappe")
+	mod.db = MagicMock()
+	mod._ = lambda s, *a: s
+	mod.whitelist = lambda fn=None, **kw: (fn if fn else lambda f: f)
+	mod.conf = {}
+	return mod
+
+
+sys.modules.setdefault("frappe", _make_frappe_stub())
+
+_utils = sys.modules.setdefault("frappe.utils", types.ModuleType("frappe.utils"))
+if not hasattr(_utils, "flt"):
+	_utils.flt = lambda val, precision=None: float(val or 0)
+if not hasattr(_utils, "cint"):
+	_utils.cint = lambda val: int(float(val or 0))
+
+import frappe  # noqa: E402
+from ecs_cheques.ecs_cheques.overrides.currency_exchange.currency_exchange import (  # noqa: E402
+	clear_exchange_rate_cache,
+	get_exchange_rates,
+)
+
+
+class _Cache:
+	"""In-memory stand-in for frappe.cache()."""
+
+	def __init__(self):
+		self.data = {}
+
+	def get_value(self, key):
+		return self.data.get(key)
+
+	def set_value(self, key, value, expires_in_sec=None):
+		self.data[key] = value
+
+	def delete_keys(self, prefix):
+		for key in [k for k in self.data if k.startswith(prefix)]:
+			del self.data[key]
+
+
+class TestGetExchangeRates(unittest.TestCase):
+
+	def setUp(self):
+		self.cache = _Cache()
+		self.queries = []
+		self.rates = [
+			("USD", "ILS", datetime.date(2024, 1, 10), 3.7),
+			("USD", "ILS", datetime.date(2024, 1, 1), 3.6),
+			("ILS", "JOD", datetime.date(2024, 1, 1), 0.2),
+		]
+
+		def _sql(query, values):
+			self.queries.append(query)
+			# Eight parameters per (from, to, date) lookup; see _LATEST_RATE_QUERY.
+			rows = []
+			for i in range(0, len(values), 8):
+				from_currency, to_currency, date = values[i:i + 3]
+				history = [
+					row for row in self.rates
+					if row[:2] == (from_currency, to_currency) and str(row[2]) <= date and row[3]
+				]
+				if history:
+					rows.append((from_currency, to_currency, date, max(history, key=lambda row: row[2])[3]))
+			return rows
+
+		db = MagicMock()
+		db.sql.side_effect = _sql
+		self.has_permission = MagicMock(return_value=True)
+		patchers = [
+			patch.object(frappe, "has_permission", self.has_permission, create=True),
+			patch.object(frappe, "cache", lambda: self.cache, create=True),
+			patch.object(frappe, "db", db, create=True),
+			patch.object(frappe, "conf", {}, create=True),
+		]
+		for patcher in patchers:
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def _rates(self, pairs):
+		return {
+			(r["from_currency"], r["to_currency"], r["date"]): r["exchange_rate"]
+			for r in get_exchange_rates(pairs)
+		}
+
+	def test_latest_rate_on_or_before_date(self):
+		rates = self._rates([["USD", "ILS", "2024-01-05"], ["USD", "ILS", "2024-01-15"]])
+		self.assertEqual(rates[("USD", "ILS", "2024-01-05")], 3.6)
+		self.assertEqual(rates[("USD", "ILS", "2024-01-15")], 3.7)
+
+	def test_reverse_rate_and_missing_rate(self):
+		rates = self._rates([["JOD", "ILS", "2024-01-05"], ["EUR", "ILS", "2024-01-05"]])
+		self.assertAlmostEqual(rates[("JOD", "ILS", "2024-01-05")], 5.0)
+		self.assertIsNone(rates[("EUR", "ILS", "2024-01-05")])
+
+	def test_requires_read_permission(self):
+		self.has_permission.side_effect = PermissionError
+		with self.assertRaises(PermissionError):
+			get_exchange_rates([["USD", "ILS", "2024-01-05"]])
+		self.has_permission.assert_called_once_with("Currency Exchange", "read", throw=True)
+		self.assertEqual(self.queries, [])
+
+	def test_same_currency_needs_no_query(self):
+		self.assertEqual(self._rates([["ILS", "ILS", "2024-01-05"]]), {("ILS", "ILS", "2024-01-05"): 1.0})
+		self.assertEqual(self.queries, [])
+
+	def test_distinct_pairs_resolved_with_one_query(self):
+		pairs = [["USD", "ILS", "2024-01-05"]] * 300 + [["JOD", "ILS", "2024-01-05"]]
+		result = get_exchange_rates(pairs)
+		self.assertEqual(len(result), 2)
+		self.assertEqual(len(self.queries), 1)
+		# One latest-rate lookup per direction of each distinct pair and date.
+		self.assertEqual(self.queries[0].count("max(date)"), 4)
+
+	def test_second_call_served_from_cache(self):
+		pairs = '[["USD", "ILS", "2024-01-05"], ["EUR", "ILS", "2024-01-05"]]'
+		first = get_exchange_rates(pairs)
+		second = get_exchange_rates(pairs)
+		self.assertEqual(first, second)
+		self.assertEqual(len(self.queries), 1)
+
+	def test_currency_exchange_change_clears_cache(self):
+		self._rates([["USD", "ILS", "2024-01-15"]])
+		self.rates.insert(0, ("USD", "ILS", datetime.date(2024, 1, 12), 3.8))
+		clear_exchange_rate_cache(MagicMock(), "on_update")
+		self.assertEqual(self._rates([["USD", "ILS", "2024-01-15"]])[("USD", "ILS", "2024-01-15")], 3.8)
+		self.assertEqual(len(self.queries), 2)
+
+
+if __name__ == "__main__":
+	unittest.main()
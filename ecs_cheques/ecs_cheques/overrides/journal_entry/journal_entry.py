@@ -13,33 +13,180 @@ from frappe.utils import add_to_date, now, nowdate
 
 @frappe.whitelist()
 def update_payment_entry_on_cancel(doc, method=None):
-	if doc.reference_doctype == "Payment Entry" and doc.reference_link and (doc.pe_status == "محصل فوري" or doc.pe_status == "مظهر" or doc.pe_status == "تحت التحصيل"):
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "حافظة شيكات واردة" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set clearance_date = NULL where name = %s""", doc.reference_link)
-
-	if doc.reference_doctype == "Payment Entry" and doc.pe_status == "تحت التحصيل 2":
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.reference_link)
-
-	if doc.reference_doctype == "Payment Entry" and doc.pe_status == "مردود 1":
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "حافظة شيكات واردة" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.reference_link)
-
-	if doc.reference_doctype == "Payment Entry" and doc.pe_status == "مردود 2":
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.reference_link)
-
-	if doc.reference_doctype == "Payment Entry" and doc.reference_link and (doc.pe_status == "محصل" or doc.pe_status == "مرفوض بالبنك"):
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "تحت التحصيل" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set clearance_date = NULL where name = %s""", doc.reference_link)
-
-	if doc.reference_doctype == "Payment Entry" and doc.reference_link and doc.pe_status == "حافظة شيكات مرجعة":
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.reference_link)
-
-	if doc.reference_doctype == "Payment Entry" and doc.reference_link and (doc.pe_status == "مدفوع" or doc.pe_status == "مسحوب"):
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_status_pay = "حافظة شيكات برسم الدفع" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.reference_link)
-		frappe.db.sql(""" update `tabPayment Entry` set clearance_date = NULL where name = %s""", doc.reference_link)
\ No newline at end of file
+	if doc.reference_doctype != "Payment Entry":
+		return
+	if doc.reference_link:
+		payment_entries = [doc.reference_link]
+	else:
+		# A consolidated cheque entry links each of its lines to its cheque.
+		payment_entries = list(dict.fromkeys(
+			row.cheque_payment_entry for row in doc.accounts if row.get("cheque_payment_entry")))
+	# Cheques reversed on their own were already moved back.
+	reversed_cheques = doc.flags.get("reversed_cheques") or ()
+	for pe_name in payment_entries:
+		if pe_name not in reversed_cheques:
+			revert_cheque_status(pe_name, doc.pe_status)
+
+
+def cancel_cheque_reversals(doc, method=None):
+	"""Cancel the submitted reversals of a consolidated cheque entry before
+	the entry itself, so the GL of the cheques they reversed is not reversed
+	a second time.  Those cheques are then left out of the status revert in
+	:func:`update_payment_entry_on_cancel`."""
+	if doc.reference_doctype != "Payment Entry" or doc.reference_link:
+		return
+	reversals = get_cheque_reversals([doc.name])
+	for reversal in reversals.values():
+		frappe.get_doc("Journal Entry", reversal).cancel()
+	doc.flags.reversed_cheques = set(pe_name for _journal_entry, pe_name in reversals)
+
+
+def get_cheque_reversals(journal_entries, payment_entry=None):
+	"""Return ``{(Journal Entry, Payment Entry): reversal}`` for the submitted
+	:func:`reverse_cheque_lines` entries of *journal_entries*."""
+	filters = {"reversal_of": ["in", journal_entries], "reference_doctype": "Payment Entry", "docstatus": 1}
+	if payment_entry:
+		filters["reference_link"] = payment_entry
+	return dict(
+		((journal_entry, pe_name), reversal)
+		for reversal, journal_entry, pe_name in frappe.get_all(
+			"Journal Entry",
+			filters=filters,
+			fields=["name", "reversal_of", "reference_link"],
+			as_list=True,
+		)
+	)
+
+
+# pe_status of a cheque Journal Entry -> (Payment Entry field, status) the
+# entry moved the cheque to, for the statuses revert_cheque_status undoes.
+CHEQUE_STATUS_SET_BY = {
+	"محصل فوري": ("cheque_status", "محصل فوري"),
+	"مظهر": ("cheque_status", "مظهر"),
+	"تحت التحصيل": ("cheque_status", "تحت التحصيل"),
+	"تحت التحصيل 2": ("cheque_status", "تحت التحصيل"),
+	"مردود 1": ("cheque_status", "مردود"),
+	"مردود 2": ("cheque_status", "مردود"),
+	"محصل": ("cheque_status", "محصل"),
+	"مرفوض بالبنك": ("cheque_status", "مرفوض بالبنك"),
+	"حافظة شيكات مرجعة": ("cheque_status", "حافظة شيكات مرجعة"),
+	"مدفوع": ("cheque_status_pay", "مدفوع"),
+	"مسحوب": ("cheque_status_pay", "مسحوب"),
+}
+
+
+def revert_cheque_status(pe_name, pe_status):
+	"""Move Payment Entry *pe_name* back to the cheque status it had before
+	the Journal Entry with *pe_status* was posted."""
+	if pe_status in ("محصل فوري", "مظهر", "تحت التحصيل"):
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "حافظة شيكات واردة" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set clearance_date = NULL where name = %s""", pe_name)
+
+	if pe_status == "تحت التحصيل 2":
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", pe_name)
+
+	if pe_status == "مردود 1":
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "حافظة شيكات واردة" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", pe_name)
+
+	if pe_status == "مردود 2":
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", pe_name)
+
+	if pe_status in ("محصل", "مرفوض بالبنك"):
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "تحت التحصيل" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set clearance_date = NULL where name = %s""", pe_name)
+
+	if pe_status == "حافظة شيكات مرجعة":
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", pe_name)
+
+	if pe_status in ("مدفوع", "مسحوب"):
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_status_pay = "حافظة شيكات برسم الدفع" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", pe_name)
+		frappe.db.sql(""" update `tabPayment Entry` set clearance_date = NULL where name = %s""", pe_name)
+
+
+@frappe.whitelist()
+def reverse_cheque_lines(journal_entry, payment_entry):
+	"""Reverse the lines of one cheque in a consolidated Journal Entry.
+
+	A Journal Entry with the debits and credits of *payment_entry*'s lines
+	swapped is posted today, and the Payment Entry goes back to its previous
+	cheque status if it is still in the status the entry set; a cheque that
+	has moved on since keeps its status.  The other cheques of the entry are
+	left alone.
+	"""
+	je = frappe.get_doc("Journal Entry", journal_entry)
+	je.check_permission("cancel")
+	if je.docstatus != 1:
+		frappe.throw(_("Journal Entry {0} must be submitted first.").format(journal_entry))
+	rows = [row for row in je.accounts if row.get("cheque_payment_entry") == payment_entry]
+	if not rows:
+		frappe.throw(_("Journal Entry {0} has no lines for Payment Entry {1}.").format(journal_entry, payment_entry))
+	if get_cheque_reversals([journal_entry], payment_entry):
+		frappe.throw(_("Payment Entry {0} is already reversed in Journal Entry {1}.").format(payment_entry, journal_entry))
+
+	# No pe_status: cancelling the reversal must not move the cheque again.
+	# Not a Bank Entry, which would need a cheque number and date.
+	reversal = frappe.get_doc({
+		"doctype": "Journal Entry",
+		"voucher_type": "Journal Entry",
+		"company": je.company,
+		"posting_date": today(),
+		"multi_currency": je.multi_currency,
+		"reversal_of": journal_entry,
+		"reference_doctype": "Payment Entry",
+		"reference_link": payment_entry,
+		"payment_type": je.payment_type,
+		"user_remark": _("Reversal of Payment Entry {0} in {1}").format(payment_entry, journal_entry),
+		"accounts": [{
+			"account": row.account,
+			"party_type": row.party_type,
+			"party": row.party,
+			"cost_center": row.cost_center,
+			"account_currency": row.account_currency,
+			"exchange_rate": row.exchange_rate,
+			"debit_in_account_currency": row.credit_in_account_currency,
+			"credit_in_account_currency": row.debit_in_account_currency,
+			"debit": row.credit,
+			"credit": row.debit,
+			"cheque_payment_entry": payment_entry,
+		} for row in rows],
+	})
+	reversal.insert()
+	reversal.submit()
+	if _cheque_still_in_status(payment_entry, je.pe_status):
+		revert_cheque_status(payment_entry, je.pe_status)
+	return reversal.name
+
+
+def _cheque_still_in_status(pe_name, pe_status):
+	"""Whether Payment Entry *pe_name* is still in the cheque status that the
+	Journal Entry with *pe_status* moved it to."""
+	fieldname, status = CHEQUE_STATUS_SET_BY.get(pe_status, (None, None))
+	return bool(fieldname) and frappe.db.get_value("Payment Entry", pe_name, fieldname) == status
+
+
+@frappe.whitelist()
+def get_reversible_cheque_entries(payment_entry):
+	"""Return the submitted consolidated Journal Entries with lines for
+	*payment_entry* that :func:`reverse_cheque_lines` has not reversed yet."""
+	journal_entries = frappe.get_all(
+		"Journal Entry",
+		filters=[
+			["Journal Entry Account", "cheque_payment_entry", "=", payment_entry],
+			["Journal Entry", "reference_doctype", "=", "Payment Entry"],
+			["Journal Entry", "reference_link", "is", "not set"],
+			["Journal Entry", "docstatus", "=", 1],
+		],
+		pluck="name",
+		distinct=True,
+	)
+	if not journal_entries:
+		return []
+	reversed_entries = set(journal_entry for journal_entry, _pe_name in get_cheque_reversals(journal_entries, payment_entry))
+	return [journal_entry for journal_entry in journal_entries if journal_entry not in reversed_entries]
@@ -0,0 +1,191 @@
+# Copyright (c) 2021, erpcloud.systems and Contributors
+# See license.txt
+"""
+Unit tests for the cheque Journal Entry cancellation and reversal in
+journal_entry.py.
+
+frappe is replaced by a MagicMock inside the module under test, so these
+tests do NOT require a live Frappe/ERPNext instance.
+"""
+
+import sys
+import types
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+def _make_frappe_stub():
+	mod = types.ModuleType("frappe")
+	mod.db = MagicMock()
+	mod._ = lambda s, *a: s
+	mod.whitelist = lambda fn=None, **kw: (fn if fn else lambda f: f)
+	return mod
+
+
+sys.modules.setdefault("frappe", _make_frappe_stub())
+sys.modules.setdefault("frappe.model", types.ModuleType("frappe.model"))
+_document = sys.modules.setdefault("frappe.model.document", types.ModuleType("frappe.model.document"))
+if not hasattr(_document, "Document"):
+	_document.Document = object
+sys.modules.setdefault("frappe.desk", types.ModuleType("frappe.desk"))
+sys.modules.setdefault("frappe.desk.search", types.ModuleType("frappe.desk.search"))
+sys.modules["frappe.desk.search"].sanitize_searchfield = lambda s: s
+_utils = sys.modules.setdefault("frappe.utils", types.ModuleType("frappe.utils"))
+for _name in ("flt", "getdate", "get_url", "now", "nowtime", "get_time", "today",
+		"get_datetime", "add_days", "add_to_date", "nowdate"):
+	if not hasattr(_utils, _name):
+		setattr(_utils, _name, MagicMock())
+
+from ecs_cheques.ecs_cheques.overrides.journal_entry import journal_entry  # noqa: E402
+from ecs_cheques.ecs_cheques.overrides.journal_entry.journal_entry import (  # noqa: E402
+	cancel_cheque_reversals,
+	get_reversible_cheque_entries,
+	reverse_cheque_lines,
+	update_payment_entry_on_cancel,
+)
+
+
+class _Flags(dict):
+
+	__getattr__ = dict.get
+
+	def __setattr__(self, key, value):
+		self[key] = value
+
+
+class _Row(types.SimpleNamespace):
+
+	def get(self, fieldname):
+		return getattr(self, fieldname, None)
+
+
+def _row(account, debit, credit, cheque_payment_entry):
+	return _Row(
+		account=account, party_type=None, party=None, cost_center="Main", account_currency="EGP",
+		exchange_rate=1, debit_in_account_currency=debit, credit_in_account_currency=credit,
+		debit=debit, credit=credit, cheque_payment_entry=cheque_payment_entry,
+	)
+
+
+def _consolidated_je(**kwargs):
+	values = dict(
+		name="JE-1", docstatus=1, company="Test Co", voucher_type="Bank Entry", multi_currency=0,
+		payment_type="Receive", reference_doctype="Payment Entry", reference_link=None,
+		pe_status="تحت التحصيل", check_permission=MagicMock(), flags=_Flags(),
+		accounts=[
+			_row("Under Collection", 100, 0, "PE-1"), _row("Cheque Wallet", 0, 100, "PE-1"),
+			_row("Under Collection", 250, 0, "PE-2"), _row("Cheque Wallet", 0, 250, "PE-2"),
+		],
+	)
+	values.update(kwargs)
+	return types.SimpleNamespace(**values)
+
+
+class TestChequeJournalEntryCancel(unittest.TestCase):
+
+	def setUp(self):
+		self.fake = MagicMock()
+		patcher = patch.object(journal_entry, "frappe", self.fake)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def _updated(self):
+		return sorted(set(c.args[1] for c in self.fake.db.sql.call_args_list))
+
+	def test_single_cheque_entry(self):
+		update_payment_entry_on_cancel(_consolidated_je(reference_link="PE-9"))
+		self.assertEqual(self._updated(), ["PE-9"])
+
+	def test_consolidated_entry_reverts_every_cheque(self):
+		update_payment_entry_on_cancel(_consolidated_je())
+		self.assertEqual(self._updated(), ["PE-1", "PE-2"])
+		self.assertIn("حافظة شيكات واردة", self.fake.db.sql.call_args_list[0].args[0])
+
+	def test_other_entries_ignored(self):
+		update_payment_entry_on_cancel(_consolidated_je(reference_doctype=None, reference_link="PE-9"))
+		self.fake.db.sql.assert_not_called()
+
+	def test_reversals_cancelled_first_and_their_cheques_skipped(self):
+		self.fake.get_all.return_value = [["JE-2", "JE-1", "PE-1"]]
+		doc = _consolidated_je()
+		cancel_cheque_reversals(doc)
+		self.fake.get_doc.assert_called_once_with("Journal Entry", "JE-2")
+		self.fake.get_doc.return_value.cancel.assert_called_once_with()
+		update_payment_entry_on_cancel(doc)
+		self.assertEqual(self._updated(), ["PE-2"])
+
+	def test_single_cheque_entry_has_no_reversals(self):
+		cancel_cheque_reversals(_consolidated_je(reference_link="PE-9"))
+		self.fake.get_all.assert_not_called()
+		self.fake.get_doc.assert_not_called()
+
+
+class TestReverseChequeLines(unittest.TestCase):
+
+	def setUp(self):
+		self.fake = MagicMock()
+		self.fake._ = lambda s, *a: s
+		self.fake.throw.side_effect = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+		self.fake.get_all.return_value = []
+		# The cheque is still in the status the consolidated entry set.
+		self.fake.db.get_value.return_value = "تحت التحصيل"
+		self.je = _consolidated_je()
+		self.reversal = MagicMock()
+		self.reversal.name = "JE-2"
+		self.fake.get_doc.side_effect = lambda doctype, name=None: self.je if name else self.reversal
+		for attr, value in (("frappe", self.fake), ("today", lambda: "2024-05-01")):
+			patcher = patch.object(journal_entry, attr, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def test_reverses_only_that_cheque(self):
+		self.assertEqual(reverse_cheque_lines("JE-1", "PE-2"), "JE-2")
+		values = self.fake.get_doc.call_args_list[-1].args[0]
+		self.assertEqual(
+			[(row["account"], row["debit"], row["credit"]) for row in values["accounts"]],
+			[("Under Collection", 0, 250), ("Cheque Wallet", 250, 0)],
+		)
+		self.assertEqual((values["reversal_of"], values["reference_link"]), ("JE-1", "PE-2"))
+		self.assertEqual(values["voucher_type"], "Journal Entry")
+		self.assertNotIn("cheque_no", values)
+		self.assertNotIn("pe_status", values)
+		self.reversal.submit.assert_called_once_with()
+		self.assertEqual(sorted(set(c.args[1] for c in self.fake.db.sql.call_args_list)), ["PE-2"])
+
+	def test_cheque_that_moved_on_keeps_its_status(self):
+		self.fake.db.get_value.return_value = "محصل"
+		self.assertEqual(reverse_cheque_lines("JE-1", "PE-2"), "JE-2")
+		self.fake.db.get_value.assert_called_once_with("Payment Entry", "PE-2", "cheque_status")
+		self.reversal.submit.assert_called_once_with()
+		self.fake.db.sql.assert_not_called()
+
+	def test_already_reversed(self):
+		self.fake.get_all.return_value = [["JE-2", "JE-1", "PE-2"]]
+		with self.assertRaises(Exception):
+			reverse_cheque_lines("JE-1", "PE-2")
+		self.reversal.insert.assert_not_called()
+
+	def test_cheque_not_in_entry(self):
+		with self.assertRaises(Exception):
+			reverse_cheque_lines("JE-1", "PE-3")
+		self.fake.db.sql.assert_not_called()
+
+
+class TestReversibleChequeEntries(unittest.TestCase):
+
+	def setUp(self):
+		self.fake = MagicMock()
+		patcher = patch.object(journal_entry, "frappe", self.fake)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_already_reversed_entries_left_out(self):
+		self.fake.get_all.side_effect = [["JE-1", "JE-3"], [["JE-2", "JE-1", "PE-2"]]]
+		self.assertEqual(get_reversible_cheque_entries("PE-2"), ["JE-3"])
+		self.assertEqual(
+			self.fake.get_all.call_args_list[1].kwargs["filters"]["reference_link"], "PE-2")
+
+	def test_no_consolidated_entries(self):
+		self.fake.get_all.return_value = []
+		self.assertEqual(get_reversible_cheque_entries("PE-2"), [])
+		self.assertEqual(self.fake.get_all.call_count, 1)
@@ -110,6 +110,10 @@ frappe.ui.form.on("Payment Entry", {
         if (frm.doc.docstatus == "1" && frm.doc.mode_of_payment_type == "Cheque" && (frm.doc.cheque_status == "مظهر" || frm.doc.cheque_status == "محصل فوري" || frm.doc.cheque_status == "مردود" || frm.doc.cheque_status == "محصل" || frm.doc.cheque_status_pay == "مدفوع" || frm.doc.cheque_status_pay == "مسحوب")){
             set_field_options("cheque_action", [" "]);
         }
+
+        if (frm.doc.docstatus == "1" && frm.doc.mode_of_payment_type == "Cheque") {
+            ecs_add_cheque_reversal_buttons(frm);
+        }
     },
 
     // Issue 2: re-sync when currency or amount fields change
@@ -183,4 +187,37 @@ function ecs_sync_same_currency_amounts(frm) {
     } finally {
         frm._ecs_syncing = false;
     }
-}
\ No newline at end of file
+}
+
+/**
+ * One button per consolidated Journal Entry that still carries lines for this
+ * cheque: it posts a reversal of those lines only and moves the cheque back
+ * to its previous status, leaving the other cheques of the entry alone.
+ */
+function ecs_add_cheque_reversal_buttons(frm) {
+    frappe.call({
+        method: "ecs_cheques.ecs_cheques.overrides.journal_entry.journal_entry.get_reversible_cheque_entries",
+        args: { payment_entry: frm.doc.name },
+        callback(r) {
+            (r.message || []).forEach(je_name => {
+                frm.add_custom_button(je_name, () => {
+                    frappe.confirm(
+                        __("عكس قيود هذا الشيك فقط في قيد اليومية المجمع {0}؟", [je_name]),
+                        () => frappe.call({
+                            method: "ecs_cheques.ecs_cheques.overrides.journal_entry.journal_entry.reverse_cheque_lines",
+                            args: { journal_entry: je_name, payment_entry: frm.doc.name },
+                            freeze: true,
+                            callback(res) {
+                                frappe.show_alert({
+                                    message: __("تم إنشاء قيد العكس {0}", [res.message]),
+                                    indicator: "green"
+                                });
+                                frm.reload_doc();
+                            }
+                        })
+                    );
+                }, __("عكس قيد مجمع"));
+            });
+        }
+    });
+}
@@ -9,15 +9,15 @@ from frappe import _
 from frappe.desk.search import sanitize_searchfield
 from frappe.utils import (flt, getdate, get_url, now,
 nowtime, get_time, today, get_datetime, add_days)
-from frappe.utils import add_to_date, now, nowdate
+from frappe.utils import add_to_date, cint, now, nowdate
+from ecs_cheques.ecs_cheques.overrides.account.account import get_account_currency
+from ecs_cheques.ecs_cheques.overrides.company.company import get_company_cheque_settings
+from ecs_cheques.ecs_cheques.overrides.journal_entry.journal_entry import revert_cheque_status
 
 
 def _get_account_currency(account_name, company_currency):
     """Return the account's currency, or company_currency if not found."""
-    if not account_name:
-        return company_currency
-    acc_currency = frappe.db.get_value("Account", account_name, "account_currency")
-    return acc_currency or company_currency
+    return get_account_currency(account_name) or company_currency
 
 
 def _je_account(account, amount_company, is_debit, doc, company_currency,
@@ -187,536 +187,527 @@ def _get_cheque_paid_amount(doc, company_currency):
     return paid_amount_company
 
 
+# Messages for the fields an action needs before it can run.
+_BANK_REQUIRED = " برجاء تحديد البنك والحساب البنكي "
+_BANK_ACCOUNT_REQUIRED = "برجاء تحديد الحساب البنكي"
+_CURRENT_ACCOUNT_REQUIRED = " برجاء تحديد الحساب الجاري داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "
+_COLLECTION_ACCOUNT_REQUIRED = " برجاء تحديد حساب برسم التحصيل داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "
+_PAYABLE_ACCOUNT_REQUIRED = " برجاء تحديد حساب برسم الدفع داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "
+
+# cheque_action -> [(fieldname, only with bank commission, message)], checked
+# in order before the action's transition runs.
+CHEQUE_ACTION_REQUIRED_FIELDS = {
+    "إيداع شيك تحت التحصيل": [
+        ("cheque_bank", False, _BANK_REQUIRED),
+        ("bank_acc", False, _BANK_ACCOUNT_REQUIRED),
+        ("account", True, _CURRENT_ACCOUNT_REQUIRED),
+        ("collection_fee_account", False, _COLLECTION_ACCOUNT_REQUIRED),
+    ],
+    "صرف شيك تحت التحصيل": [
+        ("account", False, _CURRENT_ACCOUNT_REQUIRED),
+        ("collection_fee_account", False, _COLLECTION_ACCOUNT_REQUIRED),
+    ],
+    "رفض شيك تحت التحصيل": [
+        ("account", True, _CURRENT_ACCOUNT_REQUIRED),
+        ("collection_fee_account", False, _COLLECTION_ACCOUNT_REQUIRED),
+    ],
+    "صرف الشيك": [
+        ("account", False, _CURRENT_ACCOUNT_REQUIRED),
+        ("payable_account", False, _PAYABLE_ACCOUNT_REQUIRED),
+        ("bank_acc", False, _BANK_ACCOUNT_REQUIRED),
+    ],
+    "سحب الشيك": [
+        ("bank_acc", False, _BANK_ACCOUNT_REQUIRED),
+    ],
+}
+
+# Company defaults an account line can refer to by name.
+CHEQUE_COMPANY_ACCOUNTS = (
+    "default_payback_cheque_wallet_account",
+    "default_rejected_cheque_account",
+    "default_cash_account",
+    "default_bank_commissions_account",
+)
+
+# Accounts looked up only by the transitions that use them.
+_CHEQUE_ACCOUNT_LOOKUPS = {
+    "new_mode_of_payment_account": lambda doc: frappe.db.get_value(
+        "Mode of Payment Account", {"parent": doc.new_mode_of_payment}, "default_account"),
+    "old_mode_of_payment_account": lambda doc: frappe.db.get_value(
+        "Mode of Payment Account", {"parent": doc.mode_of_payment}, "default_account"),
+}
+
+# Parties an account line can carry: name -> (party type, party) of the doc.
+_CHEQUE_PARTIES = {
+    "party": lambda doc: (doc.party_type, doc.party),
+    "customer": lambda doc: ("Customer", doc.party),
+    "endorsee": lambda doc: (doc.party_type_, doc.party_),
+}
+
+
+def _line(account, is_debit, amount=None, party=None):
+    """An account line of a cheque transition's Journal Entry.
+
+    *account* is a Payment Entry field, a name in CHEQUE_COMPANY_ACCOUNTS
+    or a key of _CHEQUE_ACCOUNT_LOOKUPS; *amount* is the Payment Entry
+    field holding the amount, or None for the cheque amount in company
+    currency; *party* is a key of _CHEQUE_PARTIES.
+    """
+    return (account, is_debit, amount, party)
+
+
+# Paying out an issued cheque, for either payment type that issues them.
+_PAY_OUT_CHEQUE = {
+    "status_field": "cheque_status_pay",
+    "status": "مدفوع",
+    "pe_status": "مدفوع",
+    "lines": [_line("payable_account", True), _line("account", False)],
+    "set_clearance_date": True,
+}
+
+# (payment_type, cheque_status, cheque_action, with_bank_commission) ->
+# transition.  None in a key matches any value; see get_cheque_transition.
+#
+# A transition has the account lines of its Journal Entry, its pe_status,
+# the status it moves the cheque to ("status" in "status_field") and
+# optionally:
+#   set_clearance_date  -- set clearance_date to the action date
+#   reset               -- further Payment Entry fields to reset
+#   skip_same_accounts  -- no Journal Entry when debit and credit accounts match
+#   append_log          -- record the move in the Payment Entry's logs
+#   default_to_today    -- post today when the action date is blank
+CHEQUE_TRANSITIONS = {
+    (None, None, "تحويل إلى حافظة شيكات أخرى", None): {
+        "pe_status": "حافظة شيكات واردة",
+        "lines": [
+            _line("new_mode_of_payment_account", True),
+            _line("old_mode_of_payment_account", False),
+        ],
+        "skip_same_accounts": True,
+        "append_log": True,
+    },
+    (None, None, "تحصيل فوري للشيك", None): {
+        "status": "محصل فوري",
+        "pe_status": "محصل فوري",
+        "lines": [_line("default_cash_account", True), _line("paid_to", False)],
+        "set_clearance_date": True,
+    },
+    (None, None, "إيداع شيك تحت التحصيل", True): {
+        "status": "تحت التحصيل",
+        "pe_status": "تحت التحصيل",
+        "lines": [
+            _line("collection_fee_account", True),
+            _line("default_bank_commissions_account", True, "co3_"),
+            _line("paid_to", False),
+            _line("account", False, "co3_"),
+        ],
+    },
+    (None, None, "إيداع شيك تحت التحصيل", False): {
+        "status": "تحت التحصيل",
+        "pe_status": "تحت التحصيل",
+        "lines": [_line("collection_fee_account", True), _line("paid_to", False)],
+    },
+    (None, "مرفوض بالبنك", "إيداع شيك تحت التحصيل", True): {
+        "status": "تحت التحصيل",
+        "pe_status": "تحت التحصيل 2",
+        "lines": [
+            _line("collection_fee_account", True),
+            _line("default_bank_commissions_account", True, "co3_"),
+            _line("default_payback_cheque_wallet_account", False),
+            _line("account", False, "co3_"),
+        ],
+    },
+    (None, "مرفوض بالبنك", "إيداع شيك تحت التحصيل", False): {
+        "status": "تحت التحصيل",
+        "pe_status": "تحت التحصيل 2",
+        "lines": [_line("collection_fee_account", True), _line("default_payback_cheque_wallet_account", False)],
+    },
+    (None, "مرفوض بالبنك", "إرجاع لحافظة شيكات واردة", False): {
+        "status": "حافظة شيكات واردة",
+        "pe_status": "حافظة شيكات واردة",
+        "lines": [_line("paid_to", True), _line("default_rejected_cheque_account", False)],
+    },
+    (None, "مرفوض بالبنك", "رد شيك", False): {
+        "status": "مردود",
+        "pe_status": "مردود 2",
+        "lines": [_line("paid_from", True, party="customer"), _line("paid_to", False)],
+    },
+    (None, "حافظة شيكات واردة", "رد شيك", None): {
+        "status": "مردود",
+        "pe_status": "مردود 1",
+        "lines": [_line("paid_from", True, party="party"), _line("paid_to", False)],
+    },
+    (None, None, "صرف شيك تحت التحصيل", None): {
+        "status": "محصل",
+        "pe_status": "محصل",
+        "lines": [_line("account", True), _line("collection_fee_account", False)],
+        "set_clearance_date": True,
+    },
+    (None, None, "رفض شيك تحت التحصيل", True): {
+        "status": "مرفوض بالبنك",
+        "pe_status": "مرفوض بالبنك",
+        "lines": [
+            _line("default_payback_cheque_wallet_account", True),
+            _line("default_bank_commissions_account", True, "co5_"),
+            _line("collection_fee_account", False),
+            _line("account", False, "co5_"),
+        ],
+    },
+    (None, None, "رفض شيك تحت التحصيل", False): {
+        "status": "مرفوض بالبنك",
+        "pe_status": "مرفوض بالبنك",
+        "lines": [_line("default_payback_cheque_wallet_account", True), _line("collection_fee_account", False)],
+    },
+    (None, None, "تظهير شيك", None): {
+        "status": "مظهر",
+        "pe_status": "مظهر",
+        "lines": [_line("account_1", True, party="endorsee"), _line("paid_to", False)],
+    },
+    (None, None, "تسييل الشيك", None): {
+        "status": "حافظة شيكات مرجعة",
+        "pe_status": "حافظة شيكات مرجعة",
+        "lines": [
+            _line("default_cash_account", True, "encashment_amount"),
+            _line("default_payback_cheque_wallet_account", False, "encashment_amount"),
+        ],
+        "reset": {"encashment_amount": 0},
+    },
+    (None, None, "سحب شيك من التحصيل", None): {
+        "status": "حافظة شيكات واردة",
+        "pe_status": "سحب من التحصيل",
+        "lines": [_line("paid_to", True), _line("collection_fee_account", False)],
+        "default_to_today": True,
+    },
+    (None, None, "سحب الشيك", None): {
+        "status_field": "cheque_status_pay",
+        "status": "مسحوب",
+        "pe_status": "مسحوب",
+        "lines": [_line("payable_account", True), _line("paid_to", False, party="party")],
+    },
+    ("Pay", None, "صرف الشيك", None): _PAY_OUT_CHEQUE,
+    ("Internal Transfer", None, "صرف الشيك", None): _PAY_OUT_CHEQUE,
+}
+
+
+def get_cheque_transition(payment_type, cheque_status, cheque_action, with_bank_commission):
+    """Return the CHEQUE_TRANSITIONS entry for a cheque action, or None.
+
+    The most specific key wins: an exact payment type beats a wildcard, then
+    an exact status, then an exact bank-commission flag.  At most eight keys
+    are probed, however many transitions are registered.
+    """
+    if not cheque_action:
+        return None
+    with_bank_commission = bool(with_bank_commission)
+    for key_payment_type in (payment_type, None):
+        for key_status in (cheque_status, None):
+            for key_commission in (with_bank_commission, None):
+                transition = CHEQUE_TRANSITIONS.get(
+                    (key_payment_type, key_status, cheque_action, key_commission))
+                if transition:
+                    return transition
+    return None
+
+
+def _validate_cheque_action(doc):
+    """Throw if a field the cheque action needs is missing."""
+    for fieldname, only_with_commission, message in CHEQUE_ACTION_REQUIRED_FIELDS.get(doc.cheque_action, ()):
+        if only_with_commission and not doc.with_bank_commission:
+            continue
+        if not doc.get(fieldname):
+            frappe.throw(_(message))
+
+    if doc.cheque_action == "تسييل الشيك":
+        if not doc.encashment_amount:
+            frappe.throw(_("برجاء إدخال مبلغ التسييل"))
+        if doc.encashment_amount > doc.paid_amount:
+            frappe.throw(_("مبلغ التسييل لا يمكن أن يكون أكبر من مبلغ الشيك"))
+        if doc.encashed_amount > doc.paid_amount:
+            frappe.throw(_("مبلغ التسييل لا يمكن أن يكون أكبر من المبلغ الغير مسيل"))
+
+
 @frappe.whitelist()
 def cheque(doc, method=None):
-    default_payback_cheque_wallet_account = frappe.db.get_value("Company", doc.company, "default_payback_cheque_wallet_account")
-    default_rejected_cheque_account = frappe.db.get_value("Company", doc.company, "default_rejected_cheque_account")
-    default_cash_account = frappe.db.get_value("Company", doc.company, "default_cash_account")
-    default_bank_commissions_account = frappe.db.get_value("Company", doc.company, "default_bank_commissions_account")
+    """Run the transition of the Payment Entry's cheque action, if any: post
+    its Journal Entry and move the cheque to its new status."""
+    _validate_cheque_action(doc)
+    transition = get_cheque_transition(
+        doc.payment_type, doc.cheque_status, doc.cheque_action, doc.with_bank_commission)
+    if not transition:
+        return
 
     # Company currency and the payment amount expressed in company currency.
     # Always derived from the linked Cheque Table Receive (when present) so that
     # both debit and credit accounts use the same base amount, preventing the
     # "Total Debit must equal Total Credit" validation error.
-    company_currency = frappe.db.get_value("Company", doc.company, "default_currency") or ""
+    settings = get_company_cheque_settings(doc.company)
+    company_currency = settings.get("default_currency") or ""
+    # _get_cheque_paid_amount may align target_exchange_rate with the cheque
+    # table for the Journal Entry only; the stored value is left alone.
+    target_exchange_rate = doc.target_exchange_rate
     paid_amount_company = _get_cheque_paid_amount(doc, company_currency)
+    company_accounts = {fieldname: settings.get(fieldname) for fieldname in CHEQUE_COMPANY_ACCOUNTS}
 
-    if not doc.cheque_bank and doc.cheque_action == "إيداع شيك تحت التحصيل":
-        frappe.throw(_(" برجاء تحديد البنك والحساب البنكي "))
-
-    if not doc.bank_acc and doc.cheque_action == "إيداع شيك تحت التحصيل":
-        frappe.throw(_("برجاء تحديد الحساب البنكي"))
-
-    if not doc.account and doc.cheque_action == "إيداع شيك تحت التحصيل" and doc.with_bank_commission:
-        frappe.throw(_(" برجاء تحديد الحساب الجاري داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if not doc.account and doc.cheque_action == "صرف شيك تحت التحصيل":
-        frappe.throw(_(" برجاء تحديد الحساب الجاري داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if not doc.account and doc.cheque_action == "رفض شيك تحت التحصيل" and doc.with_bank_commission:
-        frappe.throw(_(" برجاء تحديد الحساب الجاري داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if not doc.account and doc.cheque_action == "صرف الشيك":
-        frappe.throw(_(" برجاء تحديد الحساب الجاري داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if not doc.collection_fee_account and doc.cheque_action == "إيداع شيك تحت التحصيل":
-        frappe.throw(_(" برجاء تحديد حساب برسم التحصيل داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if not doc.collection_fee_account and doc.cheque_action == "صرف شيك تحت التحصيل":
-        frappe.throw(_(" برجاء تحديد حساب برسم التحصيل داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if not doc.collection_fee_account and doc.cheque_action == "رفض شيك تحت التحصيل":
-        frappe.throw(_(" برجاء تحديد حساب برسم التحصيل داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if not doc.payable_account and doc.cheque_action == "صرف الشيك":
-        frappe.throw(_(" برجاء تحديد حساب برسم الدفع داخل الحساب البنكي وإعادة إختيار الحساب البنكي مرة أخرى "))
-
-    if doc.cheque_action == "تحويل إلى حافظة شيكات أخرى":
-        new_mode_of_payment_account = frappe.db.get_value('Mode of Payment Account', {'parent': doc.new_mode_of_payment}, 'default_account')
-        old_mode_of_payment_account = frappe.db.get_value("Mode of Payment Account", {'parent': doc.mode_of_payment}, 'default_account')
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        if not new_mode_of_payment_account == old_mode_of_payment_account:
-            accounts = [
-                _je_account(new_mode_of_payment_account, paid_amount_company, True, doc, company_currency),
-                _je_account(old_mode_of_payment_account, paid_amount_company, False, doc, company_currency),
-            ]
-            new_doc = frappe.get_doc({
-                "doctype": "Journal Entry",
-                "voucher_type": "Bank Entry",
-                "reference_doctype": "Payment Entry",
-                "reference_link": doc.name,
-                "cheque_no": doc.reference_no,
-                "cheque_date": doc.reference_date,
-                "pe_status": "حافظة شيكات واردة",
-                "posting_date": doc.cheque_action_date,
-                "multi_currency": 1 if _needs_multi_currency([new_mode_of_payment_account, old_mode_of_payment_account], company_currency) else 0,
-                "accounts": accounts,
-                "payment_type": doc.payment_type,
-                "user_remark": doc.party_name
-
-            })
-            new_doc.insert()
-            new_doc.submit()
-            #frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-            #doc.reload()
-
-        x = str(doc.logs) + "\n" + str(doc.new_mode_of_payment) + " " + str(doc.cheque_action_date)
-        frappe.db.set_value('Payment Entry', doc.name, 'logs', x)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "تحصيل فوري للشيك":
-        frappe.db.sql("""update `tabPayment Entry` set clearance_date = %s where name=%s """, (doc.cheque_action_date, doc.name))
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "محصل فوري" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(default_cash_account, paid_amount_company, True, doc, company_currency),
-            _je_account(doc.paid_to, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "محصل فوري",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([default_cash_account, doc.paid_to], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
+    _run_cheque_transition(doc, transition, company_accounts, company_currency, paid_amount_company)
+    doc.target_exchange_rate = target_exchange_rate
 
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "إيداع شيك تحت التحصيل" and doc.with_bank_commission and not doc.cheque_status == "مرفوض بالبنك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "تحت التحصيل" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.collection_fee_account, paid_amount_company, True, doc, company_currency),
-            _je_account(default_bank_commissions_account, flt(doc.co3_), True, doc, company_currency),
-            _je_account(doc.paid_to, paid_amount_company, False, doc, company_currency),
-            _je_account(doc.account, flt(doc.co3_), False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "تحت التحصيل",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.collection_fee_account, default_bank_commissions_account, doc.paid_to, doc.account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "إيداع شيك تحت التحصيل" and not doc.with_bank_commission and not doc.cheque_status == "مرفوض بالبنك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "تحت التحصيل" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.collection_fee_account, paid_amount_company, True, doc, company_currency),
-            _je_account(doc.paid_to, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "تحت التحصيل",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.collection_fee_account, doc.paid_to], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "إيداع شيك تحت التحصيل" and not doc.with_bank_commission and doc.cheque_status == "مرفوض بالبنك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "تحت التحصيل" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.collection_fee_account, paid_amount_company, True, doc, company_currency),
-            _je_account(default_payback_cheque_wallet_account, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "تحت التحصيل 2",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.collection_fee_account, default_payback_cheque_wallet_account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-
-    if doc.cheque_action == "إرجاع لحافظة شيكات واردة" and not doc.with_bank_commission and doc.cheque_status == "مرفوض بالبنك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "حافظة شيكات واردة" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.paid_to, paid_amount_company, True, doc, company_currency),
-            _je_account(default_rejected_cheque_account, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "حافظة شيكات واردة",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.paid_to, default_rejected_cheque_account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "رد شيك" and not doc.with_bank_commission and doc.cheque_status == "مرفوض بالبنك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مردود" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.paid_from, paid_amount_company, True, doc, company_currency,
-                        party_type="Customer", party=doc.party),
-            _je_account(doc.paid_to, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "مردود 2",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.paid_from, doc.paid_to], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "إيداع شيك تحت التحصيل" and doc.with_bank_commission and doc.cheque_status == "مرفوض بالبنك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "تحت التحصيل" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.collection_fee_account, paid_amount_company, True, doc, company_currency),
-            _je_account(default_bank_commissions_account, flt(doc.co3_), True, doc, company_currency),
-            _je_account(default_payback_cheque_wallet_account, paid_amount_company, False, doc, company_currency),
-            _je_account(doc.account, flt(doc.co3_), False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "تحت التحصيل 2",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.collection_fee_account, default_bank_commissions_account, default_payback_cheque_wallet_account, doc.account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "صرف شيك تحت التحصيل":
-        frappe.db.sql("""update `tabPayment Entry` set clearance_date = %s where name=%s """, (doc.cheque_action_date, doc.name))
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "محصل" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.account, paid_amount_company, True, doc, company_currency),
-            _je_account(doc.collection_fee_account, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "محصل",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.account, doc.collection_fee_account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "رفض شيك تحت التحصيل" and doc.with_bank_commission:
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""",
-                      doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(default_payback_cheque_wallet_account, paid_amount_company, True, doc, company_currency),
-            _je_account(default_bank_commissions_account, flt(doc.co5_), True, doc, company_currency),
-            _je_account(doc.collection_fee_account, paid_amount_company, False, doc, company_currency),
-            _je_account(doc.account, flt(doc.co5_), False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "مرفوض بالبنك",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([default_payback_cheque_wallet_account, default_bank_commissions_account, doc.collection_fee_account, doc.account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "رفض شيك تحت التحصيل" and not doc.with_bank_commission:
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مرفوض بالبنك" where name = %s""",
-                      doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(default_payback_cheque_wallet_account, paid_amount_company, True, doc, company_currency),
-            _je_account(doc.collection_fee_account, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "مرفوض بالبنك",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([default_payback_cheque_wallet_account, doc.collection_fee_account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "تظهير شيك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مظهر" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.account_1, paid_amount_company, True, doc, company_currency,
-                        party_type=doc.party_type_, party=doc.party_),
-            _je_account(doc.paid_to, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
+
+def _run_cheque_transition(doc, transition, company_accounts, company_currency, paid_amount_company):
+    """Post the Journal Entry of *transition* for *doc* and update the
+    Payment Entry's cheque status.
+
+    All the Payment Entry fields the transition changes are written in one
+    UPDATE and applied to *doc* in place, so it does not need a reload.
+
+    When ``doc.flags.cheque_journal_entries`` is a dict the Journal Entry is
+    added to it instead of being posted; see
+    :func:`_collect_cheque_journal_entry`.
+    """
+    accounts = []
+    for account, is_debit, amount_field, party in transition["lines"]:
+        if account in company_accounts:
+            account = company_accounts[account]
+        elif account in _CHEQUE_ACCOUNT_LOOKUPS:
+            account = _CHEQUE_ACCOUNT_LOOKUPS[account](doc)
+        else:
+            account = doc.get(account)
+        amount = flt(doc.get(amount_field)) if amount_field else paid_amount_company
+        party_type, party = _CHEQUE_PARTIES[party](doc) if party else (None, None)
+        accounts.append((account, amount, is_debit, party_type, party))
+
+    account_names = [account for account, _amount, _is_debit, _party_type, _party in accounts]
+    journal_entry = None
+    if not (transition.get("skip_same_accounts") and len(set(account_names)) == 1):
+        journal_entry = {
             "doctype": "Journal Entry",
             "voucher_type": "Bank Entry",
             "reference_doctype": "Payment Entry",
             "reference_link": doc.name,
             "cheque_no": doc.reference_no,
             "cheque_date": doc.reference_date,
-            "pe_status": "مظهر",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.account_1, doc.paid_to], company_currency) else 0,
-            "accounts": accounts,
+            "pe_status": transition["pe_status"],
+            "posting_date": doc.cheque_action_date or (today() if transition.get("default_to_today") else None),
+            "multi_currency": 1 if _needs_multi_currency(account_names, company_currency) else 0,
+            "accounts": [
+                dict(_je_account(account, amount, is_debit, doc, company_currency,
+                                 party_type=party_type, party=party),
+                     cheque_payment_entry=doc.name)
+                for account, amount, is_debit, party_type, party in accounts
+            ],
             "payment_type": doc.payment_type,
             "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
+        }
+
+    changes = {"cheque_action": "", "cheque_action_date": None}
+    if transition.get("status"):
+        changes[transition.get("status_field", "cheque_status")] = transition["status"]
+    if transition.get("set_clearance_date"):
+        changes["clearance_date"] = doc.cheque_action_date
+    if transition.get("append_log"):
+        changes["logs"] = str(doc.logs) + "\n" + str(doc.new_mode_of_payment) + " " + str(doc.cheque_action_date)
+    changes.update(transition.get("reset") or {})
+    # Written before the Journal Entry is submitted, as the action must be
+    # cleared before anything else can act on the Payment Entry.
+    frappe.db.set_value("Payment Entry", doc.name, changes, update_modified=False)
+
+    collector = doc.flags.get("cheque_journal_entries")
+    if journal_entry and collector is not None:
+        _collect_cheque_journal_entry(collector, doc, journal_entry, account_names, company_currency)
+    elif journal_entry:
+        _submit_journal_entry(journal_entry)
+    doc.update(changes)
+
+
+def _collect_cheque_journal_entry(collector, doc, journal_entry, account_names, company_currency):
+    """Add *journal_entry* to the group of *collector* with the same company,
+    status, posting date, accounts and currency; see
+    :func:`_post_consolidated_journal_entries`."""
+    key = (doc.company, journal_entry["payment_type"], journal_entry["pe_status"],
+           journal_entry["posting_date"], tuple(account_names), company_currency)
+    collector.setdefault(key, []).append(journal_entry)
+
+
+def _post_consolidated_journal_entries(collector):
+    """Post one Journal Entry per group of *collector*.
+
+    Every line keeps its ``cheque_payment_entry``, so the cheques stay
+    traceable and can be reversed one at a time with
+    ``journal_entry.reverse_cheque_lines``.  A group that cannot be posted
+    is rolled back and posted one Journal Entry per cheque instead, so the
+    failure is reported against the cheque that caused it.  Returns a
+    result per failed cheque, as :func:`_apply_cheque_action_to` does.
+    """
+    failed = []
+    for journal_entries in collector.values():
+        if len(journal_entries) > 1:
+            frappe.db.savepoint("cheque_journal_entry")
+            try:
+                _submit_journal_entry(_merge_cheque_journal_entries(journal_entries))
+                continue
+            except Exception:
+                frappe.db.rollback(save_point="cheque_journal_entry")
+                frappe.clear_last_message()
+        failed += _post_cheque_journal_entries(journal_entries)
+    return failed
+
+
+def _merge_cheque_journal_entries(journal_entries):
+    merged = dict(journal_entries[0])
+    # The header no longer describes a single cheque.  A Bank Entry needs
+    # one cheque number and date, so the entry is a plain Journal Entry.
+    merged.update(
+        voucher_type="Journal Entry",
+        reference_link=None,
+        cheque_no=None,
+        cheque_date=None,
+        user_remark=_("Consolidated entry for {0} cheques").format(len(journal_entries)),
+        multi_currency=max(journal_entry["multi_currency"] for journal_entry in journal_entries),
+        accounts=[row for journal_entry in journal_entries for row in journal_entry["accounts"]],
+    )
+    return merged
 
-    if not doc.encashment_amount and doc.cheque_action == "تسييل الشيك":
-        frappe.throw(_("برجاء إدخال مبلغ التسييل"))
 
-    if doc.encashment_amount > doc.paid_amount and doc.cheque_action == "تسييل الشيك":
-        frappe.throw(_("مبلغ التسييل لا يمكن أن يكون أكبر من مبلغ الشيك"))
-        doc.reload()
+def _post_cheque_journal_entries(journal_entries):
+    """Post each of *journal_entries* on its own.  A cheque whose entry fails
+    goes back to the status it had before the action."""
+    failed = []
+    for journal_entry in journal_entries:
+        frappe.db.savepoint("cheque_journal_entry")
+        try:
+            _submit_journal_entry(journal_entry)
+        except Exception as e:
+            frappe.db.rollback(save_point="cheque_journal_entry")
+            frappe.clear_last_message()
+            revert_cheque_status(journal_entry["reference_link"], journal_entry["pe_status"])
+            failed.append({"payment_entry": journal_entry["reference_link"], "cheque_status": None, "error": str(e)})
+    return failed
 
-    if doc.encashed_amount > doc.paid_amount and doc.cheque_action == "تسييل الشيك":
-        frappe.throw(_("مبلغ التسييل لا يمكن أن يكون أكبر من المبلغ الغير مسيل"))
-        doc.reload()
 
-    if doc.cheque_action == "تسييل الشيك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "حافظة شيكات مرجعة" where name = %s""",
-                      doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(default_cash_account, flt(doc.encashment_amount), True, doc, company_currency),
-            _je_account(default_payback_cheque_wallet_account, flt(doc.encashment_amount), False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "حافظة شيكات مرجعة",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([default_cash_account, default_payback_cheque_wallet_account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set encashment_amount = 0 where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "رد شيك" and doc.cheque_status == "حافظة شيكات واردة":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "مردود" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        doc.reload()
-
-        accounts = [
-            _je_account(doc.paid_from, paid_amount_company, True, doc, company_currency,
-                        party_type=doc.party_type, party=doc.party),
-            _je_account(doc.paid_to, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "مردود 1",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.paid_from, doc.paid_to], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if not doc.bank_acc and doc.cheque_action in ("سحب الشيك", "صرف الشيك"):
-        frappe.throw(_("برجاء تحديد الحساب البنكي"))
-
-    if doc.cheque_action == "صرف الشيك" and doc.payment_type in ("Pay", "Internal Transfer"):
-        frappe.db.sql("""update `tabPayment Entry` set clearance_date = %s where name=%s """, (doc.cheque_action_date, doc.name))
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status_pay = "مدفوع" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.payable_account, paid_amount_company, True, doc, company_currency),
-            _je_account(doc.account, paid_amount_company, False, doc, company_currency),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "مدفوع",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.payable_account, doc.account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-
-    if doc.cheque_action == "سحب الشيك":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status_pay = "مسحوب" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        accounts = [
-            _je_account(doc.payable_account, paid_amount_company, True, doc, company_currency),
-            _je_account(doc.paid_to, paid_amount_company, False, doc, company_currency,
-                        party_type=doc.party_type, party=doc.party),
-        ]
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "مسحوب",
-            "posting_date": doc.cheque_action_date,
-            "multi_currency": 1 if _needs_multi_currency([doc.payable_account, doc.paid_to], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        new_doc.insert()
-        new_doc.submit()
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
-    
-    if doc.cheque_action == "سحب شيك من التحصيل":
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_status = "حافظة شيكات واردة" where name = %s""", doc.name)
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action = "" where name = %s""", doc.name)
-        
-        accounts = [
-            _je_account(doc.paid_to, paid_amount_company, True, doc, company_currency),
-            _je_account(doc.collection_fee_account, paid_amount_company, False, doc, company_currency),
-        ]
-        
-        new_doc = frappe.get_doc({
-            "doctype": "Journal Entry",
-            "voucher_type": "Bank Entry",
-            "reference_doctype": "Payment Entry",
-            "reference_link": doc.name,
-            "cheque_no": doc.reference_no,
-            "cheque_date": doc.reference_date,
-            "pe_status": "سحب من التحصيل",
-            "posting_date": doc.cheque_action_date or today(),
-            "multi_currency": 1 if _needs_multi_currency([doc.paid_to, doc.collection_fee_account], company_currency) else 0,
-            "accounts": accounts,
-            "payment_type": doc.payment_type,
-            "user_remark": doc.party_name
-        })
-        
-        new_doc.insert()
-        new_doc.submit()
-        
-        frappe.db.sql(""" update `tabPayment Entry` set cheque_action_date = NULL where name = %s""", doc.name)
-        doc.reload()
\ No newline at end of file
+def _submit_journal_entry(journal_entry):
+    new_doc = frappe.get_doc(journal_entry)
+    new_doc.insert()
+    new_doc.submit()
+
+
+# Payment Entry fields the list view's bulk dialog may set along with the
+# cheque action.
+BULK_CHEQUE_ACTION_FIELDS = (
+    "cheque_action_date",
+    "cheque_bank",
+    "bank_acc",
+    "new_mode_of_payment",
+    "party_type_",
+    "party_",
+    "account_1",
+)
+
+# Payment Entries updated and committed together by the bulk action job.
+BULK_CHEQUE_ACTION_CHUNK_SIZE = 25
+
+CHEQUE_ACTION_PROGRESS_EVENT = "cheque_action_progress"
+
+
+@frappe.whitelist()
+def apply_cheque_action(names, action, params=None, consolidate=0):
+    """Apply the cheque *action* to every Payment Entry in *names*.
+
+    *params* holds the other :data:`BULK_CHEQUE_ACTION_FIELDS` to set with
+    it.  With *consolidate* each chunk of
+    :data:`BULK_CHEQUE_ACTION_CHUNK_SIZE` cheques posts one Journal Entry per
+    company, status, posting date, account set and currency instead of one
+    per cheque.  The work is enqueued on the ``long`` queue and progress is streamed
+    to the requesting user through the ``cheque_action_progress`` realtime
+    event.  The job runs in one process, so the company settings and account
+    currencies cached by the first Payment Entry serve the rest of the batch.
+
+    Returns ``{"queued": 1, "job": key, "total": n}``; *key* is repeated in
+    every progress message.
+    """
+    names = frappe.parse_json(names) if isinstance(names, str) else names
+    params = frappe.parse_json(params) if isinstance(params, str) else params
+    names = list(dict.fromkeys(name for name in names or [] if name))
+    if not names:
+        frappe.throw(_("برجاء تحديد حركات الدفع أولاً"))
+    if not action:
+        frappe.throw(_("برجاء تحديد الإجراء"))
+    unknown = set(params or {}) - set(BULK_CHEQUE_ACTION_FIELDS)
+    if unknown:
+        frappe.throw(_("Cannot set {0} with a cheque action.").format(", ".join(sorted(unknown))))
+
+    values = dict((fieldname, value) for fieldname, value in (params or {}).items() if value)
+    values["cheque_action"] = action
+    key = frappe.generate_hash(length=10)
+    frappe.enqueue(
+        _apply_cheque_action_job,
+        queue="long",
+        timeout=3600,
+        enqueue_after_commit=True,
+        names=names,
+        values=values,
+        key=key,
+        consolidate=cint(consolidate),
+    )
+    return {"queued": 1, "job": key, "total": len(names)}
+
+
+def _apply_cheque_action_job(names, values, key, consolidate=0, chunk_size=BULK_CHEQUE_ACTION_CHUNK_SIZE):
+    """Background job: apply *values* to each Payment Entry in committed chunks.
+
+    Each Payment Entry is saved inside its own savepoint, so one that fails
+    leaves the others alone and a worker timeout only loses the chunk in
+    flight.  With *consolidate* the Journal Entries of a chunk are collected
+    and posted together before the chunk is committed, so no committed
+    cheque is left without its Journal Entry.
+    """
+    total = len(names)
+    for start in range(0, total, chunk_size):
+        collector = {} if consolidate else None
+        chunk_results = [_apply_cheque_action_to(name, values, collector) for name in names[start:start + chunk_size]]
+        if collector:
+            failed = dict((result["payment_entry"], result) for result in _post_consolidated_journal_entries(collector))
+            chunk_results = [failed.get(result["payment_entry"], result) for result in chunk_results]
+        frappe.db.commit()
+        _publish_cheque_action_progress(key, start + len(chunk_results), total, chunk_results,
+                                        done=start + chunk_size >= total)
+
+
+def _apply_cheque_action_to(name, values, collector=None):
+    """Save *values* on Payment Entry *name*; its ``on_update_after_submit``
+    hook then runs :func:`cheque`, which adds the Journal Entry to
+    *collector* when one is given.  Returns ``{"payment_entry",
+    "cheque_status", "error"}``."""
+    result = {"payment_entry": name, "cheque_status": None, "error": None}
+    frappe.db.savepoint("cheque_action")
+    try:
+        doc = frappe.get_doc("Payment Entry", name)
+        doc.check_permission("write")
+        if doc.docstatus != 1:
+            frappe.throw(_("Payment Entry {0} must be submitted first.").format(name))
+        if not get_cheque_transition(doc.payment_type, doc.cheque_status,
+                                     values["cheque_action"], doc.with_bank_commission):
+            frappe.throw(_("The action {0} cannot be applied to a cheque in status {1}.").format(
+                values["cheque_action"], doc.cheque_status))
+        doc.update(values)
+        doc.flags.cheque_journal_entries = collector
+        doc.save()
+        result["cheque_status"] = doc.cheque_status
+    except Exception as e:
+        frappe.db.rollback(save_point="cheque_action")
+        # The error is reported in the result; don't also pop it up as a msgprint.
+        frappe.clear_last_message()
+        result["error"] = str(e)
+    return result
+
+
+def _publish_cheque_action_progress(key, progress, total, results, done):
+    frappe.publish_realtime(
+        CHEQUE_ACTION_PROGRESS_EVENT,
+        {
+            "job": key,
+            "progress": progress,
+            "total": total,
+            "results": results,
+            "done": done,
+        },
+        user=frappe.session.user,
+    )
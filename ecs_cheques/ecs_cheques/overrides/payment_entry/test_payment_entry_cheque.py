@@ -0,0 +1,358 @@
+# Copyright (c) 2021, erpcloud.systems and Contributors
+# See license.txt
+"""
+Unit tests for the cheque action transitions run by payment_entry.cheque().
+
+frappe is replaced by a MagicMock inside the module under test, so these
+tests do NOT require a live Frappe/ERPNext instance.
+"""
+
+from __future__ import unicode_literals
+import json
+import sys
+import types
+import unittest
+from unittest.mock import MagicMock, call, patch
+
+
+# ---------------------------------------------------------------------------
+# Bootstrap a minimal frappe stub so the module under test can be imported
+# without a running Frappe instance.
+# ---------------------------------------------------------------------------
+
+_frappe_stub = types.ModuleType("frappe")
+_frappe_stub.db = MagicMock()
+_frappe_stub._ = lambda s, *a: s
+_frappe_stub.whitelist = lambda fn=None, **kw: (fn if fn else lambda f: f)
+sys.modules.setdefault("frappe", _frappe_stub)
+sys.modules.setdefault("frappe.model", types.ModuleType("frappe.model"))
+sys.modules.setdefault("frappe.model.document", types.ModuleType("frappe.model.document"))
+sys.modules["frappe.model.document"].Document = object
+sys.modules.setdefault("frappe.desk", types.ModuleType("frappe.desk"))
+sys.modules.setdefault("frappe.desk.search", types.ModuleType("frappe.desk.search"))
+sys.modules["frappe.desk.search"].sanitize_searchfield = lambda s: s
+if "frappe.utils" not in sys.modules:
+    _utils_mod = types.ModuleType("frappe.utils")
+    _utils_mod.flt = lambda val, precision=None: round(float(val or 0), precision) if precision is not None else float(val or 0)
+    for _name in ("getdate", "get_url", "now", "nowtime", "get_time", "today",
+                  "get_datetime", "add_days", "add_to_date", "nowdate"):
+        setattr(_utils_mod, _name, MagicMock())
+    _utils_mod.cint = lambda val: int(float(val or 0))
+    sys.modules["frappe.utils"] = _utils_mod
+
+from ecs_cheques.ecs_cheques.overrides.payment_entry import payment_entry  # noqa: E402
+from ecs_cheques.ecs_cheques.overrides.payment_entry.payment_entry import (  # noqa: E402
+    CHEQUE_COMPANY_ACCOUNTS,
+    CHEQUE_TRANSITIONS,
+    _apply_cheque_action_job,
+    apply_cheque_action,
+    cheque,
+    get_cheque_transition,
+)
+
+
+DEPOSIT = "إيداع شيك تحت التحصيل"
+REJECTED = "مرفوض بالبنك"
+
+
+class _Flags(dict):
+    """frappe._dict, as used for Document.flags."""
+    __getattr__ = dict.get
+    __setattr__ = dict.__setitem__
+
+
+class _PE(object):
+    """A submitted Payment Entry with a cheque action pending."""
+
+    def __init__(self, **kwargs):
+        self.name = "PE-0001"
+        self.company = "Test Co"
+        self.payment_type = "Receive"
+        self.cheque_status = "حافظة شيكات واردة"
+        self.cheque_action = None
+        self.cheque_action_date = "2024-03-01"
+        self.with_bank_commission = 0
+        self.cheque_table_no = None
+        self.paid_amount = 1000
+        self.source_exchange_rate = 1
+        self.target_exchange_rate = 1
+        self.paid_from_account_currency = "EGP"
+        self.paid_to_account_currency = "EGP"
+        self.paid_from = "Debtors"
+        self.paid_to = "Cheque Wallet"
+        self.party_type = "Customer"
+        self.party = "CUST-001"
+        self.party_name = "Acme"
+        self.reference_no = "CHQ-1"
+        self.reference_date = "2024-02-01"
+        self.cheque_bank = "Arab Bank"
+        self.bank_acc = "Arab Bank - Current"
+        self.account = "Bank Current"
+        self.collection_fee_account = "Under Collection"
+        self.payable_account = "Cheques Payable"
+        self.co3_ = 15
+        self.co5_ = 0
+        self.encashment_amount = 0
+        self.encashed_amount = 0
+        self.reloads = 0
+        self.flags = _Flags()
+        self.__dict__.update(kwargs)
+
+    def get(self, fieldname):
+        return getattr(self, fieldname, None)
+
+    def reload(self):
+        self.reloads += 1
+
+    def update(self, values):
+        self.__dict__.update(values)
+
+
+class TestGetChequeTransition(unittest.TestCase):
+
+    def test_specific_status_wins_over_wildcard(self):
+        self.assertEqual(get_cheque_transition("Receive", REJECTED, DEPOSIT, 0)["pe_status"], "تحت التحصيل 2")
+        self.assertEqual(get_cheque_transition("Receive", "حافظة شيكات واردة", DEPOSIT, 0)["pe_status"], "تحت التحصيل")
+
+    def test_bank_commission_selects_transition(self):
+        with_commission = get_cheque_transition("Receive", None, DEPOSIT, 1)
+        without = get_cheque_transition("Receive", None, DEPOSIT, 0)
+        self.assertEqual(len(with_commission["lines"]), 4)
+        self.assertEqual(len(without["lines"]), 2)
+
+    def test_no_transition(self):
+        self.assertIsNone(get_cheque_transition("Receive", REJECTED, "رد شيك", 1))
+        self.assertIsNone(get_cheque_transition("Receive", None, "صرف الشيك", 0))
+        self.assertIsNone(get_cheque_transition("Receive", None, "", 0))
+        self.assertIsNotNone(get_cheque_transition("Internal Transfer", None, "صرف الشيك", 0))
+
+    def test_transitions_are_balanced_and_named(self):
+        for key, transition in CHEQUE_TRANSITIONS.items():
+            self.assertEqual(len(key), 4, key)
+            self.assertTrue(transition["pe_status"], key)
+            sides = {is_debit for _account, is_debit, _amount, _party in transition["lines"]}
+            self.assertEqual(sides, {True, False}, key)
+
+
+class TestChequeAction(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = MagicMock()
+        self.fake._ = lambda s, *a: s
+        self.fake.throw.side_effect = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+        company = dict((fieldname, fieldname.upper()) for fieldname in CHEQUE_COMPANY_ACCOUNTS)
+        company["default_currency"] = "EGP"
+        self.fake.db.get_value.return_value = None
+        self.journal_entries = []
+        self.fake.get_doc.side_effect = lambda values: self.journal_entries.append(values) or MagicMock()
+        for attr, value in (
+            ("frappe", self.fake),
+            ("get_company_cheque_settings", lambda name: dict(company)),
+            ("get_account_currency", lambda account: "EGP"),
+        ):
+            patcher = patch.object(payment_entry, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_deposit_with_commission(self):
+        doc = _PE(cheque_action=DEPOSIT, with_bank_commission=1)
+        cheque(doc)
+
+        je, = self.journal_entries
+        self.assertEqual(je["pe_status"], "تحت التحصيل")
+        self.assertEqual(je["posting_date"], "2024-03-01")
+        self.assertEqual(
+            [(row["account"], row["debit"], row["credit"]) for row in je["accounts"]],
+            [("Under Collection", 1000.0, 0), ("DEFAULT_BANK_COMMISSIONS_ACCOUNT", 15.0, 0),
+             ("Cheque Wallet", 0, 1000.0), ("Bank Current", 0, 15.0)],
+        )
+
+    def test_single_write_without_reload(self):
+        doc = _PE(cheque_action="صرف شيك تحت التحصيل", cheque_status="تحت التحصيل")
+        cheque(doc)
+
+        write, = self.fake.db.set_value.call_args_list
+        changes = {
+            "cheque_action": "",
+            "cheque_action_date": None,
+            "cheque_status": "محصل",
+            "clearance_date": "2024-03-01",
+        }
+        self.assertEqual(write.args, ("Payment Entry", "PE-0001", changes))
+        self.assertFalse(write.kwargs["update_modified"])
+        self.assertEqual(doc.reloads, 0)
+        for fieldname, value in changes.items():
+            self.assertEqual(getattr(doc, fieldname), value)
+        self.assertEqual(self.journal_entries[0]["posting_date"], "2024-03-01")
+
+    def test_cheque_table_rate_not_kept_on_doc(self):
+        doc = _PE(cheque_action="تظهير شيك", cheque_table_no="CTR-1", target_exchange_rate=2,
+                  account_1="Endorsee", party_type_="Supplier", party_="SUPP-1")
+        with patch.object(payment_entry, "_get_cheque_paid_amount",
+                          side_effect=lambda doc, currency: setattr(doc, "target_exchange_rate", 3) or 1000):
+            cheque(doc)
+        self.assertEqual(doc.target_exchange_rate, 2)
+        self.assertEqual(doc.cheque_status, "مظهر")
+
+    def test_return_uses_party(self):
+        doc = _PE(cheque_action="رد شيك")
+        cheque(doc)
+        debit = self.journal_entries[0]["accounts"][0]
+        self.assertEqual((debit["account"], debit["party_type"], debit["party"]), ("Debtors", "Customer", "CUST-001"))
+        self.assertEqual(self.journal_entries[0]["pe_status"], "مردود 1")
+
+    def test_encashment_resets_amount(self):
+        doc = _PE(cheque_status="حافظة شيكات مرجعة", cheque_action="تسييل الشيك", encashment_amount=400)
+        cheque(doc)
+        self.assertEqual(self.journal_entries[0]["accounts"][0]["debit"], 400.0)
+        self.assertEqual(self.fake.db.set_value.call_args.args[2]["encashment_amount"], 0)
+        self.assertEqual(doc.encashment_amount, 0)
+
+    def test_transfer_between_same_accounts_posts_nothing(self):
+        doc = _PE(cheque_action="تحويل إلى حافظة شيكات أخرى", new_mode_of_payment="Cheque 2",
+                  mode_of_payment="Cheque", logs="")
+        cheque(doc)
+        self.assertEqual(self.journal_entries, [])
+        self.assertIn("logs", self.fake.db.set_value.call_args_list[0].args[2])
+
+    def test_only_withdrawal_posts_today_without_a_date(self):
+        with patch.object(payment_entry, "today", lambda: "2024-04-01"):
+            cheque(_PE(cheque_action=DEPOSIT, cheque_action_date=None))
+            cheque(_PE(cheque_action="سحب شيك من التحصيل", cheque_status="تحت التحصيل", cheque_action_date=None))
+        self.assertEqual([je["posting_date"] for je in self.journal_entries], [None, "2024-04-01"])
+
+    def test_no_action_touches_nothing(self):
+        doc = _PE()
+        cheque(doc)
+        self.fake.db.get_value.assert_not_called()
+        self.fake.db.set_value.assert_not_called()
+        self.assertEqual(doc.reloads, 0)
+
+    def test_missing_required_field(self):
+        doc = _PE(cheque_action=DEPOSIT, with_bank_commission=1, account=None)
+        with self.assertRaises(Exception):
+            cheque(doc)
+        self.assertEqual(self.journal_entries, [])
+
+
+class TestApplyChequeAction(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = MagicMock()
+        self.fake._ = lambda s, *a: s
+        self.fake.parse_json = json.loads
+        self.fake.generate_hash.return_value = "JOB1"
+        self.fake.throw.side_effect = lambda msg, exc=None: (_ for _ in ()).throw(Exception(msg))
+        self.docs = {
+            "PE-1": _PE(name="PE-1", save=MagicMock(), check_permission=MagicMock()),
+            "PE-2": _PE(name="PE-2", cheque_status=REJECTED, with_bank_commission=1, save=MagicMock(), check_permission=MagicMock()),
+            "PE-3": _PE(name="PE-3", docstatus=0, save=MagicMock(), check_permission=MagicMock()),
+        }
+        for doc in self.docs.values():
+            doc.docstatus = getattr(doc, "docstatus", 1)
+        self.fake.get_doc.side_effect = lambda doctype, name: self.docs[name]
+        patcher = patch.object(payment_entry, "frappe", self.fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueued_with_allowed_fields(self):
+        result = apply_cheque_action(
+            '["PE-1", "PE-2", "PE-1"]', DEPOSIT, '{"cheque_bank": "Arab Bank", "bank_acc": ""}')
+        self.assertEqual(result, {"queued": 1, "job": "JOB1", "total": 2})
+        kwargs = self.fake.enqueue.call_args.kwargs
+        self.assertEqual(kwargs["queue"], "long")
+        self.assertEqual(kwargs["names"], ["PE-1", "PE-2"])
+        self.assertEqual(kwargs["values"], {"cheque_bank": "Arab Bank", "cheque_action": DEPOSIT})
+
+    def test_unknown_field_rejected(self):
+        with self.assertRaises(Exception):
+            apply_cheque_action(["PE-1"], DEPOSIT, {"paid_amount": 1})
+        with self.assertRaises(Exception):
+            apply_cheque_action([], DEPOSIT)
+        self.fake.enqueue.assert_not_called()
+
+    def test_job_reports_each_document(self):
+        self.docs["PE-1"].save.side_effect = lambda: setattr(self.docs["PE-1"], "cheque_status", "تحت التحصيل")
+        _apply_cheque_action_job(["PE-1", "PE-2", "PE-3"], {"cheque_action": "رد شيك"}, "JOB1", chunk_size=2)
+
+        self.assertEqual(self.docs["PE-1"].cheque_action, "رد شيك")
+        self.docs["PE-1"].save.assert_called_once_with()
+        self.docs["PE-2"].save.assert_not_called()
+        self.docs["PE-3"].save.assert_not_called()
+        self.assertEqual(self.fake.db.rollback.call_count, 2)
+        self.assertEqual(self.fake.db.commit.call_count, 2)
+
+        messages = [c.args[1] for c in self.fake.publish_realtime.call_args_list]
+        self.assertEqual([(m["progress"], m["done"]) for m in messages], [(2, False), (3, True)])
+        results = messages[0]["results"] + messages[1]["results"]
+        self.assertEqual(results[0], {"payment_entry": "PE-1", "cheque_status": "تحت التحصيل", "error": None})
+        self.assertTrue(results[1]["error"])
+        self.assertTrue(results[2]["error"])
+
+    def _consolidate(self, names, post=None, **fields):
+        self.docs = dict(
+            (name, _PE(name=name, save=MagicMock(), check_permission=MagicMock(), docstatus=1,
+                       **fields.get(name.replace("-", "_"), {})))
+            for name in names
+        )
+        for doc in self.docs.values():
+            doc.save.side_effect = lambda doc=doc: self._run_hook(doc)
+        self.journal_entries = []
+
+        def _get_doc(*args):
+            if len(args) == 2:
+                return self.docs[args[1]]
+            if post:
+                post(args[0])
+            self.journal_entries.append(args[0])
+            return MagicMock()
+
+        self.fake.get_doc.side_effect = _get_doc
+        self.reverted = []
+        with patch.object(payment_entry, "revert_cheque_status", lambda *args: self.reverted.append(args)):
+            _apply_cheque_action_job(names, {"cheque_action": DEPOSIT}, "JOB1", consolidate=1, chunk_size=2)
+        return [c.args[1] for c in self.fake.publish_realtime.call_args_list]
+
+    def test_consolidation_posted_per_chunk(self):
+        commits = self.fake.db.commit
+        self.fake.db.commit.side_effect = lambda: commits.posted.append(len(self.journal_entries))
+        commits.posted = []
+        messages = self._consolidate(["PE-1", "PE-2", "PE-3", "PE-4", "PE-5"], PE_4={"cheque_action_date": "2024-03-02"})
+
+        self.assertEqual([(m["progress"], m["done"]) for m in messages], [(2, False), (4, False), (5, True)])
+        # Each chunk's Journal Entries are posted before the chunk is committed.
+        self.assertEqual(commits.posted, [1, 3, 4])
+        self.assertEqual([je["reference_link"] for je in self.journal_entries], [None, "PE-3", "PE-4", "PE-5"])
+        consolidated = self.journal_entries[0]
+        self.assertEqual([row["cheque_payment_entry"] for row in consolidated["accounts"]],
+                         ["PE-1", "PE-1", "PE-2", "PE-2"])
+        self.assertEqual((consolidated["voucher_type"], consolidated["cheque_no"], consolidated["cheque_date"]),
+                         ("Journal Entry", None, None))
+        self.assertEqual(self.journal_entries[1]["voucher_type"], "Bank Entry")
+        self.assertEqual(consolidated["user_remark"], "Consolidated entry for 2 cheques")
+        self.assertEqual(self.journal_entries[2]["posting_date"], "2024-03-02")
+        self.assertFalse([result for m in messages for result in m["results"] if result["error"]])
+
+    def test_failed_group_falls_back_per_cheque(self):
+        def _post(journal_entry):
+            if journal_entry["reference_link"] in (None, "PE-2"):
+                raise Exception("cannot post")
+
+        messages = self._consolidate(["PE-1", "PE-2"], post=_post)
+
+        self.assertEqual([je["reference_link"] for je in self.journal_entries], ["PE-1"])
+        self.assertEqual(self.fake.db.rollback.call_args_list[-2:],
+                         [call(save_point="cheque_journal_entry")] * 2)
+        self.assertEqual(self.reverted, [("PE-2", "تحت التحصيل")])
+        self.assertEqual(messages, [{
+            "job": "JOB1", "progress": 2, "total": 2, "done": True,
+            "results": [
+                {"payment_entry": "PE-1", "cheque_status": "تحت التحصيل", "error": None},
+                {"payment_entry": "PE-2", "cheque_status": None, "error": "cannot post"},
+            ],
+        }])
+
+    def _run_hook(self, doc):
+        with patch.object(payment_entry, "get_company_cheque_settings", lambda name: {"default_currency": "EGP"}), \
+                patch.object(payment_entry, "get_account_currency", lambda account: "EGP"):
+            cheque(doc)
@@ -63,6 +63,7 @@ def _flt(val, precision=None):
 
 
 _utils_mod.flt = _flt
+_utils_mod.cint = lambda val: int(_flt(val))
 sys.modules["frappe.utils"] = _utils_mod
 
 # Stub out erpnext imports pulled in by payment_entry_class
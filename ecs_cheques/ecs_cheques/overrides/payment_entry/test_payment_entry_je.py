@@ -40,9 +40,23 @@ def _make_frappe_stub():
         raise (exc or _ValidationError)(msg)
 
     frappe_mod.throw = _throw
+    frappe_mod.cache = lambda: _NullCache()
     return frappe_mod
 
 
+class _NullCache(object):
+    """frappe.cache() that keeps nothing, so every test reads its own stubs."""
+
+    def hget(self, name, key, generator=None):
+        return generator() if generator else None
+
+    def hset(self, name, key, value):
+        pass
+
+    def hdel(self, name, key):
+        pass
+
+
 _frappe_stub = _make_frappe_stub()
 sys.modules.setdefault("frappe", _frappe_stub)
 sys.modules.setdefault("frappe.model", types.ModuleType("frappe.model"))
@@ -65,6 +79,7 @@ def _flt(val, precision=None):
 
 _utils_mod = types.ModuleType("frappe.utils")
 _utils_mod.flt = _flt
+_utils_mod.cint = lambda val: int(_flt(val))
 flt = _flt
 _utils_mod.getdate = MagicMock()
 _utils_mod.get_url = MagicMock()
@@ -16,7 +16,20 @@ doc_events = {
 	"on_update_after_submit": "ecs_cheques.ecs_cheques.overrides.payment_entry.payment_entry.cheque"
 },
 "Journal Entry": {
+	"before_cancel": "ecs_cheques.ecs_cheques.overrides.journal_entry.journal_entry.cancel_cheque_reversals",
 	"on_cancel": "ecs_cheques.ecs_cheques.overrides.journal_entry.journal_entry.update_payment_entry_on_cancel"
+},
+"Currency Exchange": {
+	"on_update": "ecs_cheques.ecs_cheques.overrides.currency_exchange.currency_exchange.clear_exchange_rate_cache",
+	"on_trash": "ecs_cheques.ecs_cheques.overrides.currency_exchange.currency_exchange.clear_exchange_rate_cache"
+},
+"Company": {
+	"on_update": "ecs_cheques.ecs_cheques.overrides.company.company.clear_company_cheque_settings",
+	"on_trash": "ecs_cheques.ecs_cheques.overrides.company.company.clear_company_cheque_settings"
+},
+"Account": {
+	"on_update": "ecs_cheques.ecs_cheques.overrides.account.account.clear_account_currency_cache",
+	"on_trash": "ecs_cheques.ecs_cheques.overrides.account.account.clear_account_currency_cache"
 }
 }
 doctype_js = {
@@ -68,7 +81,8 @@ app_include_js = ["/assets/ecs_cheques/js/gl_report_fix.js"]
 # ------------
 
 # before_install = "ecs_cheques.install.before_install"
-# after_install = "ecs_cheques.install.after_install"
+after_install = "ecs_cheques.install.after_install"
+after_migrate = "ecs_cheques.install.after_migrate"
 
 # Desk Notifications
 # ------------------
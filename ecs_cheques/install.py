@@ -0,0 +1,27 @@
+# Copyright (c) 2021, erpcloud.systems and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+# (doctype, columns, index name) for the duplicate-cheque lookup in
+# multiple_cheque_entry._find_duplicate_cheques.
+CHEQUE_INDEXES = [
+	("Payment Entry", ["reference_no", "party"], "cheque_reference_party_index"),
+	("Cheque Table Receive", ["reference_no", "party"], "cheque_reference_party_index"),
+	("Cheque Table Pay", ["reference_no", "party"], "cheque_reference_party_index"),
+]
+
+
+def after_install():
+	add_cheque_indexes()
+
+
+def after_migrate():
+	add_cheque_indexes()
+
+
+def add_cheque_indexes():
+	"""Create the composite cheque indexes; existing ones are left alone."""
+	for doctype, columns, index_name in CHEQUE_INDEXES:
+		frappe.db.add_index(doctype, columns, index_name)